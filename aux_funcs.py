@@ -1,3 +1,8 @@
+# length of kline timeframes in milliseconds
+TIMEFRAME_MS = {'1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+                '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '1d': 86_400_000, '1w': 604_800_000}
+
+
 def r_signif(number: float, precision: int) -> float:
     """Function rounds the given float number with 0 in integer part to float number with N significant figures required.
     If given the number with integer part > 0, returns the number rounded to N - 1 figures after comma.
@@ -0,0 +1,360 @@
+import contextlib
+import copy
+import os
+import time
+from collections import namedtuple
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+import requests
+
+import bot_funcs as bf
+import levels as lv
+from aux_funcs import TIMEFRAME_MS
+from cooldown import Cooldown
+from db_funcs import DB_handler, from_epoch_ms, to_epoch_ms
+from deal_book import ActiveDealBook
+from intrabar import IntrabarResolver
+
+KLINE_COLUMNS = ["O_time", "Open", "High", "Low", "Close", "Volume"]
+
+Candle = namedtuple('Candle', KLINE_COLUMNS)
+
+
+class KlineStore():
+    """Historical klines on disk, one float64 .npy array (rows O_time, Open, High, Low, Close, Volume) per pair and timeframe"""
+
+    def __init__(self, directory: str = 'klines', mmap: bool = False):
+        self.directory = directory
+        self.mmap = mmap        # read-only memory mapped arrays, pages are shared by processes reading the same files
+        self.session = requests.Session()
+
+    def path(self, pair: str, timeframe: str) -> str:
+        return os.path.join(self.directory, f'{pair}_{timeframe}.npy')
+
+    def load(self, pair: str, timeframe: str) -> np.ndarray:
+        path = self.path(pair, timeframe)
+        if not os.path.exists(path):
+            return np.empty((0, len(KLINE_COLUMNS)))
+        return np.load(path, mmap_mode='r' if self.mmap else None)
+
+    def save(self, pair: str, timeframe: str, klines: np.ndarray):
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(self.path(pair, timeframe), klines)
+
+    def download(self, pair: str, timeframe: str, start_ms: int, end_ms: int, pause: float = 0.25) -> np.ndarray:
+        """Fetches closed futures klines of [start_ms, end_ms) missing in the store and merges them in"""
+        stored = np.array(self.load(pair, timeframe))
+        step = TIMEFRAME_MS[timeframe]
+        chunks = [stored]
+
+        # only the parts before and after what is already stored
+        ranges = [(start_ms, end_ms)]
+        if stored.shape[0]:
+            ranges = [(start_ms, int(stored[0, 0])), (int(stored[-1, 0]) + step, end_ms)]
+
+        for range_start, range_end in ranges:
+            cursor = range_start
+            while cursor < range_end:
+                response = self.session.get('https://fapi.binance.com/fapi/v1/klines', params={
+                    'symbol': pair, 'interval': timeframe, 'startTime': cursor, 'endTime': range_end - 1, 'limit': 1500})
+                data = response.json()
+                if isinstance(data, dict) and 'code' in data:
+                    print(f'{bf.timestamp()} - Binance error fetching klines ({pair},{timeframe}): {data}')
+                    break
+                if not data:
+                    break
+                chunk = np.array([candle[0:6] for candle in data], dtype=float)
+                # the last candle may still be open
+                chunk = chunk[chunk[:, 0] + step <= time.time() * 1000]
+                if chunk.shape[0]:
+                    chunks.append(chunk)
+                cursor = int(data[-1][0]) + step
+                time.sleep(pause)
+
+        klines = np.concatenate(chunks)
+        klines = klines[np.unique(klines[:, 0], return_index=True)[1]]      # sorted by O_time, no duplicates
+        self.save(pair, timeframe, klines)
+        return klines
+
+
+class _SilentBot():
+    """Stands in for telebot in backtest: messages are dropped"""
+
+    def send_message(self, *args, **kwargs):
+        pass
+
+
+class _PairData():
+    """Klines of one pair and levels cut from them; shared by all backtests run together"""
+
+    def __init__(self, store: KlineStore, pair: str, timeframes: list, trading_timeframe: str):
+        self.pair = pair
+        self.klines = {}
+        self.close_ms = {}
+        self.candidates = {}
+        for timeframe in timeframes:
+            klines = store.load(pair, timeframe)
+            self.klines[timeframe] = klines
+            self.close_ms[timeframe] = klines[:, 0] + TIMEFRAME_MS[timeframe]
+            if timeframe != '1m' or trading_timeframe == '1m':
+                self.candidates[timeframe] = lv.find_level_candidates(klines)
+        self.minute_open_ms = self.klines['1m'][:, 0]
+        self.levels_cache = {}      # timeframe -> ((start, end), levels) of the last window
+
+    def levels(self, timeframe: str, start: int, end: int) -> list:
+        """Levels of the window with broken flags and no density; level detection doesn't depend on config,
+        so it is done once per window and every caller gets its own copies (the pipeline changes levels in place)"""
+        cached = self.levels_cache.get(timeframe)
+        if cached is None or cached[0] != (start, end):
+            prelast_candle_close = float(self.klines[timeframe][end - 3, 4])
+            cached = ((start, end), lv.levels_from_candidates(self.candidates[timeframe], start, end, timeframe, prelast_candle_close))
+            self.levels_cache[timeframe] = cached
+        return [level.__class__(level.time, level.low, level.high, level.timeframe, level.broken) for level in cached[1]]
+
+
+def load_pair_data(store: KlineStore, pairs: list, checked_timeframes: list, trading_timeframe: str) -> list:
+    timeframes = sorted(set(checked_timeframes) | {'1m'}, key=TIMEFRAME_MS.get)
+    data = [_PairData(store, pair, timeframes, trading_timeframe) for pair in pairs]
+    return [pair_data for pair_data in data if pair_data.klines[trading_timeframe].shape[0] and pair_data.klines['1m'].shape[0]]
+
+
+def run_backtests(backtesters: list, data: list, start_ms: int, end_ms: int) -> list[dict]:
+    """Runs backtests of the same trading timeframe in lockstep over the same klines,
+    so levels of each window are detected once for all of them"""
+    trading_timeframe = backtesters[0].trading_timeframe
+    if any(backtester.trading_timeframe != trading_timeframe for backtester in backtesters):
+        raise ValueError('Backtests run together must have the same trading timeframe')
+
+    step_ms = TIMEFRAME_MS[trading_timeframe]
+    next_check_ms = -(-start_ms // step_ms) * step_ms
+    now_ms = -(-start_ms // 60_000) * 60_000
+    started = time.time()
+
+    output = open(os.devnull, 'w') if all(backtester.quiet for backtester in backtesters) else None
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        while now_ms < end_ms:
+            for backtester in backtesters:
+                backtester.now_ms = now_ms
+
+            if now_ms == next_check_ms:
+                for pair_data in data:
+                    for backtester in backtesters:
+                        backtester._check_pair(pair_data)
+                next_check_ms += step_ms
+                for backtester in backtesters:
+                    backtester.stats['steps'] += 1
+
+            for backtester in backtesters:
+                backtester._check_active_deals(data)
+
+            # nothing to follow between candle checks without active deals
+            if any(backtester.book.total_active_deals_quantity() for backtester in backtesters):
+                now_ms += 60_000
+            else:
+                now_ms = next_check_ms
+    if output:
+        output.close()
+
+    seconds = round(time.time() - started, 1)
+    for backtester in backtesters:
+        backtester.db.flush()
+        backtester.stats['seconds'] = seconds
+    return [backtester.stats for backtester in backtesters]
+
+
+class Backtester():
+    """Replays stored klines through the live deal pipeline of check_pair and check_active_deals.
+
+    At every close of the trading timeframe each pair gets the windows check_pair would have fetched:
+    the last basic_candle_depth closed candles of each checked timeframe (higher timeframes only up to the
+    current moment, so no look-ahead), then find_levels -> assign_level_density -> optimize_levels ->
+    merge_timeframe_levels -> check_deal -> validate_deal as in the bot. Active deals are checked on 1m candles
+    with bf.update_active_deals right after the pairs, as the bot schedule does (:01 pairs, :02 active deals).
+    Deals go into a deals DB of the usual schema, so perf_stats / sql scripts work on the result.
+
+    Windows are incremental: level patterns are found once per series (lv.find_level_candidates) and each window
+    is cut from them, levels of a window are reused until it moves (higher timeframes - until their next close)
+    and by all backtests of run_backtests, and the full level pipeline only runs when the last candle crosses
+    a level of the trading timeframe (check_deal can't return a deal otherwise).
+
+    Differences from the bot: candles are numeric and closed (the bot compares raw kline strings and may see
+    the forming candle), deal times are the simulated ones.
+    """
+
+    def __init__(self, config: dict, db_file_name: str, store: KlineStore = None, pairs: list = None, quiet: bool = True,
+                 resolver: object = None):
+        self.config = copy.deepcopy(config)
+        self.deal_config = self.config['deal_config']
+        self.deal_config['enable_trade_calc_logging'] = False
+        self.trading_timeframe = self.config['general']['trading_timeframe']
+        self.checked_timeframes = bf.define_checked_timeframes(self.config['general']['timeframes_used'][:], self.trading_timeframe)
+        self.candle_depth = self.config['general']['basic_candle_depth']
+        self.reverse = self.deal_config['cool_down_reverse']
+        self.pairs = pairs or self.config['general']['trading_pairs']
+        self.store = store or KlineStore()
+        self.quiet = quiet
+        self.resolver = resolver    # intrabar.IntrabarResolver for 1m candles crossing both take and stop
+
+        self.now_ms = 0
+        self.bot = _SilentBot()
+        self.db = DB_handler(db_file_name)
+        self.db.setup()
+        self.db.start_writer()
+        self.book = ActiveDealBook(self.db)
+        self.cd = Cooldown(self.deal_config, self.db, self.bot, None, reverse=self.reverse, now=self.now)
+
+        self.stats = {'steps': 0, 'full_checks': 0, 'deals': 0}
+
+    def now(self) -> dt:
+        return from_epoch_ms(self.now_ms)
+
+    def run(self, start_ms: int, end_ms: int) -> dict:
+        data = load_pair_data(self.store, self.pairs, self.checked_timeframes, self.trading_timeframe)
+        return run_backtests([self], data, start_ms, end_ms)[0]
+
+    def _window(self, pair_data: _PairData, timeframe: str) -> tuple[int, int]:
+        end = int(np.searchsorted(pair_data.close_ms[timeframe], self.now_ms, side='right'))
+        return max(0, end - self.candle_depth[timeframe]), end
+
+    def _crosses_level(self, pair_data: _PairData, start: int, end: int, last_candle: np.ndarray) -> bool:
+        candidates = pair_data.candidates[self.trading_timeframe]
+        first, last = np.searchsorted(candidates['start'], [start, end - 4])
+        kind = candidates['kind'][first:last]
+        candle_open, candle_close = last_candle[1], last_candle[4]
+        broken_down = (kind == 0) & (candidates['low'][first:last] < candle_open) & (candidates['low'][first:last] > candle_close)
+        broken_up = (kind == 1) & (candidates['high'][first:last] > candle_open) & (candidates['high'][first:last] < candle_close)
+        return bool(broken_down.any() or broken_up.any())
+
+    def _crosses_unbroken_level(self, levels: list, last_candle: np.ndarray) -> bool:
+        candle_open, candle_close = last_candle[1], last_candle[4]
+        for level in levels:
+            if level.broken:
+                continue
+            if level.__class__ is lv.Support and candle_open > level.low > candle_close:
+                return True
+            if level.__class__ is lv.Resistance and candle_open < level.high < candle_close:
+                return True
+        return False
+
+    def _check_pair(self, pair_data: _PairData):
+        start, end = self._window(pair_data, self.trading_timeframe)
+        basic_klines = pair_data.klines[self.trading_timeframe]
+        if end - start < self.candle_depth[self.trading_timeframe] or basic_klines[end - 1, 0] + TIMEFRAME_MS[self.trading_timeframe] != self.now_ms:
+            return      # not enough history or no candle closed at this moment
+        if not self._crosses_level(pair_data, start, end, basic_klines[end - 1]):
+            return
+
+        # optimize_levels drops broken levels of the trading timeframe and a merged level takes its low/high
+        # from one of the merged ones, so only a crossed unbroken level can give a deal
+        basic_levels = pair_data.levels(self.trading_timeframe, start, end)
+        if not self._crosses_unbroken_level(basic_levels, basic_klines[end - 1]):
+            return
+
+        self.stats['full_checks'] += 1
+        levels = []
+        for timeframe in self.checked_timeframes:
+            if timeframe == self.trading_timeframe:
+                levels += basic_levels
+                continue
+            tf_start, tf_end = self._window(pair_data, timeframe)
+            if tf_end - tf_start < 5:
+                continue
+            levels += pair_data.levels(timeframe, tf_start, tf_end)
+
+        levels = lv.assign_level_density(levels, self.checked_timeframes, self.config['levels'])
+        levels = lv.optimize_levels(levels, self.checked_timeframes)
+        levels = lv.merge_timeframe_levels(levels)
+
+        last_candle = Candle(*basic_klines[end - 1])
+        deal = lv.check_deal(self.bot, None, levels, last_candle, self.deal_config, self.trading_timeframe)
+        if deal is None:
+            return
+
+        basic_tf_ohlvc_df = pd.DataFrame(basic_klines[start:end], columns=KLINE_COLUMNS)
+        # same order as check_pair: validation before deal.pair is set
+        if bf.validate_deal(self.book, deal, self.deal_config, basic_tf_ohlvc_df, validate_on=True):
+            if not self.cd.status_on():
+                deal.pair = pair_data.pair
+                deal.timestamp = dt.strftime(self.now(), '%Y-%m-%d %H:%M:%S')
+                self.book.add_deal(deal, created_ms=self.now_ms)
+                self.stats['deals'] += 1
+
+    def _check_active_deals(self, data: list):
+        active_pairs = set(self.book.get_active_deals_list())
+        if not active_pairs:
+            return
+
+        changes = {}
+        finish_time = dt.strftime(self.now(), '%Y-%m-%d %H:%M:%S')
+        minute_open_ms = self.now_ms - 60_000
+        for pair_data in data:
+            if pair_data.pair not in active_pairs:
+                continue
+            index = int(np.searchsorted(pair_data.minute_open_ms, minute_open_ms))
+            if index >= pair_data.minute_open_ms.shape[0] or pair_data.minute_open_ms[index] != minute_open_ms:
+                continue    # gap in 1m data
+            last_candle = Candle(*pair_data.klines['1m'][index])
+            bf.update_active_deals(self.book, self.cd, self.bot, None, self.book.read_active_deals(pair_data.pair), last_candle,
+                                   reverse=self.reverse, changes=changes, finish_time=finish_time, resolver=self.resolver)
+        bf.flush_deal_changes(self.book, changes)
+
+    def close(self):
+        self.db.stop_writer()
+
+
+def download_history(config: dict, pairs: list, start_ms: int, end_ms: int, store: KlineStore = None):
+    """Klines of all timeframes the backtest of [start_ms, end_ms) needs, with the depth of each window before start"""
+    store = store or KlineStore()
+    trading_timeframe = config['general']['trading_timeframe']
+    timeframes = bf.define_checked_timeframes(config['general']['timeframes_used'][:], trading_timeframe)
+    depth = config['general']['basic_candle_depth']
+
+    for pair in pairs:
+        for timeframe in sorted(set(timeframes) | {'1m'}, key=TIMEFRAME_MS.get):
+            history_ms = depth.get(timeframe, 0) * TIMEFRAME_MS[timeframe] if timeframe in timeframes else 0
+            klines = store.download(pair, timeframe, start_ms - history_ms, end_ms)
+            print(f'{pair} {timeframe}: {klines.shape[0]} candles')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backtest of the levels strategy on stored klines')
+    parser.add_argument('command', choices=['download', 'run'])
+    parser.add_argument('--config', default='config_5m_rm.json')
+    parser.add_argument('--start', required=True, help='YYYY-MM-DD, local time')
+    parser.add_argument('--end', required=True, help='YYYY-MM-DD, local time')
+    parser.add_argument('--pairs', nargs='*', help='default: trading_pairs of the config')
+    parser.add_argument('--klines', default='klines', help='klines store directory')
+    parser.add_argument('--db', help='result deals DB, default: backtest_<db_file_name>')
+    parser.add_argument('--verbose', action='store_true', help='keep the bot console output')
+    parser.add_argument('--intrabar', action='store_true', help='resolve 1m candles crossing both take and stop by aggTrades')
+    args = parser.parse_args()
+
+    config = bf.load_config(args.config)
+    pairs = args.pairs or config['general']['trading_pairs']
+    start_ms = to_epoch_ms(dt.strptime(args.start, '%Y-%m-%d'))
+    end_ms = to_epoch_ms(dt.strptime(args.end, '%Y-%m-%d'))
+    store = KlineStore(args.klines)
+
+    if args.command == 'download':
+        download_history(config, pairs, start_ms, end_ms, store)
+        return
+
+    db_file_name = args.db or f"backtest_{config['general']['db_file_name']}"
+    if os.path.exists(db_file_name):
+        print(f'{db_file_name} already exists, remove it or choose another --db')
+        return
+
+    resolver = IntrabarResolver(store) if args.intrabar else None
+    backtester = Backtester(config, db_file_name, store, pairs, quiet=not args.verbose, resolver=resolver)
+    print(backtester.run(start_ms, end_ms))
+    print(backtester.db.show_perfomance_stats(config['deal_config']['deal_risk_perc_of_bank'] / 100,
+                                              initial_bank=config['general']['initial_bank_for_test_stats']))
+    backtester.close()
+
+
+if __name__ == '__main__':
+    main()
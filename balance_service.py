@@ -0,0 +1,104 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class BalanceService:
+	"""
+	Cached USDT balance (wallet and available) of the futures account for risk sizing.
+	- both balances come from one account request, reads within max_age_sec are local
+	- start() refreshes in a background thread every refresh_interval_sec
+	- request_refresh() (after a placement or fill) drops the cached value and wakes the background thread
+	- handle_user_event() applies user-data stream events (ACCOUNT_UPDATE / ORDER_TRADE_UPDATE)
+	"""
+
+	def __init__(self, fetch: Callable[[], Dict[str, float]], *, max_age_sec: float = 60.0, refresh_interval_sec: float = 60.0) -> None:
+		self.fetch = fetch
+		self.max_age_sec = max_age_sec
+		self.refresh_interval_sec = refresh_interval_sec
+		self._balances: Dict[str, float] = {}
+		self._updated_at: Dict[str, float] = {}
+		self._lock = threading.Lock()
+		self._wakeup = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._stopped = threading.Event()
+
+	def store(self, balances: Dict[str, float]) -> None:
+		now = time.monotonic()
+		with self._lock:
+			for balance_type, value in balances.items():
+				self._balances[balance_type] = value
+				self._updated_at[balance_type] = now
+
+	def refresh(self) -> Dict[str, float]:
+		"""Reads both balances from the exchange now"""
+		balances = self.fetch()
+		self.store(balances)
+		return balances
+
+	def age(self, balance_type: str = "wallet") -> float:
+		"""Seconds since the balance was read, inf if never"""
+		updated_at = self._updated_at.get(balance_type)
+		return float("inf") if updated_at is None else time.monotonic() - updated_at
+
+	def get(self, balance_type: str = "wallet", max_age_sec: Optional[float] = None) -> float:
+		"""Cached balance if it is not older than max_age_sec (default: the service bound), otherwise a fresh one"""
+		bound = self.max_age_sec if max_age_sec is None else max_age_sec
+		with self._lock:
+			if balance_type in self._balances and self.age(balance_type) <= bound:
+				return self._balances[balance_type]
+		return self.refresh()[balance_type]
+
+	def invalidate(self, balance_type: Optional[str] = None) -> None:
+		with self._lock:
+			if balance_type is None:
+				self._updated_at.clear()
+			else:
+				self._updated_at.pop(balance_type, None)
+
+	def request_refresh(self, balance_type: Optional[str] = None) -> None:
+		"""Balance has changed (order placed, fill): the cached value is dropped and the background thread refreshes now,
+		whichever comes first of it and the next get() reads the exchange"""
+		self.invalidate(balance_type)
+		if self._thread is not None and self._thread.is_alive():
+			self._wakeup.set()
+
+	def handle_user_event(self, event: Dict[str, Any]) -> None:
+		"""
+		User-data stream events:
+		- ACCOUNT_UPDATE carries the new USDT wallet balance ("wb"), available balance isn't in the event and is re-read
+		- ORDER_TRADE_UPDATE with a fill triggers a refresh
+		"""
+		event_type = event.get("e")
+		if event_type == "ACCOUNT_UPDATE":
+			for asset in (event.get("a", {}) or {}).get("B", []) or []:
+				if asset.get("a") == "USDT" and asset.get("wb") is not None:
+					self.store({"wallet": float(asset.get("wb"))})
+			self.request_refresh("available")
+		elif event_type == "ORDER_TRADE_UPDATE":
+			order = event.get("o", {}) or {}
+			if order.get("x") == "TRADE" or order.get("X") in ("FILLED", "PARTIALLY_FILLED"):
+				self.request_refresh()
+
+	def _run(self) -> None:
+		while not self._stopped.is_set():
+			self._wakeup.wait(self.refresh_interval_sec)
+			self._wakeup.clear()
+			if self._stopped.is_set():
+				break
+			try:
+				self.refresh()
+			except Exception as ex:
+				# keep serving the last value, get() falls back to a synchronous read once it is too old
+				print(f"BalanceService: refresh failed: {ex}")
+
+	def start(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self._run, name="balance_service", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stopped.set()
+		self._wakeup.set()
@@ -5,16 +5,28 @@ from typing import Optional, Dict, Any, Tuple
 
 from binance.um_futures import UMFutures
 from binance.error import ClientError
-import time
-import hmac
-import hashlib
-from urllib.parse import urlencode
+import functools
 import requests
 import json
 from datetime import datetime
 import os
 from decimal import Decimal, ROUND_DOWN, getcontext
 
+from balance_service import BalanceService
+from exchange_info import ExchangeInfoCache, SymbolFilters, shared_exchange_info
+from latency import LatencyRecorder
+from log_sink import get_sink
+from time_sync import ServerTimeSync, SignedRequestBuilder, fetch_server_time_ms
+
+# Order rejections that may mean the cached leverage / margin type no longer matches the exchange
+# (-2027/-2028 position or margin limits at current leverage, -4028 leverage not valid); -2019 (margin is insufficient)
+# is about the balance, not the settings
+ACCOUNT_SETTINGS_ERROR_CODES = (-2027, -2028, -4028)
+
+
+class BatchOrdersUnavailable(Exception):
+	"""The installed SDK has no batchOrders call (binance-futures-connector without new_batch_order)"""
+
 
 @dataclass
 class OrderResult:
@@ -26,6 +38,8 @@ class OrderResult:
 	take_profit_order: Optional[Dict[str, Any]] = None
 	trailing_stop_order: Optional[Dict[str, Any]] = None
 	raw: Dict[str, Any] = field(default_factory=dict)
+	# milliseconds per placement step and "total", empty unless latency metrics are enabled
+	timings: Dict[str, float] = field(default_factory=dict)
 
 
 class Binance_connect:
@@ -52,25 +66,53 @@ class Binance_connect:
 	- time_in_force: TIF for limit orders (default GTC)
 	- position_side: for hedge mode ("BOTH" default when one-way mode)
 	- testnet: constructor flag to use Binance Futures testnet
-	- skip_account_setup: if True, do NOT change margin type or leverage inside the method (default False)
+	- skip_account_setup: if True, do NOT change margin type or leverage inside the method (default False);
+	  otherwise they are only changed when they differ from the cached per-symbol state (see ensure_account_settings)
 	- log_to_file: if True, write structured JSON logs to a file (default False)
 	- log_file_path: path to the log file (default "logs/binance_connector.log")
+	- batch_orders: place the entry and protective orders in one batchOrders request (default True, sequential fallback)
+	- balance_max_age_sec: oldest cached balance risk sizing may use, 0 reads the account on every trade (default 60)
+	- balance_refresh_sec: period of the background balance refresh started by self.balance.start() (default 60)
+	- time_sync: server clock offset (default: own ServerTimeSync, self.time_sync.start() re-syncs in the background)
+	- synced_recv_window_ms: recvWindow of /papi requests once the offset is measured (default 5000), recv_window_ms before that
+	- latency_metrics: time every placement step into self.latency histograms and OrderResult.timings (default False)
+	- exchange_info: symbol metadata cache (default: process-wide exchange_info.shared_exchange_info(), own cache on testnet / base_url)
+	- base_url / pm_base_url: REST roots of /fapi and /papi instead of Binance (e.g. mock_exchange.MockFuturesExchange.url)
 	"""
 
-	def __init__(self, api_key: str, api_secret: str, testnet: bool = False, recv_window_ms: int = 60000, *, log_to_file: bool = False, log_file_path: Optional[str] = None, api_mode: str = "classic") -> None:
-		if testnet:
-			self.client = UMFutures(key=api_key, secret=api_secret, base_url="https://testnet.binancefuture.com")
+	def __init__(self, api_key: str, api_secret: str, testnet: bool = False, recv_window_ms: int = 60000, *, log_to_file: bool = False, log_file_path: Optional[str] = None, api_mode: str = "classic", exchange_info: Optional[ExchangeInfoCache] = None, batch_orders: bool = True, balance_max_age_sec: float = 60.0, balance_refresh_sec: float = 60.0, time_sync: Optional[ServerTimeSync] = None, synced_recv_window_ms: int = 5000, latency_metrics: bool = False, base_url: Optional[str] = None, pm_base_url: Optional[str] = None) -> None:
+		fapi_base_url = base_url or ("https://testnet.binancefuture.com" if testnet else None)
+		if fapi_base_url:
+			self.client = UMFutures(key=api_key, secret=api_secret, base_url=fapi_base_url)
 		else:
 			self.client = UMFutures(key=api_key, secret=api_secret)
+		self.testnet = testnet
 		self.recv_window_ms = recv_window_ms
 		self.log_to_file = log_to_file
 		self.log_file_path = log_file_path or os.path.join("logs", "binance_connector.log")
 		self.api_key = api_key
 		self.api_secret = api_secret
+		self._signer = SignedRequestBuilder(api_secret)
+		# server clock offset for signed /papi requests (the classic SDK stamps its own timestamp)
+		self.time_sync = time_sync or ServerTimeSync(functools.partial(fetch_server_time_ms, fapi_base_url or "https://fapi.binance.com"))
+		self.synced_recv_window_ms = synced_recv_window_ms
 		# classic: use binance SDK /fapi; pm: use direct HTTP to /papi with PM header
 		self.api_mode = (api_mode or "classic").lower()
-		self.pm_base_url = "https://papi.binance.com"
+		self.pm_base_url = pm_base_url or "https://papi.binance.com"
 		self._http = requests.Session()
+		# exchangeInfo is downloaded once per TTL and shared, not on every order
+		if exchange_info is None:
+			exchange_info = ExchangeInfoCache(self.client.exchange_info) if fapi_base_url else shared_exchange_info()
+		self.exchange_info = exchange_info
+		self.batch_orders = batch_orders
+		self._batch_unavailable = False		# set once batchOrders is rejected as an endpoint, later brackets go sequentially
+		# symbol -> {"leverage": int, "margin_type": str}, what the exchange is known to have
+		self._account_settings: Dict[str, Dict[str, Any]] = {}
+		self._account_settings_loaded = False
+		# wallet / available USDT for risk sizing; the background refresh runs only after self.balance.start()
+		self.balance = BalanceService(self.get_usdt_balances, max_age_sec=balance_max_age_sec, refresh_interval_sec=balance_refresh_sec)
+		# per-step placement latency; disabled it hands out a no-op timer
+		self.latency = LatencyRecorder(enabled=latency_metrics)
 		if self.log_to_file:
 			os.makedirs(os.path.dirname(self.log_file_path), exist_ok=True)
 
@@ -78,16 +120,8 @@ class Binance_connect:
 	def _write_file_log(self, event: str, details: Optional[Dict[str, Any]] = None) -> None:
 		if not self.log_to_file:
 			return
-		record = {
-			"ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-			"event": event,
-			"details": details or {},
-		}
-		try:
-			with open(self.log_file_path, "a", encoding="utf-8") as f:
-				f.write(json.dumps(record, ensure_ascii=False) + "\n")
-		except Exception:
-			pass
+		# queued for the background writer of the file, see log_sink
+		get_sink(self.log_file_path).write(event, details)
 
 	def _log(self, verbose: bool, message: str, details: Optional[Dict[str, Any]] = None) -> None:
 		# Console
@@ -118,23 +152,26 @@ class Binance_connect:
 			return default
 
 	def _sign(self, query_str: str) -> str:
-		sig = hmac.new(self.api_secret.encode(), query_str.encode(), hashlib.sha256).hexdigest()
-		return sig
+		return self._signer.sign(query_str)
+
+	def _recv_window(self) -> int:
+		# a measured server offset makes the tight window safe; without it the configured wide one is kept
+		return self.synced_recv_window_ms if self.time_sync.synced else self.recv_window_ms
 
 	def _pm_request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
-		if params is None:
-			params = {}
-		params.setdefault("recvWindow", self.recv_window_ms)
-		params.setdefault("timestamp", int(time.time() * 1000))
-		# Build URL-encoded query string deterministically
-		query_str = urlencode([(k, params[k]) for k in sorted(params.keys()) if params[k] is not None], doseq=True)
-		signature = self._sign(query_str)
-		full_url = f"{self.pm_base_url}{path}?{query_str}&signature={signature}"
+		params = dict(params or {})
+		recv_window = params.pop("recvWindow", None) or self._recv_window()
+		timestamp = params.pop("timestamp", None) or self.time_sync.now_ms()
+		query_str = self._signer.build(path, params, {"recvWindow": recv_window}, timestamp)
+		full_url = f"{self.pm_base_url}{path}?{query_str}"
 		r = self._http.request(method, full_url, headers=self._pm_headers())
 		try:
 			r.raise_for_status()
 		except Exception as e:
 			self._log(True, "pm_request_failed", {"method": method, "path": path, "status": r.status_code, "body": r.text})
+			if '"code":-1021' in r.text:
+				# timestamp outside recvWindow: the clock drifted, re-measure before the caller retries
+				self.time_sync.sync()
 			raise
 		try:
 			return r.json()
@@ -143,17 +180,15 @@ class Binance_connect:
 
 	# -------- Symbol metadata and rounding --------
 	def _get_symbol_info(self, symbol: str) -> Dict[str, Any]:
-		info = self.client.exchange_info()
-		for item in info.get("symbols", []):
-			if item.get("symbol") == symbol:
-				return item
-		raise ValueError(f"Symbol {symbol} not found in exchange info")
-
-	def _get_filters(self, symbol_info: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
-		filters: Dict[str, Dict[str, Any]] = {}
-		for f in symbol_info.get("filters", []):
-			filters[f.get("filterType")] = f
-		return filters
+		return self.exchange_info.symbol_info(symbol)
+
+	def get_symbol_filters(self, symbol: str) -> SymbolFilters:
+		"""Pre-parsed tick/step/minQty/minNotional of the symbol from the cached exchangeInfo"""
+		return self.exchange_info.get(symbol)
+
+	def refresh_exchange_info(self) -> bool:
+		"""Forces a new exchangeInfo download (e.g. after a -1111 precision error)"""
+		return self.exchange_info.refresh()
 
 	# -------- Decimal helpers strictly matching Binance filters --------
 	def _quantum_from_step(self, step_str: str) -> Decimal:
@@ -172,22 +207,6 @@ class Binance_connect:
 			s = s.rstrip('0').rstrip('.') or '0'
 		return s
 
-	def _tick_size(self, filters: Dict[str, Dict[str, Any]]) -> float:
-		pf = filters.get("PRICE_FILTER", {})
-		return float(pf.get("tickSize", 0.0)) or 0.0
-
-	def _step_size(self, filters: Dict[str, Dict[str, Any]]) -> float:
-		ls = filters.get("LOT_SIZE", {})
-		return float(ls.get("stepSize", 0.0)) or 0.0
-
-	def _min_qty(self, filters: Dict[str, Dict[str, Any]]) -> float:
-		ls = filters.get("LOT_SIZE", {})
-		return float(ls.get("minQty", 0.0)) or 0.0
-
-	def _min_notional(self, filters: Dict[str, Dict[str, Any]]) -> float:
-		mn = filters.get("MIN_NOTIONAL", {})
-		return float(mn.get("notional", mn.get("minNotional", 0.0)) or 0.0)
-
 	def _round_to_step(self, value: float, step: float) -> float:
 		if step == 0:
 			return value
@@ -214,6 +233,9 @@ class Binance_connect:
 				return []
 		# classic
 		try:
+			all_orders = getattr(self.client, "get_orders", None)
+			if callable(all_orders):
+				return all_orders(symbol=symbol, recvWindow=self.recv_window_ms)
 			return self.client.get_open_orders(symbol=symbol)
 		except Exception as e1:
 			self._log(True, "get_open_orders primary failed", {"symbol": symbol, "error": str(e1)})
@@ -235,6 +257,10 @@ class Binance_connect:
 				self._log(True, "get_all_open_orders failed (PM)", {"error": str(e)})
 				return []
 		try:
+			# SDK get_orders is /fapi/v1/openOrders (all symbols without symbol); get_open_orders is the single-order query
+			all_orders = getattr(self.client, "get_orders", None)
+			if callable(all_orders):
+				return all_orders(recvWindow=self.recv_window_ms)
 			return self.client.get_open_orders()
 		except TypeError as e:
 			# Some client versions require a symbol. We'll log and return empty to allow caller fallback.
@@ -392,6 +418,44 @@ class Binance_connect:
 			self._log(True, "get_all_positions failed", {"error": str(e)})
 			return []
 
+	# -------- User data stream --------
+	def _pm_user_stream_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+		# USER_STREAM endpoints need only the API key, no signature
+		r = self._http.request(method, f"{self.pm_base_url}/papi/v1/listenKey", params=params, headers=self._pm_headers())
+		r.raise_for_status()
+		return r.json()
+
+	def new_listen_key(self) -> str:
+		"""Creates (or returns the active) listenKey of the futures user-data stream"""
+		if self.api_mode == "pm":
+			resp = self._pm_user_stream_request("POST")
+		else:
+			resp = self.client.new_listen_key()
+		return resp["listenKey"]
+
+	def keepalive_listen_key(self, listen_key: str) -> None:
+		"""Extends the listenKey for 60 minutes; Binance expects it at least every 60 minutes"""
+		if self.api_mode == "pm":
+			self._pm_user_stream_request("PUT", {"listenKey": listen_key})
+		else:
+			self.client.renew_listen_key(listenKey=listen_key)
+
+	def close_listen_key(self, listen_key: str) -> None:
+		try:
+			if self.api_mode == "pm":
+				self._pm_user_stream_request("DELETE", {"listenKey": listen_key})
+			else:
+				self.client.close_listen_key(listenKey=listen_key)
+		except Exception as e:
+			self._log(True, "close_listen_key failed", {"error": str(e)})
+
+	def user_stream_url(self, listen_key: str) -> str:
+		if self.testnet:
+			return f"wss://stream.binancefuture.com/ws/{listen_key}"
+		if self.api_mode == "pm":
+			return f"wss://fstream.binance.com/pm/ws/{listen_key}"
+		return f"wss://fstream.binance.com/ws/{listen_key}"
+
 	# -------- Risk helpers --------
 	def derive_quantity(self, *, notional_usdt: Optional[float], entry_price: float, step_size: float, min_qty: float) -> float:
 		if notional_usdt is None:
@@ -433,10 +497,10 @@ class Binance_connect:
 			raise ValueError("Calculated quantity is below the minimum lot size")
 		return qty
 
-	def get_usdt_balance(self, balance_type: str = "wallet") -> float:
+	def get_usdt_balances(self) -> Dict[str, float]:
 		"""
-		Fetch USDT balance. In PM mode use /papi account; otherwise classic UMFutures account().
-		balance_type: "wallet" (default) or "available"
+		Fetch USDT wallet and available balance with one account request. In PM mode use /papi account; otherwise classic UMFutures account().
+		Also updates the cached balances of self.balance.
 		"""
 		try:
 			if self.api_mode == "pm":
@@ -448,30 +512,35 @@ class Binance_connect:
 			else:
 				data = self.client.account(recvWindow=self.recv_window_ms)
 			self._write_file_log("account", {"response": data})
+			balances: Optional[Dict[str, float]] = None
 			assets = data.get("assets", []) or []
 			for asset in assets:
 				if asset.get("asset") == "USDT":
-					# Prefer availableBalance if requested/exists, otherwise fallback to walletBalance or marginBalance
-					if balance_type == "available":
-						val = asset.get("availableBalance")
-						return self._safe_float(val)
 					# wallet: try walletBalance, fallback to marginBalance
-					val = asset.get("walletBalance")
-					if val is None:
-						val = asset.get("marginBalance")
-					return self._safe_float(val)
+					wallet = asset.get("walletBalance")
+					if wallet is None:
+						wallet = asset.get("marginBalance")
+					balances = {"wallet": self._safe_float(wallet), "available": self._safe_float(asset.get("availableBalance"))}
+					break
 			# If we are in PM and assets didn't return USDT, use top-level fallbacks
-			if self.api_mode == "pm":
-				if balance_type == "available" and top_available > 0:
-					return top_available
+			if balances is None and self.api_mode == "pm":
 				# prefer margin/equity if present; else wallet
-				if top_margin > 0:
-					return top_margin
-				return top_wallet
-			raise RuntimeError("USDT asset not found in account assets")
+				wallet = top_margin if top_margin > 0 else top_wallet
+				balances = {"wallet": wallet, "available": top_available if top_available > 0 else wallet}
+			if balances is None:
+				raise RuntimeError("USDT asset not found in account assets")
 		except Exception as e:
 			self._write_file_log("account_error", {"error": str(e)})
 			raise RuntimeError(f"Failed to fetch account balance: {e}")
+		self.balance.store(balances)
+		return balances
+
+	def get_usdt_balance(self, balance_type: str = "wallet") -> float:
+		"""
+		Fetch USDT balance from the exchange (see get_usdt_balances). For a cached value use self.balance.get(balance_type).
+		balance_type: "wallet" (default) or "available"
+		"""
+		return self.get_usdt_balances()[balance_type]
 
 	def compute_quantity_from_risk(
 		self,
@@ -482,17 +551,18 @@ class Binance_connect:
 		*,
 		balance_type: str = "available",
 		verbose: bool = False,
+		max_balance_age_sec: Optional[float] = None,
 	) -> float:
 		"""
-		Convenience wrapper: reads filters and current USDT balance (available by default), then derives quantity by risk and rounds to lot size.
+		Convenience wrapper: reads filters and USDT balance (available by default), then derives quantity by risk and rounds to lot size.
+		The balance comes from self.balance if it is not older than max_balance_age_sec (default: balance_max_age_sec of the constructor).
 		"""
 		self._log(verbose, "Fetching symbol filters for sizing", {"symbol": symbol})
-		symbol_info = self._get_symbol_info(symbol)
-		filters = self._get_filters(symbol_info)
-		step_size = self._step_size(filters)
-		min_qty = self._min_qty(filters)
-		self._log(verbose, "Fetching USDT balance", {"balance_type": balance_type})
-		bank = self.get_usdt_balance(balance_type=balance_type)
+		symbol_filters = self.get_symbol_filters(symbol)
+		step_size = float(symbol_filters.step_size)
+		min_qty = float(symbol_filters.min_qty)
+		self._log(verbose, "Fetching USDT balance", {"balance_type": balance_type, "cached_age_sec": round(self.balance.age(balance_type), 3)})
+		bank = self.balance.get(balance_type, max_balance_age_sec)
 		self._log(verbose, "Balance fetched", {"bank_usdt": bank})
 		# Detailed sizing math
 		delta = abs(entry_price - stop_loss_price)
@@ -521,12 +591,16 @@ class Binance_connect:
 				resp = self._pm_request("POST", "/papi/v1/um/leverage", {"symbol": symbol, "leverage": leverage})
 				self._write_file_log("change_leverage", {"symbol": symbol, "leverage": leverage, "response": resp})
 			except Exception as e:
+				self.invalidate_account_settings(symbol)
 				raise RuntimeError(f"Failed to set leverage (PM): {e}")
+			self._remember_account_setting(symbol, "leverage", self._leverage_from(resp, leverage))
 			return
 		try:
 			resp = self.client.change_leverage(symbol=symbol, leverage=leverage, recvWindow=self.recv_window_ms)
 			self._write_file_log("change_leverage", {"symbol": symbol, "leverage": leverage, "response": resp})
+			self._remember_account_setting(symbol, "leverage", self._leverage_from(resp, leverage))
 		except ClientError as e:
+			self.invalidate_account_settings(symbol)
 			code = getattr(e, "error_code", None) or getattr(e, "status_code", None)
 			self._write_file_log("change_leverage_error", {"symbol": symbol, "leverage": leverage, "error": getattr(e, "error_message", str(e)), "code": code})
 			if code in (-2015, 401):
@@ -540,22 +614,86 @@ class Binance_connect:
 				resp = self._pm_request("POST", "/papi/v1/um/marginType", {"symbol": symbol, "marginType": margin_type})
 				self._write_file_log("change_margin_type", {"symbol": symbol, "margin_type": margin_type, "response": resp})
 			except Exception as e:
+				self.invalidate_account_settings(symbol)
 				raise RuntimeError(f"Failed to set margin type (PM): {e}")
+			self._remember_account_setting(symbol, "margin_type", margin_type.upper())
 			return
 		try:
 			resp = self.client.change_margin_type(symbol=symbol, marginType=margin_type, recvWindow=self.recv_window_ms)
 			self._write_file_log("change_margin_type", {"symbol": symbol, "margin_type": margin_type, "response": resp})
+			self._remember_account_setting(symbol, "margin_type", margin_type.upper())
 		except ClientError as e:
 			# If already set, Binance returns error code; ignore that specific case
 			msg = getattr(e, "error_message", "")
 			code = getattr(e, "error_code", None) or getattr(e, "status_code", None)
 			self._write_file_log("change_margin_type_error", {"symbol": symbol, "margin_type": margin_type, "error": msg, "code": code})
 			if "No need to change margin type" in str(msg):
+				self._remember_account_setting(symbol, "margin_type", margin_type.upper())
 				return
+			self.invalidate_account_settings(symbol)
 			if code in (-2015, 401):
 				raise RuntimeError("Failed to set margin type: invalid API key, IP whitelist, or missing Futures permissions")
 			raise RuntimeError(f"Failed to set margin type: {e}")
 
+	# -------- Cached account settings (leverage, margin type) --------
+	def _leverage_from(self, resp: Any, leverage: int) -> int:
+		try:
+			return int(resp.get("leverage", leverage)) if isinstance(resp, dict) else int(leverage)
+		except Exception:
+			return int(leverage)
+
+	def _remember_account_setting(self, symbol: str, key: str, value: Any) -> None:
+		self._account_settings.setdefault(symbol, {})[key] = value
+
+	def invalidate_account_settings(self, symbol: Optional[str] = None) -> None:
+		"""Forgets the cached leverage / margin type of the symbol (of all symbols if None), the next trade sets them again"""
+		if symbol is None:
+			self._account_settings.clear()
+		else:
+			self._account_settings.pop(symbol, None)
+
+	def load_account_settings(self) -> int:
+		"""
+		Seeds the leverage / margin type cache from the account positions (one entry per symbol with leverage and isolated flag).
+		Returns the number of symbols seeded; symbols missing from the response are set on their first trade.
+		"""
+		seeded = 0
+		for p in self.get_all_positions():
+			symbol = p.get("symbol")
+			if not symbol:
+				continue
+			settings: Dict[str, Any] = {}
+			if p.get("leverage") not in (None, ""):
+				settings["leverage"] = int(float(p.get("leverage")))
+			if p.get("marginType"):
+				settings["margin_type"] = "ISOLATED" if str(p.get("marginType")).lower() == "isolated" else "CROSSED"
+			elif p.get("isolated") is not None:
+				settings["margin_type"] = "ISOLATED" if p.get("isolated") in (True, "true") else "CROSSED"
+			if settings:
+				self._account_settings.setdefault(symbol, {}).update(settings)
+				seeded += 1
+		self._account_settings_loaded = True
+		self._write_file_log("account_settings_loaded", {"symbols": seeded})
+		return seeded
+
+	def ensure_account_settings(self, symbol: str, margin_type: str, leverage: int, *, verbose: bool = False) -> bool:
+		"""
+		Sets margin type and leverage only when they differ from the cached state of the symbol.
+		Returns True if any request was sent to the exchange.
+		"""
+		if not self._account_settings_loaded:
+			self.load_account_settings()
+		current = self._account_settings.get(symbol, {})
+		changed = False
+		if current.get("margin_type") != margin_type.upper():
+			self.set_margin_type(symbol, margin_type)
+			changed = True
+		if current.get("leverage") != int(leverage):
+			self.set_leverage(symbol, leverage)
+			changed = True
+		self._log(verbose, "Account configured" if changed else "Account settings cached, setup skipped", {"symbol": symbol, "margin_type": margin_type, "leverage": leverage})
+		return changed
+
 	# -------- Validation --------
 	def _validate_qty_notional(self, *, price: float, qty: float, min_qty: float, min_notional: float) -> None:
 		if qty < min_qty:
@@ -579,6 +717,59 @@ class Binance_connect:
 			val = 5.0
 		return val
 
+	# -------- Order sending --------
+	def _send_order(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+		if self.api_mode == "pm":
+			return self._pm_request("POST", "/papi/v1/um/order", dict(payload))
+		return self.client.new_order(**payload, recvWindow=self.recv_window_ms)
+
+	def _batch_order_params(self, payload: Dict[str, Any]) -> Dict[str, str]:
+		# batchOrders takes a JSON list of orders with string values only
+		return {k: (("true" if v else "false") if isinstance(v, bool) else str(v)) for k, v in payload.items() if v is not None}
+
+	def _send_batch_orders(self, payloads: list) -> Any:
+		batch = [self._batch_order_params(p) for p in payloads]
+		if self.api_mode == "pm":
+			return self._pm_request("POST", "/papi/v1/um/batchOrders", {"batchOrders": json.dumps(batch, separators=(",", ":"))})
+		if not hasattr(self.client, "new_batch_order"):
+			raise BatchOrdersUnavailable("binance-futures-connector without new_batch_order")
+		# new_batch_order(batchOrders) takes no recvWindow: sign the same request it builds, with ours added
+		params = {"batchOrders": batch, "recvWindow": self.recv_window_ms}
+		return self.client.sign_request("POST", "/fapi/v1/batchOrders", params, True)
+
+	def _batch_unsupported(self, error: Exception) -> bool:
+		"""True if batchOrders itself is unavailable (SDK without it, 404/405 endpoint), not a rejected order or a bug"""
+		if isinstance(error, BatchOrdersUnavailable):
+			return True
+		status = getattr(error, "status_code", None)
+		if status is None and getattr(error, "response", None) is not None:
+			status = getattr(error.response, "status_code", None)
+		return status in (404, 405)
+
+	def _cancel_placed(self, symbol: str, orders: Dict[str, Any]) -> None:
+		for order in orders.values():
+			if isinstance(order, dict):
+				self.cancel_order(symbol, order_id=order.get("orderId"))
+
+	def _place_bracket_batch(self, bracket: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+		"""
+		Sends the bracket orders in one batchOrders request (Binance allows up to 5 per batch).
+		The response is a list aligned with the request: an order or {"code", "msg"} per item.
+		Returns (placed orders by name, errors by name).
+		"""
+		names = list(bracket.keys())
+		response = self._send_batch_orders([bracket[name] for name in names])
+		if not isinstance(response, list) or len(response) != len(names):
+			raise RuntimeError(f"Unexpected batchOrders response: {response}")
+		placed: Dict[str, Any] = {}
+		errors: Dict[str, Any] = {}
+		for name, item in zip(names, response):
+			if isinstance(item, dict) and item.get("orderId") is not None:
+				placed[name] = item
+			else:
+				errors[name] = item
+		return placed, errors
+
 	# -------- Main placement --------
 	def place_futures_order_with_protection(
 		self,
@@ -605,12 +796,16 @@ class Binance_connect:
 		verbose: bool = False,
 		trailing_size_mode: str = "quantity",  # "quantity" (reduceOnly qty) | "close_position"
 		risk_balance_type: str = "available",
+		batch_orders: Optional[bool] = None,
 	) -> OrderResult:
 		"""
 		Places an entry LIMIT order offset by deviation_percent from entry_price and adds stop-loss,
 		optional take-profit, and trailing-stop reduce-only orders.
+		With batch_orders (default: the constructor setting) the whole bracket goes in one batchOrders request.
+		With latency metrics enabled every step is timed into self.latency and OrderResult.timings.
 		"""
 		orders_raw: Dict[str, Any] = {}
+		timer = self.latency.timer()
 		try:
 			# 0) Input summary
 			input_summary = {
@@ -635,14 +830,12 @@ class Binance_connect:
 			self._log(verbose, "Received placement request", input_summary)
 
 			# 1) Symbol metadata and rounding
-			symbol_info = self._get_symbol_info(symbol)
-			filters = self._get_filters(symbol_info)
-			pf = filters.get("PRICE_FILTER", {})
-			ls = filters.get("LOT_SIZE", {})
-			tick_size = self._tick_size(filters)
-			step_size = self._step_size(filters)
-			min_qty = self._min_qty(filters)
-			min_notional = self._min_notional(filters)
+			with timer.span("symbol_metadata"):
+				symbol_filters = self.get_symbol_filters(symbol)
+			tick_size = float(symbol_filters.tick_size)
+			step_size = float(symbol_filters.step_size)
+			min_qty = float(symbol_filters.min_qty)
+			min_notional = float(symbol_filters.min_notional)
 			filters_summary = {
 				"tick_size": tick_size,
 				"step_size": step_size,
@@ -653,41 +846,41 @@ class Binance_connect:
 
 			# 2) Account setup (optional)
 			if not skip_account_setup:
-				self.set_margin_type(symbol, margin_type)
-				self.set_leverage(symbol, leverage)
-				self._log(verbose, "Account configured", {"margin_type": margin_type, "leverage": leverage})
+				with timer.span("account_setup"):
+					self.ensure_account_settings(symbol, margin_type, leverage, verbose=verbose)
 
 			# 3) Determine quantity if not provided
-			if quantity is None:
-				if notional_usdt is not None:
-					quantity = self.derive_quantity(
-						notional_usdt=notional_usdt,
-						entry_price=entry_price,
-						step_size=step_size,
-						min_qty=min_qty,
-					)
-					self._log(verbose, "Quantity derived from notional", {"notional_usdt": notional_usdt, "quantity_raw": quantity})
-				elif risk_percent_of_bank is not None and current_bank_usdt is not None:
-					quantity = self.derive_quantity_by_risk(
-						bank_usdt=current_bank_usdt,
-						risk_percent=risk_percent_of_bank,
-						entry_price=entry_price,
-						stop_loss_price=stop_loss_price,
-						step_size=step_size,
-						min_qty=min_qty,
-					)
-					self._log(verbose, "Quantity derived from explicit bank+risk", {"bank_usdt": current_bank_usdt, "risk_percent": risk_percent_of_bank, "quantity_raw": quantity})
-				elif risk_percent_of_bank is not None and current_bank_usdt is None:
-					quantity = self.compute_quantity_from_risk(
-						symbol=symbol,
-						entry_price=entry_price,
-						stop_loss_price=stop_loss_price,
-						risk_percent_of_bank=risk_percent_of_bank,
-						balance_type=risk_balance_type,
-						verbose=verbose,
-					)
-				else:
-					raise ValueError("Provide either quantity, notional_usdt, or risk_percent_of_bank (with or without current_bank_usdt)")
+			with timer.span("sizing"):
+				if quantity is None:
+					if notional_usdt is not None:
+						quantity = self.derive_quantity(
+							notional_usdt=notional_usdt,
+							entry_price=entry_price,
+							step_size=step_size,
+							min_qty=min_qty,
+						)
+						self._log(verbose, "Quantity derived from notional", {"notional_usdt": notional_usdt, "quantity_raw": quantity})
+					elif risk_percent_of_bank is not None and current_bank_usdt is not None:
+						quantity = self.derive_quantity_by_risk(
+							bank_usdt=current_bank_usdt,
+							risk_percent=risk_percent_of_bank,
+							entry_price=entry_price,
+							stop_loss_price=stop_loss_price,
+							step_size=step_size,
+							min_qty=min_qty,
+						)
+						self._log(verbose, "Quantity derived from explicit bank+risk", {"bank_usdt": current_bank_usdt, "risk_percent": risk_percent_of_bank, "quantity_raw": quantity})
+					elif risk_percent_of_bank is not None and current_bank_usdt is None:
+						quantity = self.compute_quantity_from_risk(
+							symbol=symbol,
+							entry_price=entry_price,
+							stop_loss_price=stop_loss_price,
+							risk_percent_of_bank=risk_percent_of_bank,
+							balance_type=risk_balance_type,
+							verbose=verbose,
+						)
+					else:
+						raise ValueError("Provide either quantity, notional_usdt, or risk_percent_of_bank (with or without current_bank_usdt)")
 
 			# 4) Compute entry limit price by deviation
 			if side.upper() == "BUY":
@@ -700,8 +893,8 @@ class Binance_connect:
 			limit_price = self._round_price(limit_price_raw, tick_size)
 			qty_rounded = self._round_qty(quantity, step_size, min_qty)
 			# Prepare strings according to Binance steps
-			tick_size_str = str(pf.get("tickSize", "0.0001"))
-			step_size_str = str(ls.get("stepSize", "1"))
+			tick_size_str = symbol_filters.tick_size_str
+			step_size_str = symbol_filters.step_size_str
 			limit_price_str = self._format_by_step(limit_price, tick_size_str)
 			qty_str = self._format_by_step(qty_rounded, step_size_str)
 			self._log(verbose, "Computed entry and quantity", {
@@ -715,9 +908,17 @@ class Binance_connect:
 			self._validate_qty_notional(price=float(limit_price_str) if limit_price_str else entry_price, qty=float(qty_str), min_qty=min_qty, min_notional=min_notional)
 			self._log(verbose, "Validation passed", {"notional": (float(limit_price_str) if limit_price_str else entry_price) * float(qty_str)})
 
-			# 6) Place entry LIMIT order
-			if self.api_mode == "pm":
-				payload_entry = {
+			# 6) Build the bracket: entry LIMIT, STOP_MARKET, optional TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
+			exit_side = "SELL" if side.upper() == "BUY" else "BUY"
+			stop_price = self._round_price(stop_loss_price, tick_size)
+			stop_price_str = self._format_by_step(stop_price, tick_size_str)
+			activation = self._round_price(trailing_activation_price, tick_size)
+			activation_str = self._format_by_step(activation, tick_size_str)
+			callback = self._clamp_callback_rate(trailing_callback_percent)
+			# One decimal step for callbackRate
+			callback_str = format((Decimal(str(callback)).quantize(Decimal('0.1'), rounding=ROUND_DOWN)), 'f')
+			bracket: Dict[str, Dict[str, Any]] = {
+				"entry": {
 					"symbol": symbol,
 					"side": side.upper(),
 					"type": "LIMIT",
@@ -725,29 +926,10 @@ class Binance_connect:
 					"quantity": qty_str,
 					"price": limit_price_str,
 					"positionSide": position_side,
-				}
-				entry_order = self._pm_request("POST", "/papi/v1/um/order", payload_entry)
-			else:
-				entry_order = self.client.new_order(
-					symbol=symbol,
-					side=side.upper(),
-					type="LIMIT",
-					timeInForce=time_in_force,
-					quantity=qty_str,
-					price=limit_price_str,
-					positionSide=position_side,
-					recvWindow=self.recv_window_ms,
-				)
-			orders_raw["entry"] = entry_order
-			self._log(verbose, "Entry order placed", {"orderId": entry_order.get("orderId"), "price": limit_price_str, "qty": qty_str, "response": entry_order})
-
-			# 7) Place Stop-Loss (STOP_MARKET reduceOnly)
-			stop_price = self._round_price(stop_loss_price, tick_size)
-			stop_price_str = self._format_by_step(stop_price, tick_size_str)
-			if self.api_mode == "pm":
-				stop_order = self._pm_request("POST", "/papi/v1/um/order", {
+				},
+				"stop": {
 					"symbol": symbol,
-					"side": ("SELL" if side.upper() == "BUY" else "BUY"),
+					"side": exit_side,
 					"type": "STOP_MARKET",
 					"stopPrice": stop_price_str,
 					"closePosition": False,
@@ -755,113 +937,128 @@ class Binance_connect:
 					"workingType": working_type,
 					"quantity": qty_str,
 					"positionSide": position_side,
-				})
-			else:
-				stop_order = self.client.new_order(
-					symbol=symbol,
-					side=("SELL" if side.upper() == "BUY" else "BUY"),
-					type="STOP_MARKET",
-					stopPrice=stop_price_str,
-					closePosition=False,
-					reduceOnly=reduce_only,
-					workingType=working_type,
-					quantity=qty_str,
-					positionSide=position_side,
-					recvWindow=self.recv_window_ms,
-				)
-			orders_raw["stop"] = stop_order
-			self._log(verbose, "Stop-loss order placed", {"orderId": stop_order.get("orderId"), "stopPrice": stop_price_str, "response": stop_order})
-
-			# 8) Optional Take-Profit (TAKE_PROFIT_MARKET reduceOnly)
-			take_profit_order = None
+				},
+			}
 			if take_profit_price is not None:
 				tp_price = self._round_price(float(take_profit_price), tick_size)
-				tp_price_str = self._format_by_step(tp_price, tick_size_str)
-				if self.api_mode == "pm":
-					take_profit_order = self._pm_request("POST", "/papi/v1/um/order", {
-						"symbol": symbol,
-						"side": ("SELL" if side.upper() == "BUY" else "BUY"),
-						"type": "TAKE_PROFIT_MARKET",
-						"stopPrice": tp_price_str,
-						"closePosition": False,
-						"reduceOnly": reduce_only,
-						"workingType": working_type,
-						"quantity": qty_str,
-						"positionSide": position_side,
-					})
-				else:
-					take_profit_order = self.client.new_order(
-						symbol=symbol,
-						side=("SELL" if side.upper() == "BUY" else "BUY"),
-						type="TAKE_PROFIT_MARKET",
-						stopPrice=tp_price_str,
-						closePosition=False,
-						reduceOnly=reduce_only,
-						workingType=working_type,
-						quantity=qty_str,
-						positionSide=position_side,
-						recvWindow=self.recv_window_ms,
-					)
-				orders_raw["take_profit"] = take_profit_order
-				self._log(verbose, "Take-profit order placed", {"orderId": (take_profit_order.get("orderId") if isinstance(take_profit_order, dict) else None), "tpPrice": tp_price_str, "response": take_profit_order})
-
-			# 9) Trailing Stop (TRAILING_STOP_MARKET)
-			activation = self._round_price(trailing_activation_price, tick_size)
-			activation_str = self._format_by_step(activation, tick_size_str)
-			callback = self._clamp_callback_rate(trailing_callback_percent)
-			# One decimal step for callbackRate
-			callback_str = format((Decimal(str(callback)).quantize(Decimal('0.1'), rounding=ROUND_DOWN)), 'f')
-			# Try to fetch current mark price for diagnostics
-			mark_price_val: Optional[float] = None
-			try:
-				mp = self.client.mark_price(symbol=symbol)
-				# UMFutures.mark_price returns {"symbol":"ETHUSDT","markPrice":"...", ...}
-				mark_price_val = float(mp.get("markPrice")) if isinstance(mp, dict) else None
-			except Exception:
-				mark_price_val = None
-			# Log trailing diagnostics
-			self._log(verbose, "Trailing params", {
-				"side": ("SELL" if side.upper() == "BUY" else "BUY"),
-				"activation": activation_str,
-				"callbackRate": callback_str,
-				"markPrice": mark_price_val,
-			})
-			trailing_stop_payload = {
+				bracket["take_profit"] = {
+					"symbol": symbol,
+					"side": exit_side,
+					"type": "TAKE_PROFIT_MARKET",
+					"stopPrice": self._format_by_step(tp_price, tick_size_str),
+					"closePosition": False,
+					"reduceOnly": reduce_only,
+					"workingType": working_type,
+					"quantity": qty_str,
+					"positionSide": position_side,
+				}
+			bracket["trailing_stop"] = {
 				"symbol": symbol,
-				"side": ("SELL" if side.upper() == "BUY" else "BUY"),
+				"side": exit_side,
 				"type": "TRAILING_STOP_MARKET",
 				"activationPrice": activation_str,
 				"callbackRate": callback_str,
 				"positionSide": position_side,
-				"recvWindow": self.recv_window_ms,
+				"quantity": qty_str,
+				"reduceOnly": reduce_only,
 			}
-			# choose sizing mode
-			trailing_stop_payload["quantity"] = qty_str
-			trailing_stop_payload["reduceOnly"] = reduce_only
-			# Log final payload (without secrets)
-			self._log(verbose, "Trailing payload", trailing_stop_payload)
-			trailing_stop_order = None
-			try:
-				if self.api_mode == "pm":
-					pm_payload = {k: v for k, v in trailing_stop_payload.items() if k != "recvWindow"}
-					trailing_stop_order = self._pm_request("POST", "/papi/v1/um/order", pm_payload)
-				else:
-					trailing_stop_order = self.client.new_order(**trailing_stop_payload)
-				orders_raw["trailing_stop"] = trailing_stop_order
-				self._log(verbose, "Trailing-stop order placed", {"orderId": (trailing_stop_order.get("orderId") if isinstance(trailing_stop_order, dict) else None), "response": trailing_stop_order})
-			except Exception as te:
-				# Non-fatal: keep entry and stop orders active; report in logs
-				self._log(True, "Trailing order failed (non-fatal)", {"error": str(te)})
+			self._log(verbose, "Bracket payloads", bracket)
+
+			# 7) Place the bracket: one batchOrders round trip, sequential orders if batching is off or unavailable
+			placed: Optional[Dict[str, Any]] = None
+			use_batch = self.batch_orders if batch_orders is None else batch_orders
+			if use_batch and not self._batch_unavailable:
+				try:
+					with timer.span("batch"):
+						placed, errors = self._place_bracket_batch(bracket)
+				except Exception as be:
+					if not self._batch_unsupported(be):
+						raise
+					self._batch_unavailable = True
+					self._log(True, "batchOrders unavailable, falling back to sequential placement", {"api_mode": self.api_mode, "error": str(be)})
+
+			if placed is not None:
+				orders_raw.update(placed)
+				self._log(verbose, "Bracket placed in one batch", {name: order.get("orderId") for name, order in placed.items()})
+				if "entry" in errors:
+					# Entry rejected: protective orders from the same batch would be left without a position
+					with timer.span("cancel"):
+						self._cancel_placed(symbol, orders_raw)
+					entry_error = errors["entry"] if isinstance(errors["entry"], dict) else {}
+					code = entry_error.get("code")
+					msg = entry_error.get("msg") or str(errors["entry"])
+					if code in ACCOUNT_SETTINGS_ERROR_CODES:
+						self.invalidate_account_settings(symbol)
+					self._log(True, "Order placement failed", {"error_code": code, "message": msg, "batch_errors": errors})
+					return OrderResult(success=False, message=msg, error_code=code, raw=orders_raw, timings=timer.finish())
+				for name in ("stop", "take_profit"):
+					if name in errors:
+						# A protective order rejected inside the batch is retried alone; a second failure fails the placement
+						self._log(True, "Protective order rejected in batch, retrying alone", {"order": name, "error": errors[name]})
+						try:
+							with timer.span(name):
+								orders_raw[name] = self._send_order(bracket[name])
+						except Exception:
+							# The bracket is incomplete and reported failed: a live entry would be placed again by the caller's retry
+							with timer.span("cancel"):
+								self._cancel_placed(symbol, orders_raw)
+							raise
+						self._log(verbose, "Protective order placed", {"order": name, "response": orders_raw[name]})
+				if "trailing_stop" in errors:
+					# Non-fatal: keep entry and stop orders active; report in logs
+					self._log(True, "Trailing order failed (non-fatal)", {"error": errors["trailing_stop"]})
+			else:
+				with timer.span("entry"):
+					entry_order = self._send_order(bracket["entry"])
+				orders_raw["entry"] = entry_order
+				self._log(verbose, "Entry order placed", {"orderId": entry_order.get("orderId"), "price": limit_price_str, "qty": qty_str, "response": entry_order})
+
+				with timer.span("stop"):
+					stop_order = self._send_order(bracket["stop"])
+				orders_raw["stop"] = stop_order
+				self._log(verbose, "Stop-loss order placed", {"orderId": stop_order.get("orderId"), "stopPrice": stop_price_str, "response": stop_order})
+
+				if "take_profit" in bracket:
+					with timer.span("take_profit"):
+						take_profit_order = self._send_order(bracket["take_profit"])
+					orders_raw["take_profit"] = take_profit_order
+					self._log(verbose, "Take-profit order placed", {"orderId": (take_profit_order.get("orderId") if isinstance(take_profit_order, dict) else None), "tpPrice": bracket["take_profit"]["stopPrice"], "response": take_profit_order})
+
+				try:
+					with timer.span("trailing_stop"):
+						trailing_stop_order = self._send_order(bracket["trailing_stop"])
+					orders_raw["trailing_stop"] = trailing_stop_order
+					self._log(verbose, "Trailing-stop order placed", {"orderId": (trailing_stop_order.get("orderId") if isinstance(trailing_stop_order, dict) else None), "response": trailing_stop_order})
+				except Exception as te:
+					# Non-fatal: keep entry and stop orders active; report in logs
+					self._log(True, "Trailing order failed (non-fatal)", {"error": str(te)})
+
+			# Mark price for trailing diagnostics, fetched after the orders are placed to keep it off the critical path
+			if verbose:
+				try:
+					mark_price_val = self.get_mark_price(symbol)
+				except Exception:
+					mark_price_val = None
+				self._log(verbose, "Trailing params", {
+					"side": exit_side,
+					"activation": activation_str,
+					"callbackRate": callback_str,
+					"markPrice": mark_price_val,
+				})
+
+			# margin is now reserved by the entry order
+			self.balance.request_refresh("available")
 
 			return OrderResult(
 				success=True,
 				message="Orders placed successfully",
 				error_code=None,
-				entry_order=entry_order,
-				stop_order=stop_order,
-				take_profit_order=take_profit_order,
-				trailing_stop_order=trailing_stop_order,
+				entry_order=orders_raw.get("entry"),
+				stop_order=orders_raw.get("stop"),
+				take_profit_order=orders_raw.get("take_profit"),
+				trailing_stop_order=orders_raw.get("trailing_stop"),
 				raw=orders_raw,
+				timings=timer.finish(),
 			)
 
 		except Exception as e:
@@ -870,6 +1067,8 @@ class Binance_connect:
 			if isinstance(e, ClientError):
 				code = getattr(e, "error_code", None) or getattr(e, "status_code", None)
 				msg = getattr(e, "error_message", None) or msg
+			if code in ACCOUNT_SETTINGS_ERROR_CODES:
+				self.invalidate_account_settings(symbol)
 			self._log(True, "Order placement failed", {"error_code": code, "message": msg})
 			return OrderResult(
 				success=False,
@@ -880,6 +1079,7 @@ class Binance_connect:
 				take_profit_order=None,
 				trailing_stop_order=None,
 				raw=orders_raw,
+				timings=timer.finish(),
 			) 
 
 	# -------- Helpers to (re)place trailing only --------
@@ -898,14 +1098,9 @@ class Binance_connect:
 	) -> bool:
 		try:
 			# Load filters for formatting
-			symbol_info = self._get_symbol_info(symbol)
-			filters = self._get_filters(symbol_info)
-			pf = filters.get("PRICE_FILTER", {})
-			ls = filters.get("LOT_SIZE", {})
-			tick_size_str = str(pf.get("tickSize", "0.0001"))
-			step_size_str = str(ls.get("stepSize", "1"))
-			activation_str = self._format_by_step(self._round_price(float(activation_price), float(pf.get("tickSize", 0.0)) or 0.0), tick_size_str)
-			qty_str = self._format_by_step(self._round_qty(float(quantity), float(ls.get("stepSize", 0.0)) or 0.0, float(ls.get("minQty", 0.0)) or 0.0), step_size_str)
+			symbol_filters = self.get_symbol_filters(symbol)
+			activation_str = self._format_by_step(self._round_price(float(activation_price), float(symbol_filters.tick_size)), symbol_filters.tick_size_str)
+			qty_str = self._format_by_step(self._round_qty(float(quantity), float(symbol_filters.step_size), float(symbol_filters.min_qty)), symbol_filters.step_size_str)
 			callback = self._clamp_callback_rate(callback_percent)
 			callback_str = format((Decimal(str(callback)).quantize(Decimal('0.1'), rounding=ROUND_DOWN)), 'f')
 			payload = {
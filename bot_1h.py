@@ -12,9 +12,14 @@ from telebot import types
 
 import aux_funcs as af
 import bot_funcs as bf
+import diagrams as dg
 import levels as lv
+import monte_carlo as mc
+import perf_stats as ps
 from cooldown import Cooldown
 from db_funcs import DB_handler
+from deal_book import ActiveDealBook
+from intrabar import IntrabarResolver
 from user_data.credentials import apikey2
 
 bot = telebot.TeleBot(apikey2)
@@ -24,6 +29,8 @@ chat_id = 234637822
 
 db = DB_handler(config["general"]["db_file_name"])
 db.setup()
+db.start_writer()           # deal writes go through a background thread, telegram reads use read-only connections
+book = ActiveDealBook(db)   # active deals kept in memory, written through to db
 
 pair = "ETHUSDT" # Trading pair
 # pair = "API3USDT" # Trading pair
@@ -44,6 +51,9 @@ except Exception:
 reverse = deal_config['cool_down_reverse']      # config of counting lost deals reverse or direct
 
 cd = Cooldown(config['deal_config'], db, bot, chat_id, reverse=reverse)   
+resolver = IntrabarResolver() if config['general'].get('use_intrabar_resolver', False) else None    # take/stop order inside one candle
+reporter = dg.PerfomanceReporter(db, config['deal_config']['deal_risk_perc_of_bank'] / 100,
+                                  config['general']['initial_bank_for_test_stats'])    # charts in a background thread
 
 
 
@@ -58,26 +68,94 @@ def active_deals(message):
 
 @bot.message_handler(commands=['all_stats'])
 def all_stats(message):
-    mess_text = db.show_perfomance_stats(risk_per_deal=config["deal_config"]["deal_risk_perc_of_bank"], 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.04, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.05, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+    # all variants are computed from a single load of finished deals
+    variants = [ps.StatsVariant(config["deal_config"]["deal_risk_perc_of_bank"] / 100),
+                ps.StatsVariant(0.03),
+                ps.StatsVariant(0.04),
+                ps.StatsVariant(0.05),
+                ps.StatsVariant(0.03, 1.0, 0.35, 'fixed'),
+                ps.StatsVariant(0.03, 1, 0.3, 'best')]
+    for mess_text in db.show_perfomance_stats_all(variants, initial_bank=config["general"]["initial_bank_for_test_stats"]):
+        bot.send_message(message.chat.id, text=mess_text)
+
+@bot.message_handler(commands=['grid_stats'])
+def grid_stats(message):
+    # /grid_stats [fixed|best] <thresholds> <trailing stops> <risks>, ranges as start:stop:step or a,b,c
+    args = message.text.split()[1:]
+    trailing_mode = 'fixed'
+    if args and args[0] in ('fixed', 'best'):
+        trailing_mode = args.pop(0)
+    thresholds, trailing_stops, risks = (args + ['0.5:1.5:0.1', '0.1:0.5:0.05', '0.03'][len(args):])[:3]
+    
+    try:
+        mess_text = ps.grid_report(db, thresholds, trailing_stops, risks, trailing_mode,
+                                   initial_bank=config["general"]["initial_bank_for_test_stats"])
+    except ValueError:
+        mess_text = ('Формат: /grid_stats [fixed|best] 0.5:1.5:0.1 0.1:0.5:0.05 0.01,0.03\n'
+                     f'Шаг больше нуля, конец не меньше начала, не больше {ps.MAX_GRID_POINTS} вариантов')
     bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats_adj(best_price_perc_threshold=1.0, trailing_stop_perc=0.35, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+
+
+@bot.message_handler(commands=['mc_stats'])
+def mc_stats(message):
+    # /mc_stats [risk] [paths] [block days] - Monte Carlo day-block bootstrap of finished deals
+    args = message.text.split()[1:]
+    risk, paths, block_days = (args + ['0.03', '10000', '1'][len(args):])[:3]
+
+    try:
+        mess_text = mc.monte_carlo_report(db, float(risk), min(max(int(paths), 1), 100_000), int(block_days),
+                                          initial_bank=config["general"]["initial_bank_for_test_stats"])
+    except ValueError:
+        mess_text = 'Формат: /mc_stats 0.03 10000 1 (риск на сделку, число путей, дней в блоке)'
     bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats_adj2(best_price_perc_threshold=1, trailing_stop_perc=0.3, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+
+
+@bot.message_handler(commands=['daily_stats'])
+def daily_stats(message):
+    # /daily_stats [days] - deals by day from the materialized daily_stats table
+    args = message.text.split()[1:]
+    try:
+        mess_text = db.show_daily_stats(int(args[0]) if args else 14, config["deal_config"]["deal_risk_perc_of_bank"])
+    except ValueError:
+        mess_text = 'Формат: /daily_stats 14'
     bot.send_message(message.chat.id, text=mess_text)
 
 
+@bot.message_handler(commands=['pair_stats'])
+def pair_stats(message):
+    bot.send_message(message.chat.id, text=db.show_pair_stats())
+
+
+@bot.message_handler(commands=['rebuild_stats'])
+def rebuild_stats(message):
+    error = db.rebuild_stats()
+    bot.send_message(message.chat.id, text=f'SQLite error: {error}' if error else 'Таблицы daily_stats и pair_stats пересчитаны')
+
+
+@bot.message_handler(commands=['perf_chart'])
+def perf_chart(message):
+    # /perf_chart [1h|4h|1d|1w] - bank and results by period, rendered by the reporter thread
+    args = message.text.split()[1:]
+    chat = message.chat.id
+    try:
+        future = reporter.chart(args[0] if args else '1d')
+    except ValueError:
+        bot.send_message(chat, text='Формат: /perf_chart 1d (период: 1h, 4h, 1d, 1w)')
+        return
+
+    def send_chart(done):
+        try:
+            png = done.result()
+        except Exception as error:
+            bot.send_message(chat, text=f'Ошибка построения графика: {error}')
+            return
+        if png is None:
+            bot.send_message(chat, text='Нет завершённых сделок')
+        else:
+            bot.send_photo(chat, png)
+    future.add_done_callback(send_chart)
+
+
 def check_pair(bot, chat_id, pair: str):
 
     levels = []       # list of levels of all checked timeframes at current moment
@@ -106,12 +184,12 @@ def check_pair(bot, chat_id, pair: str):
     if deal:
         print('\n')
     
-    if deal != None and bf.validate_deal(db, deal, deal_config, basic_tf_ohlvc_df, validate_on=True):
+    if deal != None and bf.validate_deal(book, deal, deal_config, basic_tf_ohlvc_df, validate_on=True):
         
         if not cd.status_on():
             deal.pair = pair
             
-            db.add_deal(deal)
+            book.add_deal(deal)
             
             deal_message = f"""
             Найдена сделка:
@@ -181,7 +259,7 @@ def main_func(trading_pairs: list, minute_flag: bool):
                 continue
             
     elif minute_flag:
-        bf.check_active_deals(db, cd, bot, chat_id, reverse=reverse)
+        bf.check_active_deals(book, cd, bot, chat_id, reverse=reverse, resolver=resolver)
         
                     
                 
@@ -12,12 +12,18 @@ from telebot import types
 
 import aux_funcs as af
 import bot_funcs as bf
+import diagrams as dg
 import levels as lv
+import monte_carlo as mc
+import perf_stats as ps
 from cooldown import Cooldown
 from db_funcs import DB_handler
+from deal_book import ActiveDealBook
+from intrabar import IntrabarResolver
 from user_data.credentials import apikey3, sub1_api_key_3, sub1_api_secret_3
 from binance_connect import Binance_connect
 from order_manager import OrderManager
+from user_stream import UserDataStream
 from fast_data import enable_fast_backend, fast_get_ohlcv
 
 bot = telebot.TeleBot(apikey3)
@@ -33,10 +39,28 @@ bnc_conn = Binance_connect(
 	log_to_file=config['general'].get('enable_trade_calc_logging', False),
 	log_file_path='logs/binance_connector.log',
 	api_mode=config['general'].get('futures_api_mode', 'classic'),
+	batch_orders=config['general'].get('futures_batch_orders', True),
+	balance_max_age_sec=config['general'].get('balance_max_age_sec', 60),
+	balance_refresh_sec=config['general'].get('balance_refresh_sec', 60),
+	synced_recv_window_ms=config['general'].get('synced_recv_window_ms', 5000),
+	latency_metrics=config['general'].get('latency_metrics', False),
 )
+# server clock offset for signed PM requests, re-measured in the background
+bnc_conn.time_sync.start()
 order_manager_enabled = bool(config['general'].get('use_order_manager', False))
 om = OrderManager(bnc_conn, config) if order_manager_enabled else None
 om_cleanup_enabled = bool(config['general'].get('enable_om_minute_cleanup', False))
+# event-driven order maintenance: fills and cancels arrive over the user-data stream instead of minute polling
+if om and config['general'].get('use_user_data_stream', False):
+	user_stream = UserDataStream(bnc_conn)
+	om.attach_stream(user_stream)
+	user_stream.start()
+
+# Leverage / margin type already set on the account, so trades skip re-setting them
+try:
+	print(f"Account settings cached for {bnc_conn.load_account_settings()} symbols")
+except Exception as ex:
+	print('Failed to load account settings:', ex)
 
 # Put real bank to config for dynamic pairs filtering
 try:
@@ -45,6 +69,8 @@ try:
 except Exception as ex:
 	print('Failed to fetch wallet balance for dynamic pairs filter:', ex)
 	config['general']['dynamic_pairs_bank'] = config['general'].get('initial_bank_for_test_stats', 0)
+# risk sizing reads the balance from this cache, refreshed in the background
+bnc_conn.balance.start()
 
 # init fast backend
 enable_fast_backend(use_fast=bool(config['general'].get('use_fast_data', False)),
@@ -54,6 +80,8 @@ enable_fast_backend(use_fast=bool(config['general'].get('use_fast_data', False))
 
 db = DB_handler(config["general"]["db_file_name"])
 db.setup()
+db.start_writer()           # deal writes go through a background thread, telegram reads use read-only connections
+book = ActiveDealBook(db)   # active deals kept in memory, written through to db
 
 pair = "ETHUSDT" # Trading pair
 # pair = "API3USDT" # Trading pair
@@ -74,6 +102,9 @@ except Exception:
 reverse = deal_config['cool_down_reverse']      # config of counting lost deals reverse or direct
 
 cd = Cooldown(config['deal_config'], db, bot, chat_id, reverse=reverse)   
+resolver = IntrabarResolver() if config['general'].get('use_intrabar_resolver', False) else None    # take/stop order inside one candle
+reporter = dg.PerfomanceReporter(db, config['deal_config']['deal_risk_perc_of_bank'] / 100,
+                                  config['general']['initial_bank_for_test_stats'])    # charts in a background thread
 
 
 
@@ -88,26 +119,105 @@ def active_deals(message):
 
 @bot.message_handler(commands=['all_stats'])
 def all_stats(message):
-    mess_text = db.show_perfomance_stats(risk_per_deal=config["deal_config"]["deal_risk_perc_of_bank"], 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.04, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-    bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats(risk_per_deal=0.05, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+    # all variants are computed from a single load of finished deals
+    variants = [ps.StatsVariant(config["deal_config"]["deal_risk_perc_of_bank"] / 100),
+                ps.StatsVariant(0.03),
+                ps.StatsVariant(0.04),
+                ps.StatsVariant(0.05),
+                ps.StatsVariant(0.03, 1, 0.3, 'fixed'),
+                ps.StatsVariant(0.03, 1, 0.3, 'best')]
+    for mess_text in db.show_perfomance_stats_all(variants, initial_bank=config["general"]["initial_bank_for_test_stats"]):
+        bot.send_message(message.chat.id, text=mess_text)
+
+@bot.message_handler(commands=['grid_stats'])
+def grid_stats(message):
+    # /grid_stats [fixed|best] <thresholds> <trailing stops> <risks>, ranges as start:stop:step or a,b,c
+    args = message.text.split()[1:]
+    trailing_mode = 'fixed'
+    if args and args[0] in ('fixed', 'best'):
+        trailing_mode = args.pop(0)
+    thresholds, trailing_stops, risks = (args + ['0.5:1.5:0.1', '0.1:0.5:0.05', '0.03'][len(args):])[:3]
+    
+    try:
+        mess_text = ps.grid_report(db, thresholds, trailing_stops, risks, trailing_mode,
+                                   initial_bank=config["general"]["initial_bank_for_test_stats"])
+    except ValueError:
+        mess_text = ('Формат: /grid_stats [fixed|best] 0.5:1.5:0.1 0.1:0.5:0.05 0.01,0.03\n'
+                     f'Шаг больше нуля, конец не меньше начала, не больше {ps.MAX_GRID_POINTS} вариантов')
     bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats_adj(best_price_perc_threshold=1, trailing_stop_perc=0.3, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+
+
+@bot.message_handler(commands=['mc_stats'])
+def mc_stats(message):
+    # /mc_stats [risk] [paths] [block days] - Monte Carlo day-block bootstrap of finished deals
+    args = message.text.split()[1:]
+    risk, paths, block_days = (args + ['0.03', '10000', '1'][len(args):])[:3]
+
+    try:
+        mess_text = mc.monte_carlo_report(db, float(risk), min(max(int(paths), 1), 100_000), int(block_days),
+                                          initial_bank=config["general"]["initial_bank_for_test_stats"])
+    except ValueError:
+        mess_text = 'Формат: /mc_stats 0.03 10000 1 (риск на сделку, число путей, дней в блоке)'
     bot.send_message(message.chat.id, text=mess_text)
-    mess_text = db.show_perfomance_stats_adj2(best_price_perc_threshold=1, trailing_stop_perc=0.3, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
+
+
+@bot.message_handler(commands=['daily_stats'])
+def daily_stats(message):
+    # /daily_stats [days] - deals by day from the materialized daily_stats table
+    args = message.text.split()[1:]
+    try:
+        mess_text = db.show_daily_stats(int(args[0]) if args else 14, config["deal_config"]["deal_risk_perc_of_bank"])
+    except ValueError:
+        mess_text = 'Формат: /daily_stats 14'
     bot.send_message(message.chat.id, text=mess_text)
 
 
+@bot.message_handler(commands=['pair_stats'])
+def pair_stats(message):
+    bot.send_message(message.chat.id, text=db.show_pair_stats())
+
+
+@bot.message_handler(commands=['rebuild_stats'])
+def rebuild_stats(message):
+    error = db.rebuild_stats()
+    bot.send_message(message.chat.id, text=f'SQLite error: {error}' if error else 'Таблицы daily_stats и pair_stats пересчитаны')
+
+
+@bot.message_handler(commands=['perf_chart'])
+def perf_chart(message):
+    # /perf_chart [1h|4h|1d|1w] - bank and results by period, rendered by the reporter thread
+    args = message.text.split()[1:]
+    chat = message.chat.id
+    try:
+        future = reporter.chart(args[0] if args else '1d')
+    except ValueError:
+        bot.send_message(chat, text='Формат: /perf_chart 1d (период: 1h, 4h, 1d, 1w)')
+        return
+
+    def send_chart(done):
+        try:
+            png = done.result()
+        except Exception as error:
+            bot.send_message(chat, text=f'Ошибка построения графика: {error}')
+            return
+        if png is None:
+            bot.send_message(chat, text='Нет завершённых сделок')
+        else:
+            bot.send_photo(chat, png)
+    future.add_done_callback(send_chart)
+
+
+@bot.message_handler(commands=['latency'])
+def latency(message):
+    # /latency [reset] - percentiles of order placement steps, ms
+    if not bnc_conn.latency.enabled:
+        bot.send_message(message.chat.id, text='Замер задержек выключен (general.latency_metrics)')
+        return
+    bot.send_message(message.chat.id, text=bnc_conn.latency.format_summary())
+    if message.text.split()[1:2] == ['reset']:
+        bnc_conn.latency.reset()
+
+
 def _get_df(pair: str, timeframe: str) -> pd.DataFrame:
     if config['general'].get('use_fast_data'):
         return fast_get_ohlcv(pair, timeframe, limit=basic_candle_depth[timeframe], futures=True)
@@ -115,6 +225,18 @@ def _get_df(pair: str, timeframe: str) -> pd.DataFrame:
         return bf.get_ohlcv_data_binance(pair, timeframe, limit=basic_candle_depth[timeframe], futures=True)
 
 
+def _report_placement(pair: str, future):
+    # a trade still queued when the order manager stops is cancelled and has no result
+    if future.cancelled():
+        print(f"{pair}: ERROR: not placed, order manager stopped")
+        return
+    result = future.result()
+    if result.get('success'):
+        print(f"{pair}: OK")
+    else:
+        print(f"{pair}: ERROR:", result.get('message'))
+
+
 def check_pair(bot, chat_id, pair: str):
 
     levels = []       # list of levels of all checked timeframes at current moment
@@ -143,12 +265,12 @@ def check_pair(bot, chat_id, pair: str):
     if deal:
         print('\n')
     
-    if deal != None and bf.validate_deal(db, deal, deal_config, basic_tf_ohlvc_df, validate_on=True):
+    if deal != None and bf.validate_deal(book, deal, deal_config, basic_tf_ohlvc_df, validate_on=True):
         
         if not cd.status_on():
             deal.pair = pair
             
-            db.add_deal(deal)
+            book.add_deal(deal)
                         
             # РАЗМЕЩЕНИЕ РЕАЛЬНОЙ СДЕЛКИ НА БИНАНС
             
@@ -176,7 +298,8 @@ def check_pair(bot, chat_id, pair: str):
                         
                       
             if order_manager_enabled and om:
-                result = om.place_managed_trade(
+                # queued: orders of other pairs found in this scan are placed in parallel, the scan goes on
+                placement = om.submit_managed_trade(
                     symbol=deal.pair,
                     side=side,
                     entry_price=deal.entry_price,
@@ -193,10 +316,7 @@ def check_pair(bot, chat_id, pair: str):
                     deal_id=None,
                     verbose=config['general'].get('enable_trade_calc_logging', False),
                 )
-                if result.get('success'):
-                    print("OK")
-                else:
-                    print("ERROR:", result.get('message'))
+                placement.add_done_callback(lambda future, pair=deal.pair: _report_placement(pair, future))
             else:
                 result = bnc_conn.place_futures_order_with_protection(
                     symbol=deal.pair,
@@ -278,12 +398,10 @@ def func(message):
         trailing_threshold = float(message.text.split(' ')[1])
         trailing_delta = float(message.text.split(' ')[2])
         
-        mess_text = db.show_perfomance_stats_adj(best_price_perc_threshold=trailing_threshold, trailing_stop_perc=trailing_delta, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-        bot.send_message(message.chat.id, text=mess_text)        
-        mess_text = db.show_perfomance_stats_adj2(best_price_perc_threshold=trailing_threshold, trailing_stop_perc=trailing_delta, risk_per_deal=0.03, 
-                                         initial_bank=config["general"]["initial_bank_for_test_stats"])
-        bot.send_message(message.chat.id, text=mess_text)   
+        variants = [ps.StatsVariant(0.03, trailing_threshold, trailing_delta, 'fixed'),
+                    ps.StatsVariant(0.03, trailing_threshold, trailing_delta, 'best')]
+        for mess_text in db.show_perfomance_stats_all(variants, initial_bank=config["general"]["initial_bank_for_test_stats"]):
+            bot.send_message(message.chat.id, text=mess_text)   
     
     elif (message.text == ''):
         pass    
@@ -310,30 +428,11 @@ def main_func(trading_pairs: list, minute_flag: bool):
                 continue
             
     elif minute_flag:
-        bf.check_active_deals(db, cd, bot, chat_id, reverse=reverse)
-        if order_manager_enabled and om and om_cleanup_enabled:
+        bf.check_active_deals(book, cd, bot, chat_id, reverse=reverse, resolver=resolver)
+        if order_manager_enabled and om and om_cleanup_enabled and not om.stream_driven:
             try:
-                # Candidate symbols: non-zero positions
-                symbols = set()
-                try:
-                    for s in bnc_conn.get_nonzero_position_symbols():
-                        if s:
-                            symbols.add(s)
-                except Exception:
-                    pass
-                # Also scan configured pairs for stray open orders to catch garbage after close
-                for s in trading_pairs:
-                    try:
-                        oo = bnc_conn.get_open_orders(s)
-                        if isinstance(oo, list) and len(oo) > 0:
-                            symbols.add(s)
-                    except Exception:
-                        pass
-                for sym in symbols:
-                    try:
-                        om.watch_and_cleanup(sym, verbose=False)
-                    except Exception:
-                        pass
+                # All open orders and positions in two requests, rules for every symbol from that snapshot
+                om.sweep(verbose=False)
             except Exception:
                 pass
         
@@ -359,6 +458,8 @@ else:
 if __name__ == '__main__':
     sсheduled_tasks_thread.start()
     bot.infinity_polling()
+    if om:
+        om.stop()
     # try:
     #     bot.polling(non_stop = True, interval = 0, timeout = 0)
     # except:
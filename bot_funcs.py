@@ -8,6 +8,7 @@ import schedule
 
 import aux_funcs as af
 import indicators as ind
+from exchange_info import shared_exchange_info
 
 
 # Simple in-memory cache for OHLCV data per (pair, timeframe, futures)
@@ -17,8 +18,9 @@ _ohlcv_cache = {}
 # Daily cache for dynamic trading pairs list
 _dynamic_pairs_cache = { 'date': None, 'pairs': [] }
 
-# Daily cache for valid UM futures symbols
-_valid_um_usdt_cache = { 'date': None, 'symbols': set() }
+# REST roots of public market data (mock_exchange.route_public_data points them at a local mock)
+FUTURES_BASE_URL = "https://fapi.binance.com"
+SPOT_BASE_URL = "https://api.binance.com"
 
 
 def timestamp() -> str:
@@ -32,8 +34,8 @@ def load_config(config_file_name: str) -> dict:
 
 def get_ohlcv_data_binance(pair: str, timeframe: str, limit: int = 100, futures: bool = False) -> pd.DataFrame:
 		
-	url = f"https://api.binance.com/api/v3/klines?symbol={pair}&interval={timeframe}&limit={limit}"	
-	url_futures = f"https://fapi.binance.com/fapi/v1/klines?symbol={pair}&interval={timeframe}&limit={limit}"
+	url = f"{SPOT_BASE_URL}/api/v3/klines?symbol={pair}&interval={timeframe}&limit={limit}"	
+	url_futures = f"{FUTURES_BASE_URL}/fapi/v1/klines?symbol={pair}&interval={timeframe}&limit={limit}"
 
 	key = (pair, timeframe, futures)
 
@@ -67,8 +69,8 @@ def get_ohlcv_data_binance(pair: str, timeframe: str, limit: int = 100, futures:
 			return _ohlcv_cache[key]['df'].copy()
 
 		# Incremental update path: fetch just the latest 2 candles (to get last closed)
-		inc_url = f"https://api.binance.com/api/v3/klines?symbol={pair}&interval={timeframe}&limit=2"
-		inc_url_futures = f"https://fapi.binance.com/fapi/v1/klines?symbol={pair}&interval={timeframe}&limit=2"
+		inc_url = f"{SPOT_BASE_URL}/api/v3/klines?symbol={pair}&interval={timeframe}&limit=2"
+		inc_url_futures = f"{FUTURES_BASE_URL}/fapi/v1/klines?symbol={pair}&interval={timeframe}&limit=2"
 		if futures:
 			inc_resp = requests.get(inc_url_futures)
 		else:
@@ -130,23 +132,12 @@ def get_ohlcv_data_binance(pair: str, timeframe: str, limit: int = 100, futures:
 # -------- Dynamic trading pairs (daily top-N by volume) --------
 
 def _get_valid_um_usdt_symbols() -> set[str]:
-	current_date = dt.utcnow().date()
-	if _valid_um_usdt_cache['date'] == current_date and _valid_um_usdt_cache['symbols']:
-		return _valid_um_usdt_cache['symbols']
+	# exchange_info keeps the parsed exchangeInfo for an hour, shared with Binance_connect
 	try:
-		info_url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-		resp = requests.get(info_url)
-		data = resp.json()
-		symbols = set()
-		for sym in data.get('symbols', []):
-			if sym.get('contractType') == 'PERPETUAL' and sym.get('quoteAsset') == 'USDT' and sym.get('status') == 'TRADING':
-				symbols.add(sym.get('symbol'))
-		_valid_um_usdt_cache['date'] = current_date
-		_valid_um_usdt_cache['symbols'] = symbols
-		return symbols
+		return set(shared_exchange_info().um_usdt_perpetuals())
 	except Exception as ex:
 		print(f"{timestamp()} - Failed to fetch exchangeInfo: {ex}")
-		return _valid_um_usdt_cache['symbols'] or set()
+		return set()
 
 
 def fetch_top_usdt_futures_pairs(top_n: int) -> list[str]:
@@ -155,7 +146,7 @@ def fetch_top_usdt_futures_pairs(top_n: int) -> list[str]:
 	Возвращает список символов, например ["BTCUSDT", "ETHUSDT", ...]
 	"""
 	try:
-		url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
+		url = f"{FUTURES_BASE_URL}/fapi/v1/ticker/24hr"
 		resp = requests.get(url)
 		data = resp.json()
 		valid = _get_valid_um_usdt_symbols()
@@ -181,20 +172,8 @@ def _fetch_filters_map() -> dict:
 	Возвращает карту символ -> (tickSize, stepSize, minQty, minNotional)
 	"""
 	try:
-		info_url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-		resp = requests.get(info_url)
-		data = resp.json()
-		result = {}
-		for sym in data.get('symbols', []):
-			if sym.get('contractType') == 'PERPETUAL' and sym.get('quoteAsset') == 'USDT' and sym.get('status') == 'TRADING':
-				filters = {f.get('filterType'): f for f in sym.get('filters', [])}
-				tick = float(filters.get('PRICE_FILTER', {}).get('tickSize', 0) or 0)
-				step = float(filters.get('LOT_SIZE', {}).get('stepSize', 0) or 0)
-				min_qty = float(filters.get('LOT_SIZE', {}).get('minQty', 0) or 0)
-				mn = filters.get('MIN_NOTIONAL', {})
-				min_notional = float(mn.get('notional', mn.get('minNotional', 0)) or 0)
-				result[sym.get('symbol')] = (tick, step, min_qty, min_notional)
-		return result
+		return {symbol: (float(filters.tick_size), float(filters.step_size), float(filters.min_qty), float(filters.min_notional))
+				for symbol, filters in shared_exchange_info().um_usdt_perpetuals().items()}
 	except Exception as ex:
 		print(f"{timestamp()} - Failed to fetch filters map: {ex}")
 		return {}
@@ -206,7 +185,7 @@ def _fetch_prices_map(symbols: list[str]) -> dict:
 	"""
 	result = {}
 	try:
-		url = "https://fapi.binance.com/fapi/v1/ticker/price"
+		url = f"{FUTURES_BASE_URL}/fapi/v1/ticker/price"
 		resp = requests.get(url)
 		data = resp.json()
 		wanted = set(symbols)
@@ -470,7 +449,18 @@ def set_schedule_dynamic(timeframe: str, task, config: dict):
 			print(Exception)
 
 
-def update_current_deal_price(db, deal: object, current_price: float):
+def stage_deal_change(changes: dict, deal: object, column: str, value):
+	"""Collects a column change of the deal to be written later by DB_handler.update_deals_bulk"""
+	changes.setdefault(deal.deal_id, {})[column] = value
+
+
+def flush_deal_changes(db, changes: dict):
+	if changes:
+		db.update_deals_bulk(list(changes.items()))
+		changes.clear()
+
+
+def update_current_deal_price(changes: dict, deal: object, current_price: float):
 	
 	if deal.direction == 'long':
 		current_price_perc = round((current_price - deal.entry_price) / deal.entry_price * 100, 2)
@@ -478,26 +468,37 @@ def update_current_deal_price(db, deal: object, current_price: float):
 		current_price_perc = round((current_price - deal.entry_price) / deal.entry_price * 100, 2) * -1
 		
 	
-	db.update_deal_data('current_price', current_price, deal.deal_id)
-	db.update_deal_data('current_price_perc', current_price_perc, deal.deal_id)
+	stage_deal_change(changes, deal, 'current_price', current_price)
+	stage_deal_change(changes, deal, 'current_price_perc', current_price_perc)
 	
-def update_best_price(db, deal: object, best_price: float):
+def update_best_price(changes: dict, deal: object, best_price: float):
 	
 	best_price_perc = abs(round((best_price - deal.entry_price) / deal.entry_price * 100, 2))
 	
-	db.update_deal_data('best_price', af.r_signif(best_price, 4), deal.deal_id)
-	db.update_deal_data('best_price_perc', best_price_perc, deal.deal_id)
+	stage_deal_change(changes, deal, 'best_price', af.r_signif(best_price, 4))
+	stage_deal_change(changes, deal, 'best_price_perc', best_price_perc)
 
 
-def update_worst_price(db, deal: object, worst_price: float):
+def update_worst_price(changes: dict, deal: object, worst_price: float):
 	
 	worst_price_perc = abs(round((worst_price - deal.entry_price) / deal.entry_price * 100, 2))
 	
-	db.update_deal_data('worst_price', af.r_signif(worst_price, 4), deal.deal_id)
-	db.update_deal_data('worst_price_perc', worst_price_perc, deal.deal_id)
+	stage_deal_change(changes, deal, 'worst_price', af.r_signif(worst_price, 4))
+	stage_deal_change(changes, deal, 'worst_price_perc', worst_price_perc)
 
 
-def update_active_deals(db: object, cd: object, bot: object, chat_id: int, active_deals: list[object], last_candle: object, reverse: bool = True):
+def update_active_deals(db: object, cd: object, bot: object, chat_id: int, active_deals: list[object], last_candle: object, reverse: bool = True,
+						changes: dict = None, finish_time: str = None, resolver: object = None, timeframe: str = '1m'):
+	"""Checks active deals against the last candle. Changes are staged into 'changes' and written by the caller;
+	if 'changes' is not given they are written at the end in one transaction.
+	finish_time overrides the current time for finished deals (backtest).
+	If the candle crossed both take and stop, resolver (intrabar.IntrabarResolver) tells which was first,
+	without it the take wins"""
+	
+	own_changes = changes is None
+	if own_changes:
+		changes = {}
+	finish_time = finish_time or timestamp()
 	
 	last_candle_high = af.r_signif(float(last_candle.High), 4)
 	last_candle_low = af.r_signif(float(last_candle.Low), 4)
@@ -505,17 +506,21 @@ def update_active_deals(db: object, cd: object, bot: object, chat_id: int, activ
 	
 	for deal in active_deals:
 		
-		update_current_deal_price(db, deal, last_cande_close)
+		update_current_deal_price(changes, deal, last_cande_close)
 		
 		if deal.direction == 'long':
 			
-			if last_candle_high > deal.take_price:
-				db.update_deal_data('status', 'win', deal.deal_id)
-				db.update_deal_data('finish_time', timestamp(), deal.deal_id)
-				update_best_price(db, deal, last_candle_high)
+			take_hit = last_candle_high > deal.take_price
+			if take_hit and last_candle_low < deal.stop_price and resolver is not None:
+				take_hit = resolver.resolve(deal.pair, deal.direction, deal.take_price, deal.stop_price, int(last_candle.O_time), timeframe) != 'loss'
+			
+			if take_hit:
+				stage_deal_change(changes, deal, 'status', 'win')
+				stage_deal_change(changes, deal, 'finish_time', finish_time)
+				update_best_price(changes, deal, last_candle_high)
         
 				if last_candle_low < deal.worst_price:
-					update_worst_price(db, deal, last_candle_low)					
+					update_worst_price(changes, deal, last_candle_low)					
 					
 				send_win_message(bot, chat_id, deal)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Won')
@@ -524,11 +529,11 @@ def update_active_deals(db: object, cd: object, bot: object, chat_id: int, activ
 					cd.add_lost_deal(bot, chat_id)
 				
 			elif last_candle_low < deal.stop_price:
-				db.update_deal_data('status', 'loss', deal.deal_id)
-				db.update_deal_data('finish_time', timestamp(), deal.deal_id)
-				update_worst_price(db, deal, last_candle_low) 
+				stage_deal_change(changes, deal, 'status', 'loss')
+				stage_deal_change(changes, deal, 'finish_time', finish_time)
+				update_worst_price(changes, deal, last_candle_low) 
 				if last_candle_high > deal.best_price:
-					update_best_price(db, deal, last_candle_high)
+					update_best_price(changes, deal, last_candle_high)
 				
 				send_loss_message(bot, chat_id, deal)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Lost')
@@ -537,22 +542,26 @@ def update_active_deals(db: object, cd: object, bot: object, chat_id: int, activ
 					cd.add_lost_deal(bot, chat_id)
 				
 			elif last_candle_high > deal.best_price:
-				update_best_price(db, deal, last_candle_high)
+				update_best_price(changes, deal, last_candle_high)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Best price updated')
 								
 			elif last_candle_low < deal.worst_price:
-				update_worst_price(db, deal, last_candle_low) 
+				update_worst_price(changes, deal, last_candle_low) 
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Worst price updated')
 							  
 		elif deal.direction == 'short':
 			
-			if last_candle_low < deal.take_price:
-				db.update_deal_data('status', 'win', deal.deal_id)
-				db.update_deal_data('finish_time', timestamp(), deal.deal_id)
-				update_best_price(db, deal, last_candle_low)
+			take_hit = last_candle_low < deal.take_price
+			if take_hit and last_candle_high > deal.stop_price and resolver is not None:
+				take_hit = resolver.resolve(deal.pair, deal.direction, deal.take_price, deal.stop_price, int(last_candle.O_time), timeframe) != 'loss'
+			
+			if take_hit:
+				stage_deal_change(changes, deal, 'status', 'win')
+				stage_deal_change(changes, deal, 'finish_time', finish_time)
+				update_best_price(changes, deal, last_candle_low)
 				
 				if last_candle_high > deal.worst_price:
-					update_worst_price(db, deal, last_candle_high) 
+					update_worst_price(changes, deal, last_candle_high) 
 				
 				send_win_message(bot, chat_id, deal)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Won')
@@ -561,11 +570,11 @@ def update_active_deals(db: object, cd: object, bot: object, chat_id: int, activ
 					cd.add_lost_deal(bot, chat_id)
 				
 			elif last_candle_high > deal.stop_price:
-				db.update_deal_data('status', 'loss', deal.deal_id)
-				db.update_deal_data('finish_time', timestamp(), deal.deal_id)
-				update_worst_price(db, deal, last_candle_high)
+				stage_deal_change(changes, deal, 'status', 'loss')
+				stage_deal_change(changes, deal, 'finish_time', finish_time)
+				update_worst_price(changes, deal, last_candle_high)
 				if last_candle_low < deal.best_price:
-					update_best_price(db, deal, last_candle_low)
+					update_best_price(changes, deal, last_candle_low)
 								
 				send_loss_message(bot, chat_id, deal)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Lost')
@@ -574,15 +583,18 @@ def update_active_deals(db: object, cd: object, bot: object, chat_id: int, activ
 					cd.add_lost_deal(bot, chat_id)
 				
 			elif last_candle_low < deal.best_price:
-				update_best_price(db, deal, last_candle_low)
+				update_best_price(changes, deal, last_candle_low)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Best price updated')
 								
 			elif last_candle_high > deal.worst_price:
-				update_worst_price(db, deal, last_candle_high)
+				update_worst_price(changes, deal, last_candle_high)
 				print(f'Deal id {deal.deal_id}, {deal.pair}, {deal.direction} - Worst price updated')
 						   
 		else:
 			print('Direction of the deal is not specified!')
+	
+	if own_changes:
+		flush_deal_changes(db, changes)
 			
 
 
@@ -631,11 +643,12 @@ def send_loss_message(bot, chat_id, deal):
 		
 		
 
-def check_active_deals(db, cd, bot, chat_id, reverse):
+def check_active_deals(db, cd, bot, chat_id, reverse, resolver: object = None):
 	
 	active_deal_pairs = db.get_active_deals_list()
 	# print(f'{active_deal_pairs=}')
 	
+	changes = {}	# staged deal column changes of the whole tick, written in one transaction
 	
 	for pair in active_deal_pairs:
 		try:
@@ -648,12 +661,14 @@ def check_active_deals(db, cd, bot, chat_id, reverse):
 			# get active deals from database    
 			active_deals = db.read_active_deals(pair)
 			#check and update active deals for result or best/worst price
-			update_active_deals(db, cd, bot, chat_id, active_deals, last_candle, reverse=reverse)  
+			update_active_deals(db, cd, bot, chat_id, active_deals, last_candle, reverse=reverse, changes=changes, resolver=resolver)  
 		except Exception as ex:
 			print(f'{timestamp()} - Some fucking error happened')
 			print(ex)
 			continue
 	
+	flush_deal_changes(db, changes)
+	
 
 def validate_deal(db: object, deal: object, deal_config: dict, basic_tf_ohlvc_df: pd.DataFrame, validate_on: bool = False):
 			
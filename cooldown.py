@@ -4,18 +4,19 @@ from datetime import datetime as dt
 
 class Cooldown():
     
-    def __init__(self, deal_config: dict, db: object, bot: object, chat_id: int, reverse: bool = False):
+    def __init__(self, deal_config: dict, db: object, bot: object, chat_id: int, reverse: bool = False, now=dt.now):
         
         print(f'\n!!! Cooldown is set up for {"REVERSE" if reverse else "DIRECT"} deal making.\n')
         
         self.db = db
+        self.now = now      # clock, replaced by the simulated time in backtest
         self.REVERSE = reverse
         self.CHECK_PERIOD = datetime.timedelta(hours=deal_config['cool_down_check_period'])
         self.LOSS_QUANTITY = deal_config['cool_down_loss_quantity']
         self.LENGTH = datetime.timedelta(hours=deal_config['cool_down_length'])
         
-        self.start_time = dt.now()
-        self.finish_time = dt.now()
+        self.start_time = self.now()
+        self.finish_time = self.now()
         
         self.check_existing_cooldown(bot, chat_id)
         
@@ -24,14 +25,14 @@ class Cooldown():
         
     def add_lost_deal(self, bot: object, chat_id: int):
         if len(self.lost_deals_timestamps) < self.LOSS_QUANTITY:
-            self.lost_deals_timestamps.append(dt.now())
+            self.lost_deals_timestamps.append(self.now())
         else:
-            self.lost_deals_timestamps.append(dt.now())
+            self.lost_deals_timestamps.append(self.now())
             self.lost_deals_timestamps.pop(0)
             
             if self.lost_deals_timestamps[-1] - self.lost_deals_timestamps[0] <= self.CHECK_PERIOD:
-                self.start_time = dt.now()
-                self.finish_time = dt.now() + self.LENGTH
+                self.start_time = self.now()
+                self.finish_time = self.now() + self.LENGTH
                 
                 self.send_cooldown_set_messages(bot, chat_id)   
                 
@@ -47,7 +48,7 @@ class Cooldown():
         
         
     def status_on(self) -> bool:
-        if dt.now() <= self.finish_time:
+        if self.now() <= self.finish_time:
             return True
         else:
             return False
@@ -1,19 +1,145 @@
+import atexit
 import copy
 import os
 import re
 import shutil
 import sqlite3
+import threading
 from datetime import datetime as dt
 from datetime import timedelta
 from typing import Dict, List
 from xmlrpc.client import Boolean
 
+import numpy as np
 import pandas as pd
 import portion as p
 
 import aux_funcs as af
 import bot_funcs as bf
 import levels as lv
+import perf_stats as ps
+from db_writer import DB_writer
+
+
+# Schema revision stored in PRAGMA user_version. Bump it together with a new step in DB_handler._migrate()
+SCHEMA_VERSION = 3
+
+# Times are stored as integer epoch milliseconds (created_ms, finish_ms). The old text columns datetime and
+# finish_time keep the same moment in local time, written together with the integer columns, so SELECT * column order,
+# conditions on datetime and the ad-hoc SQL scripts keep working. They are plain columns because SQLite does not
+# allow 'localtime' in generated columns.
+DEALS_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS {table_name} (
+    deal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    profit_loss REAL NOT NULL,
+    entry_price REAL NOT NULL,
+    take_price REAL NOT NULL,
+    stop_price REAL NOT NULL,
+    take_dist_perc REAL NOT NULL,
+    stop_dist_perc REAL NOT NULL,
+    best_price REAL,
+    worst_price REAL,
+    best_price_perc REAL,
+    worst_price_perc REAL,
+    current_price REAL,
+    current_price_perc REAL,
+    status TEXT NOT NULL,
+    finish_time TEXT,
+    indicators TEXT,
+    created_ms INTEGER NOT NULL,
+    finish_ms INTEGER);
+    """
+
+# text time columns callers may still update; the integer column is written together with the text
+TIME_COLUMNS = {'datetime': 'created_ms', 'finish_time': 'finish_ms'}
+
+# Materialized aggregates of sql_queries*.sql, kept up to date by triggers on deals, so they change in the same
+# transaction as the deal itself. Days are the local creation date of the deal, like strftime('%Y-%m-%d', datetime).
+# win_units - sum of profit_loss of won deals (direct strategy result in units of risk, a loss is -1 unit),
+# reverse_units - sum of 1 / profit_loss of lost deals (what the reversed deal would have taken).
+STATS_TABLES = {'daily_stats': 'date', 'pair_stats': 'pair'}
+
+STATS_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS {table_name} (
+    {key} TEXT PRIMARY KEY,
+    deals INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    win_units REAL NOT NULL DEFAULT 0,
+    reverse_units REAL NOT NULL DEFAULT 0,
+    loss_stop_dist_perc REAL NOT NULL DEFAULT 0);
+    """
+
+STATS_KEYS = {'date': "strftime('%Y-%m-%d', {row}.datetime)", 'pair': '{row}.pair'}
+
+STATS_COLUMNS = {
+    'deals': '1',
+    'wins': "({row}.status = 'win')",
+    'losses': "({row}.status = 'loss')",
+    'win_units': "(CASE WHEN {row}.status = 'win' THEN {row}.profit_loss ELSE 0 END)",
+    'reverse_units': "(CASE WHEN {row}.status = 'loss' THEN 1.0 / {row}.profit_loss ELSE 0 END)",
+    'loss_stop_dist_perc': "(CASE WHEN {row}.status = 'loss' THEN {row}.stop_dist_perc ELSE 0 END)",
+}
+
+# columns the aggregates depend on; price updates of active deals don't fire the update trigger
+STATS_SOURCE_COLUMNS = ('status', 'pair', 'datetime', 'profit_loss', 'stop_dist_perc')
+
+
+def _stats_upsert(table_name: str, row: str, sign: str) -> str:
+    """Adds (sign '+') or removes (sign '-') the contribution of trigger row OLD/NEW to a stats table"""
+    key = STATS_TABLES[table_name]
+    columns = ', '.join(STATS_COLUMNS)
+    values = ', '.join(f'{sign}{value.format(row=row)}' for value in STATS_COLUMNS.values())
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in STATS_COLUMNS)
+    return f"""INSERT INTO {table_name} ({key}, {columns}) VALUES ({STATS_KEYS[key].format(row=row)}, {values})
+        ON CONFLICT({key}) DO UPDATE SET {updates};"""
+
+
+def stats_trigger_queries() -> list:
+    remove_old = ''.join(_stats_upsert(table_name, 'OLD', '-') for table_name in STATS_TABLES)
+    add_new = ''.join(_stats_upsert(table_name, 'NEW', '+') for table_name in STATS_TABLES)
+    changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in STATS_SOURCE_COLUMNS)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS deals_stats_insert AFTER INSERT ON deals BEGIN {add_new} END;',
+        f"""CREATE TRIGGER IF NOT EXISTS deals_stats_update AFTER UPDATE OF {', '.join(STATS_SOURCE_COLUMNS)} ON deals
+        WHEN {changed} BEGIN {remove_old} {add_new} END;""",
+        f'CREATE TRIGGER IF NOT EXISTS deals_stats_delete AFTER DELETE ON deals BEGIN {remove_old} END;',
+    ]
+
+
+def stats_rebuild_queries() -> list:
+    queries = []
+    for table_name, key in STATS_TABLES.items():
+        sums = ', '.join(f"SUM({value.format(row='deals')})" for value in STATS_COLUMNS.values())
+        queries += [
+            f'DELETE FROM {table_name};',
+            f"""INSERT INTO {table_name} ({key}, {', '.join(STATS_COLUMNS)})
+            SELECT {STATS_KEYS[key].format(row='deals')} AS stats_key, {sums} FROM deals GROUP BY stats_key;""",
+        ]
+    return queries
+
+
+def to_epoch_ms(value) -> int:
+    """Local naive datetime or '%Y-%m-%d %H:%M:%S' local time string -> epoch milliseconds"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = dt.strptime(value, '%Y-%m-%d %H:%M:%S')
+    return int(value.timestamp() * 1000)
+
+
+def from_epoch_ms(ms: int) -> dt:
+    """Epoch milliseconds -> local naive datetime (comparable with dt.now())"""
+    return dt.fromtimestamp(ms / 1000)
+
+
+def epoch_ms_to_text(ms: int) -> str:
+    """Epoch milliseconds -> '%Y-%m-%d %H:%M:%S' local time, the text of the datetime/finish_time columns"""
+    if ms is None:
+        return None
+    return from_epoch_ms(ms).strftime('%Y-%m-%d %H:%M:%S')
 
 
 class DB_handler():
@@ -23,30 +149,127 @@ class DB_handler():
         self.connection = sqlite3.connect(dbname, check_same_thread=False)
         self.cursor = self.connection.cursor()
         self.flag = ''
+        self.writer: DB_writer = None       # write-behind thread, see start_writer()
+        self.next_deal_id = None            # deal ids are assigned here while the writer is on
+        self.id_lock = threading.Lock()
+        self.readers = threading.local()    # per-thread read-only connections
+        
+    def _read_cursor(self) -> sqlite3.Cursor:
+        """Cursor for SELECTs. With the writer on, each thread reads through its own read-only connection,
+        so telegram handlers and the schedule thread never share the writer's connection"""
+        if self.writer is None:
+            return self.cursor
+        connection = getattr(self.readers, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.dbname}?mode=ro', uri=True)
+            connection.execute('PRAGMA busy_timeout=5000;')
+            connection.execute('PRAGMA mmap_size=268435456;')
+            self.readers.connection = connection
+        return connection.cursor()
+    
+    def start_writer(self, batch_interval: float = 0.5):
+        """Moves all deal writes to a background DB_writer thread. Call after setup()"""
+        if self.writer is not None:
+            return
+        self.cursor.execute('SELECT MAX(deal_id) FROM deals;')
+        self.next_deal_id = (self.cursor.fetchone()[0] or 0) + 1
+        self.writer = DB_writer(self.dbname, batch_interval=batch_interval)
+        self.writer.start()
+        atexit.register(self.stop_writer)
+    
+    def flush(self, timeout: float = None) -> bool:
+        """Barrier: waits until all writes queued so far are committed"""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+    
+    def stop_writer(self, timeout: float = 10):
+        if self.writer is not None:
+            self.writer.stop(timeout)
+    
+    def _configure_connection(self):
+        # WAL lets telegram stats readers work while the scan thread writes; NORMAL sync is safe with WAL
+        pragmas = [
+            'PRAGMA journal_mode=WAL;',
+            'PRAGMA synchronous=NORMAL;',
+            'PRAGMA cache_size=-16000;',      # ~16 MB page cache (negative value is in KiB)
+            'PRAGMA mmap_size=268435456;',    # 256 MB memory-mapped reads
+            'PRAGMA temp_store=MEMORY;',
+            'PRAGMA busy_timeout=5000;',
+        ]
+        try:
+            for pragma in pragmas:
+                self.cursor.execute(pragma)
+        except sqlite3.Error as error:
+            print('SQLite error: ', error)
+            return error
+    
+    def _migrate(self):
+        """Brings existing deals*.sqlite files up to SCHEMA_VERSION step by step"""
+        try:
+            version = self.cursor.execute('PRAGMA user_version;').fetchone()[0]
+            
+            if version < 1:
+                # Indexes for the minute job filters (status/pair/direction) and for the cooldown lookups by finish_time
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_status_pair ON deals (status, pair);')
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_status_direction ON deals (status, direction);')
+                self.cursor.execute("""CREATE INDEX IF NOT EXISTS idx_deals_finished ON deals (status, finish_time)
+                                    WHERE status IN ('win', 'loss');""")
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_exchange_orders_symbol ON exchange_orders (symbol, status);')
+                self.cursor.execute('PRAGMA user_version = 1;')
+            
+            if version < 2:
+                self.cursor.execute('BEGIN;')
+                columns = [column[1] for column in self.cursor.execute('PRAGMA table_xinfo(deals);').fetchall()]
+                if 'created_ms' not in columns:
+                    # One-off rebuild of the old TEXT-time table: the local text is kept, 'utc' modifier converts it to epoch
+                    self.cursor.execute(DEALS_TABLE_QUERY.format(table_name='deals_v2'))
+                    self.cursor.execute("""
+                    INSERT INTO deals_v2 (deal_id, datetime, pair, timeframe, direction, profit_loss, entry_price, take_price, 
+                    stop_price, take_dist_perc, stop_dist_perc, best_price, worst_price, best_price_perc, worst_price_perc, 
+                    current_price, current_price_perc, status, finish_time, indicators, created_ms, finish_ms)
+                    SELECT deal_id, datetime, pair, timeframe, direction, profit_loss, entry_price, take_price, 
+                    stop_price, take_dist_perc, stop_dist_perc, best_price, worst_price, best_price_perc, worst_price_perc, 
+                    current_price, current_price_perc, COALESCE(status, 'active'), NULLIF(finish_time, ''), indicators,
+                    CAST(strftime('%s', datetime, 'utc') AS INTEGER) * 1000,
+                    CASE WHEN finish_time IS NULL OR finish_time = '' THEN NULL 
+                         ELSE CAST(strftime('%s', finish_time, 'utc') AS INTEGER) * 1000 END
+                    FROM deals;
+                    """)
+                    self.cursor.execute('DROP TABLE deals;')
+                    self.cursor.execute('ALTER TABLE deals_v2 RENAME TO deals;')
+                    print('Deals table migrated to integer epoch timestamps')
+                self.cursor.execute('DROP INDEX IF EXISTS idx_deals_finished;')
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_status_pair ON deals (status, pair);')
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_status_direction ON deals (status, direction);')
+                self.cursor.execute("""CREATE INDEX IF NOT EXISTS idx_deals_finished ON deals (status, finish_ms)
+                                    WHERE status IN ('win', 'loss');""")
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_created ON deals (created_ms);')
+                self.cursor.execute('PRAGMA user_version = 2;')
+
+            if version < 3:
+                # daily_stats / pair_stats maintained by triggers, filled once from existing deals
+                if not self.connection.in_transaction:
+                    self.cursor.execute('BEGIN;')
+                for table_name, key in STATS_TABLES.items():
+                    self.cursor.execute(STATS_TABLE_QUERY.format(table_name=table_name, key=key))
+                for query in stats_trigger_queries() + stats_rebuild_queries():
+                    self.cursor.execute(query)
+                self.cursor.execute('PRAGMA user_version = 3;')
+
+            self.connection.commit()
+            self.cursor.execute('PRAGMA optimize;')
+        except sqlite3.Error as error:
+            self.connection.rollback()
+            print('SQLite error: ', error)
+            return error
         
     def setup(self):
-        query = """CREATE TABLE IF NOT EXISTS deals (
-            deal_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            datetime TEXT NOT NULL,
-            pair TEXT NOT NULL,
-            timeframe TEXT NOT NULL,
-            direction TEXT NOT NULL,
-            profit_loss REAL NOT NULL,
-            entry_price REAL NOT NULL,
-            take_price REAL NOT NULL,
-            stop_price REAL NOT NULL,
-            take_dist_perc REAL NOT NULL,
-            stop_dist_perc REAL NOT NULL,
-            best_price REAL,
-            worst_price REAL,
-            best_price_perc REAL,
-            worst_price_perc REAL,
-            current_price REAL,
-            current_price_perc REAL,
-            status TEXT,
-            finish_time TEXT,
-            indicators TEXT);
-            """
+        error = self._configure_connection()
+        if error:
+            return error
+        
+        query = DEALS_TABLE_QUERY.format(table_name='deals')
         try:    
             self.cursor.execute(query)
             self.connection.commit()
@@ -79,77 +302,130 @@ class DB_handler():
             print('SQLite error: ', error)
             return error
         
-    def add_deal(self, deal):
+        return self._migrate()
+        
+    def add_deal(self, deal, created_ms: int = None) -> lv.Deal:
+        """Writes the deal and sets deal.deal_id. Returns the deal as it is stored (rounded prices, text timestamp).
+        created_ms overrides the creation time (backtest)"""
         query = """
-        INSERT INTO deals (datetime, pair, timeframe, direction, profit_loss, entry_price, take_price, stop_price, take_dist_perc, 
-        stop_dist_perc, best_price, worst_price, best_price_perc, worst_price_perc, current_price, current_price_perc, status, indicators)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?); 
+        INSERT INTO deals (deal_id, datetime, pair, timeframe, direction, profit_loss, entry_price, take_price, stop_price, take_dist_perc, 
+        stop_dist_perc, best_price, worst_price, best_price_perc, worst_price_perc, current_price, current_price_perc, status, finish_time, 
+        indicators, created_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?); 
         """
+        if created_ms is None:
+            created_ms = to_epoch_ms(dt.now())
+        row = [None, epoch_ms_to_text(created_ms), deal.pair, deal.timeframe, deal.direction, 
+               deal.profit_loss_ratio, af.r_signif(deal.entry_price, 4), 
+               af.r_signif(deal.take_price, 4), af.r_signif(deal.stop_price, 4), deal.take_dist_perc, 
+               deal.stop_dist_perc, deal.best_price, deal.worst_price, deal.best_price_perc, deal.worst_price_perc,
+               deal.current_price, deal.current_price_perc, deal.status, None, deal.indicators, created_ms]
         try:
-            self.cursor.execute(query, (dt.strftime(dt.now(), '%Y-%m-%d %H:%M:%S'), deal.pair, deal.timeframe, deal.direction, 
-                                        deal.profit_loss_ratio, af.r_signif(deal.entry_price, 4), 
-                                        af.r_signif(deal.take_price, 4), af.r_signif(deal.stop_price, 4), deal.take_dist_perc, 
-                                        deal.stop_dist_perc, deal.best_price, deal.worst_price, deal.best_price_perc, deal.worst_price_perc,
-                                        deal.current_price, deal.current_price_perc, deal.status, deal.indicators))
-            self.connection.commit()
+            if self.writer is not None:
+                with self.id_lock:
+                    row[0] = self.next_deal_id
+                    self.next_deal_id += 1
+                self.writer.submit(query, tuple(row))
+            else:
+                self.cursor.execute(query, tuple(row))
+                self.connection.commit()
+                row[0] = self.cursor.lastrowid
+            deal.deal_id = row[0]
+            # same column order as SELECT *
+            return self._row_to_deal(row)
         except sqlite3.Error as error:
             print('SQLite error: ', error)
             return error
+    
+    def _row_to_deal(self, deal: tuple) -> lv.Deal:
+        return lv.Deal(
+            deal_id=deal[0],
+            timestamp=deal[1],
+            pair=deal[2],
+            timeframe=deal[3],
+            direction=deal[4],
+            profit_loss_ratio=deal[5],
+            entry_price=deal[6],
+            take_price=deal[7],
+            stop_price=deal[8],
+            take_dist_perc=deal[9],
+            stop_dist_perc=deal[10],
+            best_price=deal[11],
+            worst_price=deal[12],
+            best_price_perc=deal[13],
+            worst_price_perc=deal[14],
+            current_price=deal[15],                   
+            current_price_perc=deal[16],                   
+            status=deal[17],
+            finish_time=deal[18],
+            indicators=deal[19],
+            leverage=10                                        
+        )
             
-    def read_active_deals(self, pair: str) -> list[object]:
-        query = """
-        SELECT * FROM deals
-        WHERE status = 'active' AND pair = ?;
-        """
+    def read_active_deals(self, pair: str = None) -> list[object]:
+        """Active deals of the pair, or of all pairs if pair is None"""
+        if pair is None:
+            query = """
+            SELECT * FROM deals
+            WHERE status = 'active';
+            """
+            params = ()
+        else:
+            query = """
+            SELECT * FROM deals
+            WHERE status = 'active' AND pair = ?;
+            """
+            params = (pair,)
         try:    
-            self.cursor.execute(query, (pair,))
-            deals = self.cursor.fetchall()
-            self.connection.commit()
+            cursor = self._read_cursor()
+            cursor.execute(query, params)
+            deals = cursor.fetchall()
             
             # print(deals[:10])
             
-            deals_list = []
-            
-            for deal in deals:
-                deals_list.append(lv.Deal(
-                    deal_id=deal[0],
-                    timestamp=deal[1],
-                    pair=deal[2],
-                    timeframe=deal[3],
-                    direction=deal[4],
-                    profit_loss_ratio=deal[5],
-                    entry_price=deal[6],
-                    take_price=deal[7],
-                    stop_price=deal[8],
-                    take_dist_perc=deal[9],
-                    stop_dist_perc=deal[10],
-                    best_price=deal[11],
-                    worst_price=deal[12],
-                    best_price_perc=deal[13],
-                    worst_price_perc=deal[14],
-                    current_price=deal[15],                   
-                    current_price_perc=deal[16],                   
-                    status=deal[17],
-                    finish_time=deal[18],
-                    indicators=deal[19],
-                    leverage=10                                        
-                ))
+            return [self._row_to_deal(deal) for deal in deals]
+        
+        except sqlite3.Error as error:
+            print('SQLite error: ', error)
+            return error
+    
+    def read_deal(self, deal_id: int) -> lv.Deal:
+        query = """
+        SELECT * FROM deals
+        WHERE deal_id = ?;
+        """
+        try:    
+            cursor = self._read_cursor()
+            cursor.execute(query, (deal_id,))
+            deal = cursor.fetchone()
             
-            return deals_list
+            return self._row_to_deal(deal) if deal else None
         
         except sqlite3.Error as error:
             print('SQLite error: ', error)
             return error
     
+    def _db_columns(self, column: str, value) -> dict:
+        """A text time column goes together with its integer epoch column, the text normalized to local time"""
+        if column in TIME_COLUMNS:
+            ms = to_epoch_ms(value)
+            return {column: epoch_ms_to_text(ms), TIME_COLUMNS[column]: ms}
+        return {column: value}
+    
     def update_deal_data(self, column: str, value, deal_id: int):
-        if re.fullmatch(r'[a-zA-Z0-9_]*', column):
+        columns = self._db_columns(column, value)
+        if all(re.fullmatch(r'[a-zA-Z0-9_]*', column) for column in columns):
             query = f"""
             UPDATE deals
-            SET {column}=?
+            SET {', '.join(f'{column}=?' for column in columns)}
             WHERE deal_id=?;
             """    
+            params = (*columns.values(), deal_id)
             try:    
-                self.cursor.execute(query, (value, deal_id))
+                if self.writer is not None:
+                    self.writer.submit(query, params)
+                    return
+                self.cursor.execute(query, params)
                 self.connection.commit()
             except sqlite3.Error as error:
                 print('SQLite error: ', error)
@@ -157,6 +433,51 @@ class DB_handler():
         else:
             return 'Don\'t you dare sending me anything except latin letters, figures and underscores!'
 
+    def update_deals_bulk(self, changes: list):
+        """Applies column changes of many deals in one transaction.
+
+        Args:
+            changes (list): list of (deal_id, {column: value}) pairs; later values of the same column win
+        """
+        if not changes:
+            return
+        
+        # group rows with the same set of columns so each group goes through one executemany
+        grouped: Dict[tuple, list] = {}
+        for deal_id, columns in changes:
+            if not columns:
+                continue
+            columns = {db_column: db_value for column, value in columns.items()
+                       for db_column, db_value in self._db_columns(column, value).items()}
+            for column in columns:
+                if not re.fullmatch(r'[a-zA-Z0-9_]*', column):
+                    return 'Don\'t you dare sending me anything except latin letters, figures and underscores!'
+            key = tuple(sorted(columns))
+            grouped.setdefault(key, []).append(tuple(columns[column] for column in key) + (deal_id,))
+        
+        queries = []
+        for columns, rows in grouped.items():
+            set_clause = ', '.join(f'{column}=?' for column in columns)
+            query = f"""
+            UPDATE deals
+            SET {set_clause}
+            WHERE deal_id=?;
+            """
+            queries.append((query, rows))
+        
+        try:
+            if self.writer is not None:
+                # the writer commits whatever is queued within its batch interval together
+                for query, rows in queries:
+                    self.writer.submit(query, rows, many=True)
+                return
+            with self.connection:
+                for query, rows in queries:
+                    self.cursor.executemany(query, rows)
+        except sqlite3.Error as error:
+            print('SQLite error: ', error)
+            return error
+
     def get_active_deals_list(self) -> list:
         query = """
         SELECT pair FROM deals
@@ -164,9 +485,9 @@ class DB_handler():
         GROUP BY pair;
         """
         try:    
-            self.cursor.execute(query)
-            active_deal_pairs = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            active_deal_pairs = cursor.fetchall()
             
             active_deals_pair_list = [pair[0] for pair in active_deal_pairs]
                         
@@ -202,9 +523,9 @@ class DB_handler():
         # print(f'{query=}')
         
         try:    
-            self.cursor.execute(query)
-            finished_deals_df = pd.read_sql(query, self.connection, index_col='deal_id')
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            finished_deals_df = pd.read_sql(query, cursor.connection, index_col='deal_id')
             
             # print(finished_deals_df)
             return finished_deals_df
@@ -221,9 +542,9 @@ class DB_handler():
         """
         
         try:    
-            self.cursor.execute(query)
-            active_deals_quantity = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            active_deals_quantity = cursor.fetchall()
                         
             return active_deals_quantity[0][0]
                 
@@ -240,9 +561,9 @@ class DB_handler():
         """
         
         try:    
-            self.cursor.execute(query, (pair,))
-            pair_active_deals_quantity = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query, (pair,))
+            pair_active_deals_quantity = cursor.fetchall()
                         
             return pair_active_deals_quantity[0][0]
                 
@@ -258,9 +579,9 @@ class DB_handler():
         """
         
         try:    
-            self.cursor.execute(query)
-            short_active_deals_quantity = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            short_active_deals_quantity = cursor.fetchall()
                         
             return short_active_deals_quantity[0][0]
                 
@@ -276,9 +597,9 @@ class DB_handler():
         """
         
         try:    
-            self.cursor.execute(query)
-            long_active_deals_quantity = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            long_active_deals_quantity = cursor.fetchall()
                         
             return long_active_deals_quantity[0][0]
                 
@@ -287,25 +608,26 @@ class DB_handler():
             return error
     
     def last_lost_deals_times(self, depth, reverse: bool):
+        # redundant IN clause lets SQLite pick the partial idx_deals_finished index
         if reverse:        
             query = """
-            SELECT finish_time FROM deals
-            WHERE status = 'win'
-            ORDER BY finish_time DESC
+            SELECT finish_ms FROM deals
+            WHERE status IN ('win', 'loss') AND status = 'win'
+            ORDER BY finish_ms DESC
             LIMIT ?
             """
         else:
             query = """
-            SELECT finish_time FROM deals
-            WHERE status = 'loss'
-            ORDER BY finish_time DESC
+            SELECT finish_ms FROM deals
+            WHERE status IN ('win', 'loss') AND status = 'loss'
+            ORDER BY finish_ms DESC
             LIMIT ?
             """
         
         try:    
-            self.cursor.execute(query, (depth,))
-            last_lost_deals_timestamps = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query, (depth,))
+            last_lost_deals_timestamps = cursor.fetchall()
             
             last_lost_deals_timestamps.reverse()
             
@@ -314,7 +636,7 @@ class DB_handler():
             datetime_list = []
             
             for timestamp in last_lost_deals_timestamps:
-                datetime_list.append(dt.strptime(timestamp[0], '%Y-%m-%d %H:%M:%S'))
+                datetime_list.append(from_epoch_ms(timestamp[0]))
             
             # print(datetime_list) 
             
@@ -325,27 +647,28 @@ class DB_handler():
             return error
         
     def period_lost_deals_times(self, cooldown_length, check_period, reverse: bool):
+        # redundant IN clause lets SQLite pick the partial idx_deals_finished index
         if reverse:        
             query = """
-            SELECT finish_time FROM deals
-            WHERE status = 'win' AND strftime("%Y-%m-%d %H:%M:%S", finish_time) > ?
-            ORDER BY finish_time DESC
+            SELECT finish_ms FROM deals
+            WHERE status IN ('win', 'loss') AND status = 'win' AND finish_ms > ?
+            ORDER BY finish_ms DESC
             """
         else:
             query = """
-            SELECT finish_time FROM deals
-            WHERE status = 'loss' AND strftime("%Y-%m-%d %H:%M:%S", finish_time) > ?
-            ORDER BY finish_time DESC
+            SELECT finish_ms FROM deals
+            WHERE status IN ('win', 'loss') AND status = 'loss' AND finish_ms > ?
+            ORDER BY finish_ms DESC
             """
         
         try:    
-            time_depth = dt.strftime(dt.now() - check_period - cooldown_length, "%Y-%m-%d %H:%M:%S")
+            time_depth = to_epoch_ms(dt.now() - check_period - cooldown_length)
             
-            self.cursor.execute(query, (time_depth,))
-            period_lost_deals_timestamps = self.cursor.fetchall()
-            self.connection.commit()
+            cursor = self._read_cursor()
+            cursor.execute(query, (time_depth,))
+            period_lost_deals_timestamps = cursor.fetchall()
             
-            period_lost_deals_datetimes = [dt.strptime(timestamp[0], "%Y-%m-%d %H:%M:%S") for timestamp in period_lost_deals_timestamps]
+            period_lost_deals_datetimes = [from_epoch_ms(timestamp[0]) for timestamp in period_lost_deals_timestamps]
             
             return period_lost_deals_datetimes            
             
@@ -360,12 +683,12 @@ class DB_handler():
             SELECT deal_id, datetime, pair, timeframe, direction, profit_loss, take_dist_perc, stop_dist_perc, current_price_perc,
             entry_price, current_price, take_price, stop_price, best_price_perc FROM deals
             WHERE status = 'active'
-            ORDER BY datetime DESC
+            ORDER BY created_ms DESC
             """
         try:    
-            self.cursor.execute(query)
-            active_deals = self.cursor.fetchall()
-            self.connection.commit()    
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            active_deals = cursor.fetchall()
             
             for deal in active_deals:
                 message_text += f"""\n
@@ -393,208 +716,143 @@ ID: {deal[0]}
         return message_text
     
        
-    def show_perfomance_stats(self, risk_per_deal: float, conditions: list = None, initial_bank: int = 100):
-        
-        bank = initial_bank
-        risk = risk_per_deal
-        restrictions = 'WHERE'
-        
-        if conditions:        
-            counter = 0
-        
-            for condition in conditions:
-                if counter > 0:
-                    restrictions += ' AND'
-                
-                restrictions += f' {condition}'
-                counter += 1
-        
+    def get_finished_deals_arrays(self, conditions: list = None) -> Dict[str, np.ndarray]:
+        """Finished deals ordered by finish time as column arrays for perf_stats"""
+        restrictions = ''.join(f' AND {condition}' for condition in conditions or [])
+
         query = f"""
-        SELECT datetime, pair, direction, take_dist_perc, stop_dist_perc, status, finish_time, profit_loss FROM deals
-        {restrictions} status <> "active"
-        ORDER BY finish_time
+        SELECT status, profit_loss, stop_dist_perc, best_price_perc, finish_ms FROM deals
+        WHERE status <> 'active'{restrictions}
+        ORDER BY finish_ms
         """
-        loss_counter = 0
-        win_counter = 0
-        win_perc_counter = 0
-        
-        try:    
-            self.cursor.execute(query)
-            deals = self.cursor.fetchall()
-            self.connection.commit()  
-            
-            for deal in deals:
-                if deal[5] == 'win':
-                    bank += bank * risk * deal[7]
-                    win_counter += 1
-                    win_perc_counter += risk * deal[7]
-                    print(f'Win, bank = {bank}')
-                elif deal[5] == 'loss':
-                    bank -= bank * risk
-                    loss_counter += 1
-                    print(f'Loss, bank = {bank}')
-            
+
+        try:
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            rows = cursor.fetchall()
+
         except sqlite3.Error as error:
             print('SQLite error: ', error)
             return error
-        
-        average_profit_abs = round((bank - initial_bank) / len(deals), 2)
-        # average_profit_rel = round(((bank - initial_bank) / len(deals))/bank * 100, 2)
-        average_profit_rel_adj = round((win_perc_counter + loss_counter * risk * -1)/len(deals) * 100, 2)
-        
-        message_text = f"""\n
-Стартовый банк: {initial_bank}
-Конечный банк: {round(bank, 2)}
-Риск на сделку: {risk}
-Сделок: {len(deals)}
-Прибыльных/убыточных сделок: {win_counter}/{loss_counter}
-Средняя прибыль на сделку абсолютная: {average_profit_abs}
-Средняя прибыль на сделку %: {average_profit_rel_adj}
-        """
-        
-        return message_text
-    
-    def show_perfomance_stats_adj(self, best_price_perc_threshold: float, risk_per_deal: float, 
-                                  conditions: list = None, initial_bank: int = 100, trailing_stop_perc: float = 0.3):
-        
-        bank = initial_bank
-        risk = risk_per_deal
-        restrictions = 'WHERE'
-        
-        if conditions:        
-            counter = 0
-        
-            for condition in conditions:
-                if counter > 0:
-                    restrictions += ' AND'
-                
-                restrictions += f' {condition}'
-                counter += 1
-        
+
+        columns = list(zip(*rows)) if rows else [()] * 5
+        return {
+            'status': np.array(columns[0], dtype=object),
+            'profit_loss': np.array(columns[1], dtype=float),
+            'stop_dist_perc': np.array(columns[2], dtype=float),
+            'best_price_perc': np.array(columns[3], dtype=float),
+            'finish_ms': np.array(columns[4], dtype=float),
+        }
+
+    def get_finished_deals_state(self, conditions: list = None) -> tuple:
+        """(quantity, last finish_ms, last deal_id) of finished deals - changes whenever a deal finishes"""
+        restrictions = ''.join(f' AND {condition}' for condition in conditions or [])
+
         query = f"""
-        SELECT datetime, pair, direction, take_dist_perc, stop_dist_perc, status, finish_time, profit_loss, best_price_perc, deal_id FROM deals
-        {restrictions} status <> "active"
-        ORDER BY finish_time
+        SELECT COUNT(*), MAX(finish_ms), MAX(deal_id) FROM deals
+        WHERE status <> 'active'{restrictions}
         """
-        loss_counter = 0
-        win_counter = 0
-        win_perc_counter = 0
-        
-        try:    
-            self.cursor.execute(query)
-            deals = self.cursor.fetchall()
-            self.connection.commit()  
-            
-            for deal in deals:
-                if deal[5] == 'win':
-                    bank += bank * risk * deal[7]
-                    win_counter += 1
-                    win_perc_counter += risk * deal[7]
-                    print(f'Win, bank = {bank}')
-                elif deal[5] == 'loss':
-                    if deal[8] <= deal[4] * best_price_perc_threshold:
-                        bank -= bank * risk
-                        loss_counter += 1
-                        print(f'Loss, bank = {bank}')
-                    else:
-                        bank += bank * risk * (best_price_perc_threshold - trailing_stop_perc)
-                        win_counter += 1
-                        win_perc_counter += risk * (best_price_perc_threshold - trailing_stop_perc)
-                        print(f'!!! {deal[9]} Win, bank = {bank}')
-            
+
+        try:
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            return tuple(cursor.fetchone())
+
         except sqlite3.Error as error:
             print('SQLite error: ', error)
             return error
-        
-        average_profit_abs = round((bank - initial_bank) / len(deals), 2)
-        # average_profit_rel = round(((bank - initial_bank) / len(deals))/bank * 100, 2)
-        average_profit_rel_adj = round((win_perc_counter + loss_counter * risk * -1)/len(deals) * 100, 2)
-        
-        message_text = f"""\n
-С трейлинг-стопом {best_price_perc_threshold} / {trailing_stop_perc} от точки трейлинг-стопа        
-
-Стартовый банк: {initial_bank}
-Конечный банк: {round(bank, 2)}
-Риск на сделку: {risk}
-Сделок: {len(deals)}
-Прибыльных/убыточных сделок: {win_counter}/{loss_counter}
-Средняя прибыль на сделку абсолютная: {average_profit_abs}
-Средняя прибыль на сделку %: {average_profit_rel_adj}
-        """
-        
-        return message_text
-    
-    
-    def show_perfomance_stats_adj2(self, best_price_perc_threshold: float, risk_per_deal: float, 
-                                  conditions: list = None, initial_bank: int = 100, trailing_stop_perc: float = 0.3):
-        
-        bank = initial_bank
-        risk = risk_per_deal
-        restrictions = 'WHERE'
-        
-        if conditions:        
-            counter = 0
-        
-            for condition in conditions:
-                if counter > 0:
-                    restrictions += ' AND'
-                
-                restrictions += f' {condition}'
-                counter += 1
-        
+
+    def rebuild_stats(self):
+        """Recomputes daily_stats and pair_stats from the whole deals table in one transaction"""
+        try:
+            self.flush()        # queued deal writes go first, the triggers take care of anything after
+            with self.connection:
+                for query in stats_rebuild_queries():
+                    self.cursor.execute(query)
+        except sqlite3.Error as error:
+            self.connection.rollback()
+            print('SQLite error: ', error)
+            return error
+
+    def read_daily_stats(self, days: int = None) -> list:
+        """Rows (date, deals, wins, losses, win_units, reverse_units, loss_stop_dist_perc), last days first"""
         query = f"""
-        SELECT datetime, pair, direction, take_dist_perc, stop_dist_perc, status, finish_time, profit_loss, best_price_perc, deal_id FROM deals
-        {restrictions} status <> "active"
-        ORDER BY finish_time
+        SELECT date, {', '.join(STATS_COLUMNS)} FROM daily_stats
+        WHERE deals > 0
+        ORDER BY date DESC
+        LIMIT ?
         """
-        loss_counter = 0
-        win_counter = 0
-        win_perc_counter = 0
-        
-        try:    
-            self.cursor.execute(query)
-            deals = self.cursor.fetchall()
-            self.connection.commit()  
-            
-            for deal in deals:
-                if deal[5] == 'win':
-                    bank += bank * risk * deal[7]
-                    win_counter += 1
-                    win_perc_counter += risk * deal[7]
-                    print(f'Win, bank = {bank}')
-                elif deal[5] == 'loss':
-                    if deal[8] <= deal[4] * best_price_perc_threshold:
-                        bank -= bank * risk
-                        loss_counter += 1
-                        print(f'Loss, bank = {bank}')
-                    else:
-                        # bank += bank * risk * (best_price_perc_threshold - trailing_stop_perc)
-                        bank += bank * risk * (deal[8] - trailing_stop_perc)
-                        win_counter += 1
-                        win_perc_counter += risk * (deal[8] - trailing_stop_perc)
-                        print(f'!!! {deal[9]} Win, bank = {bank}')
-            
+        try:
+            cursor = self._read_cursor()
+            cursor.execute(query, (days or -1,))
+            return cursor.fetchall()
+
         except sqlite3.Error as error:
             print('SQLite error: ', error)
             return error
-        
-        average_profit_abs = round((bank - initial_bank) / len(deals), 2)
-        # average_profit_rel = round(((bank - initial_bank) / len(deals))/bank * 100, 2)
-        average_profit_rel_adj = round((win_perc_counter + loss_counter * risk * -1)/len(deals) * 100, 2)
-        
-        message_text = f"""\n
-С трейлинг-стопом {best_price_perc_threshold} / {trailing_stop_perc} от лучшей цены        
-
-Стартовый банк: {initial_bank}
-Конечный банк: {round(bank, 2)}
-Риск на сделку: {risk}
-Сделок: {len(deals)}
-Прибыльных/убыточных сделок: {win_counter}/{loss_counter}
-Средняя прибыль на сделку абсолютная: {average_profit_abs}
-Средняя прибыль на сделку %: {average_profit_rel_adj}
+
+    def read_pair_stats(self) -> list:
+        """Rows (pair, deals, wins, losses, win_units, reverse_units, loss_stop_dist_perc) ordered by pair"""
+        query = f"""
+        SELECT pair, {', '.join(STATS_COLUMNS)} FROM pair_stats
+        WHERE deals > 0
+        ORDER BY pair
         """
-        
+        try:
+            cursor = self._read_cursor()
+            cursor.execute(query)
+            return cursor.fetchall()
+
+        except sqlite3.Error as error:
+            print('SQLite error: ', error)
+            return error
+
+    def show_daily_stats(self, days: int = 14, risk_perc: float = 1) -> str:
+        """Day results in % of bank without compounding, like the day_result of sql_queries_2.sql"""
+        rows = self.read_daily_stats(days)
+        if not isinstance(rows, list):
+            return f'SQLite error: {rows}'
+        if not rows:
+            return 'Нет сделок'
+
+        message_text = f'Сделки по дням, результат в % банка при риске {risk_perc}% на сделку: прямая / обратная стратегия\n'
+        for date, deals, wins, losses, win_units, reverse_units, _ in reversed(rows):
+            direct = round(risk_perc * (win_units - losses), 2)
+            reverse = round(risk_perc * (reverse_units - wins), 2)
+            message_text += f'\n{date}: сделок {deals} ({wins}/{losses}, активных {deals - wins - losses}), {direct} / {reverse}'
         return message_text
+
+    def show_pair_stats(self) -> str:
+        rows = self.read_pair_stats()
+        if not isinstance(rows, list):
+            return f'SQLite error: {rows}'
+        if not rows:
+            return 'Нет сделок'
+
+        message_text = 'Статистика по парам: сделок (прибыльных/убыточных), убыточных на прибыльную, средний убыток %\n'
+        for pair, deals, wins, losses, _, _, loss_stop_dist_perc in rows:
+            lose_win_ratio = round(losses / wins, 2) if wins else '-'
+            average_loss = round(loss_stop_dist_perc / losses, 2) if losses else '-'
+            message_text += f'\n{pair}: {deals} ({wins}/{losses}), {lose_win_ratio}, {average_loss}'
+        return message_text
+
+    def show_perfomance_stats(self, risk_per_deal: float, conditions: list = None, initial_bank: int = 100):
+        variants = [ps.StatsVariant(risk_per_deal)]
+        return ps.perfomance_reports(self, variants, initial_bank, conditions)[0]
+
+    def show_perfomance_stats_adj(self, best_price_perc_threshold: float, risk_per_deal: float, 
+                                  conditions: list = None, initial_bank: int = 100, trailing_stop_perc: float = 0.3):
+        variants = [ps.StatsVariant(risk_per_deal, best_price_perc_threshold, trailing_stop_perc, 'fixed')]
+        return ps.perfomance_reports(self, variants, initial_bank, conditions)[0]
+
+    def show_perfomance_stats_adj2(self, best_price_perc_threshold: float, risk_per_deal: float, 
+                                  conditions: list = None, initial_bank: int = 100, trailing_stop_perc: float = 0.3):
+        variants = [ps.StatsVariant(risk_per_deal, best_price_perc_threshold, trailing_stop_perc, 'best')]
+        return ps.perfomance_reports(self, variants, initial_bank, conditions)[0]
+
+    def show_perfomance_stats_all(self, variants: list, conditions: list = None, initial_bank: int = 100) -> list[str]:
+        """All variants from a single load of finished deals, see perf_stats.StatsVariant"""
+        return ps.perfomance_reports(self, variants, initial_bank, conditions)
     
     
     def show_stats(self, period_start = None, period_finish = None):
@@ -607,17 +865,18 @@ ID: {deal[0]}
         query = f"""
         SELECT datetime, pair, direction, take_dist_perc, stop_dist_perc, finish_time, worst_price_perc, best_price_perc, profit_loss FROM deals
         WHERE status <> 'active'
-        ORDER BY finish_time
+        ORDER BY finish_ms
         """
                 
-        try:    
-            self.cursor.execute(query)
-            # deals = self.cursor.fetchall()
-            # self.connection.commit()     
-            
-            dataframe = pd.read_sql_query(query, self.connection)   
-            
-            return dataframe    
+        # one pass with explicit dtypes; for charts diagrams.aggregate_perfomance over get_finished_deals_arrays is faster
+        dtypes = {'pair': 'string', 'direction': 'category', 'take_dist_perc': 'float64', 'stop_dist_perc': 'float64',
+                  'worst_price_perc': 'float64', 'best_price_perc': 'float64', 'profit_loss': 'float64'}
+
+        try:
+            cursor = self._read_cursor()
+            dataframe = pd.read_sql_query(query, cursor.connection, dtype=dtypes, parse_dates=['datetime', 'finish_time'])
+
+            return dataframe
             
         except sqlite3.Error as error:
             print('SQLite error: ', error)
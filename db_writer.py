@@ -0,0 +1,101 @@
+import queue
+import sqlite3
+import threading
+import time
+
+
+class DB_writer():
+    """Write-behind SQLite writer.
+
+    Owns its own connection in a dedicated thread. Statements are queued by submit() and applied
+    in batches, one transaction per batch. A single FIFO queue keeps the order of writes
+    (so all changes of a deal are applied in the order they were made).
+    flush() is a barrier: it returns when everything queued before it is committed.
+    """
+
+    _STOP = object()
+
+    def __init__(self, dbname: str, batch_interval: float = 0.5, max_batch: int = 1000):
+        self.dbname = dbname
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='db_writer', daemon=True)
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.thread.start()
+
+    def submit(self, query: str, params=(), many: bool = False):
+        """Queue a statement; with many=True params is a sequence of rows for executemany"""
+        self.queue.put((query, params, many))
+
+    def flush(self, timeout: float = None) -> bool:
+        if not self.started or not self.thread.is_alive():
+            return True
+        barrier = threading.Event()
+        self.queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def stop(self, timeout: float = None):
+        if not self.started or not self.thread.is_alive():
+            return
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+
+    def _run(self):
+        connection = sqlite3.connect(self.dbname)
+        connection.execute('PRAGMA journal_mode=WAL;')
+        connection.execute('PRAGMA synchronous=NORMAL;')
+        connection.execute('PRAGMA busy_timeout=5000;')
+
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            # collect whatever arrives within batch_interval, a barrier or stop closes the batch at once
+            while len(batch) < self.max_batch and not isinstance(batch[-1], threading.Event) and batch[-1] is not self._STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            statements = [item for item in batch if isinstance(item, tuple)]
+            if statements:
+                self._write_batch(connection, statements)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is self._STOP:
+                    running = False
+
+        connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, statements: list):
+        try:
+            with connection:
+                for query, params, many in statements:
+                    if many:
+                        connection.executemany(query, params)
+                    else:
+                        connection.execute(query, params)
+            return
+        except sqlite3.Error as error:
+            print('SQLite error (batch, retrying one by one): ', error)
+
+        # one bad statement must not take the rest of the batch down with it
+        for query, params, many in statements:
+            try:
+                with connection:
+                    if many:
+                        connection.executemany(query, params)
+                    else:
+                        connection.execute(query, params)
+            except sqlite3.Error as error:
+                print('SQLite error: ', error, query)
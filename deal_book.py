@@ -0,0 +1,99 @@
+import threading
+from typing import Dict
+
+import levels as lv
+
+
+class ActiveDealBook():
+    """In-memory book of active deals with write-through persistence to DB_handler.
+
+    Mirrors the active-deals part of DB_handler API (add_deal, read_active_deals, get_active_deals_list,
+    update_deals_bulk and *_quantity counters), so it can be passed to bot_funcs instead of db.
+    Reads and counters never touch the database, writes go to the database first and then to memory.
+    """
+
+    def __init__(self, db: object):
+        self.db = db
+        self.lock = threading.RLock()
+        self.deals: Dict[int, lv.Deal] = {}                 # deal_id -> deal
+        self.pair_deals: Dict[str, Dict[int, lv.Deal]] = {} # pair -> {deal_id: deal}
+        self.direction_counts = {'long': 0, 'short': 0}
+
+        self.load()
+
+    def load(self):
+        deals = self.db.read_active_deals()
+        if not isinstance(deals, list):
+            raise RuntimeError(f'Failed to load active deals: {deals}')
+
+        with self.lock:
+            self.deals = {}
+            self.pair_deals = {}
+            self.direction_counts = {'long': 0, 'short': 0}
+            for deal in deals:
+                self._index(deal)
+
+        print(f'Active deals book loaded: {len(self.deals)} deals')
+
+    def _index(self, deal: lv.Deal):
+        self.deals[deal.deal_id] = deal
+        self.pair_deals.setdefault(deal.pair, {})[deal.deal_id] = deal
+        if deal.direction in self.direction_counts:
+            self.direction_counts[deal.direction] += 1
+
+    def _unindex(self, deal: lv.Deal):
+        self.deals.pop(deal.deal_id, None)
+        pair_deals = self.pair_deals.get(deal.pair)
+        if pair_deals is not None:
+            pair_deals.pop(deal.deal_id, None)
+            if not pair_deals:
+                del self.pair_deals[deal.pair]
+        if deal.direction in self.direction_counts:
+            self.direction_counts[deal.direction] -= 1
+
+    def add_deal(self, deal: lv.Deal, created_ms: int = None) -> lv.Deal:
+        """Same contract as DB_handler.add_deal: the stored deal, or the DB error"""
+        with self.lock:
+            stored_deal = self.db.add_deal(deal, created_ms)
+            if not isinstance(stored_deal, lv.Deal):
+                return stored_deal
+            # keep the deal exactly as it is stored (rounded prices, text timestamp)
+            self._index(stored_deal)
+            return stored_deal
+
+    def update_deals_bulk(self, changes: list):
+        with self.lock:
+            error = self.db.update_deals_bulk(changes)
+            if error:
+                return error
+
+            for deal_id, columns in changes:
+                deal = self.deals.get(deal_id)
+                if deal is None:
+                    continue
+                for column, value in columns.items():
+                    setattr(deal, column, value)
+                if deal.status != 'active':
+                    self._unindex(deal)
+
+    def read_active_deals(self, pair: str = None) -> list[lv.Deal]:
+        with self.lock:
+            if pair is None:
+                return list(self.deals.values())
+            return list(self.pair_deals.get(pair, {}).values())
+
+    def get_active_deals_list(self) -> list:
+        with self.lock:
+            return list(self.pair_deals.keys())
+
+    def total_active_deals_quantity(self) -> int:
+        return len(self.deals)
+
+    def pair_active_deals_quantity(self, pair: str) -> int:
+        return len(self.pair_deals.get(pair, {}))
+
+    def active_shorts_quantity(self) -> int:
+        return self.direction_counts['short']
+
+    def active_longs_quantity(self) -> int:
+        return self.direction_counts['long']
@@ -1,16 +1,28 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-import seaborn as sb
-import matplotlib.pyplot as plt
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+
+import perf_stats as ps
+from aux_funcs import TIMEFRAME_MS
+
 
 def plot_all_time_perfomance (data: pd.DataFrame):
+    import seaborn as sb
+    import matplotlib.pyplot as plt
+
     # Set the style of the visualization
     sb.set_theme(style="whitegrid")
 
     # Create a plot with Seaborn (for example, a bar plot)
     plt.figure(figsize=(10, 6))
     ax = sb.barplot(x="finish_time", y="profit_loss", data=data)
-    
+
     # Save the figure in SVG format
     ax.get_figure().savefig("seaborn_plot.svg", format='svg')
 
@@ -18,4 +30,103 @@ def plot_all_time_perfomance (data: pd.DataFrame):
     ax.get_figure().savefig("seaborn_plot.png", format='png')
 
     # Show the plot
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+def aggregate_perfomance(deals: dict, risk: float, bucket: str = '1d', initial_bank: float = 100) -> pd.DataFrame:
+    """Finished deals (DB_handler.get_finished_deals_arrays) folded into time buckets (UTC) of a TIMEFRAME_MS size:
+    deals, wins, losses, compounded bucket result in % of bank and the bank at the end of the bucket.
+    Buckets without finished deals are skipped"""
+    columns = {'time': 'datetime64[ms, UTC]', 'deals': 'int32', 'wins': 'int32', 'losses': 'int32',
+               'result_perc': 'float64', 'bank': 'float64'}
+    if deals['status'].shape[0] == 0:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in columns.items()})
+
+    units, wins, losses = ps.unit_returns(deals, [ps.StatsVariant(risk)])
+    bank = initial_bank * np.cumprod(1 + risk * units[0])
+
+    bucket_ms = TIMEFRAME_MS[bucket]
+    buckets, first, counts = np.unique(ps.finish_times(deals) // bucket_ms, return_index=True, return_counts=True)
+    bucket_index = np.repeat(np.arange(buckets.shape[0]), counts)          # deals are ordered by finish_ms
+    bank_end = bank[first + counts - 1]
+    bank_start = np.concatenate([[initial_bank], bank_end[:-1]])
+
+    return pd.DataFrame({
+        'time': pd.to_datetime(buckets * bucket_ms, unit='ms', utc=True),
+        'deals': counts.astype('int32'),
+        'wins': np.bincount(bucket_index, weights=wins[0]).astype('int32'),
+        'losses': np.bincount(bucket_index, weights=losses[0]).astype('int32'),
+        'result_perc': (bank_end / bank_start - 1) * 100,
+        'bank': bank_end,
+    })
+
+
+def render_perfomance_png(frame: pd.DataFrame, title: str = '', dpi: int = 100) -> bytes:
+    """Bank curve over bucket results as PNG. Uses a standalone Figure (Agg), no pyplot state, safe in a worker thread"""
+    figure = Figure(figsize=(10, 6), dpi=dpi)
+    bank_axes, result_axes = figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+
+    times = mdates.date2num(frame['time'].dt.tz_localize(None).to_numpy())      # days, bar width in the same units
+    bank_axes.plot(times, frame['bank'].to_numpy(), color='tab:blue', linewidth=1.5)
+    bank_axes.xaxis_date()
+    bank_axes.set_ylabel('Банк')
+    bank_axes.set_title(title)
+    bank_axes.grid(True, alpha=0.3)
+
+    results = frame['result_perc'].to_numpy()
+    width = np.diff(times).min() * 0.8 if times.shape[0] > 1 else 0.8
+    result_axes.bar(times, results, width=width, color=np.where(results >= 0, 'tab:green', 'tab:red'))
+    result_axes.axhline(0, color='black', linewidth=0.5)
+    result_axes.xaxis_date()
+    result_axes.set_ylabel('Результат %')
+    result_axes.grid(True, alpha=0.3)
+    figure.autofmt_xdate()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+class PerfomanceReporter():
+    """Builds performance charts in a background thread, so a telegram handler only submits a request.
+    PNGs are cached by the state of finished deals (count, last finish_ms, last deal_id) and the bucket"""
+
+    def __init__(self, db: object, risk: float, initial_bank: float = 100, cache_size: int = 8):
+        self.db = db
+        self.risk = risk
+        self.initial_bank = initial_bank
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='perfomance_chart')
+
+    def _render(self, bucket: str) -> bytes:
+        state = self.db.get_finished_deals_state()
+        if not isinstance(state, tuple):
+            raise RuntimeError(f'SQLite error: {state}')
+        key = (state, bucket)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        png = None
+        if state[0]:
+            deals = self.db.get_finished_deals_arrays()
+            if not isinstance(deals, dict):
+                raise RuntimeError(f'SQLite error: {deals}')
+            frame = aggregate_perfomance(deals, self.risk, bucket, self.initial_bank)
+            title = f'Сделок: {state[0]}, риск на сделку: {self.risk}, период: {bucket}'
+            png = render_perfomance_png(frame, title)
+
+        with self.lock:
+            self.cache[key] = png
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return png
+
+    def chart(self, bucket: str = '1d') -> Future:
+        """Future with PNG bytes (None if there are no finished deals)"""
+        if bucket not in TIMEFRAME_MS:
+            raise ValueError(f'Unknown bucket {bucket}')
+        return self.executor.submit(self._render, bucket)
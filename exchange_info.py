@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+
+@dataclass(frozen=True)
+class SymbolFilters:
+	"""Trading rules of one USDT-M symbol, parsed once per exchangeInfo download.
+	Decimals are exact; *_str keep the original Binance strings for quantize/formatting"""
+	symbol: str
+	status: str
+	contract_type: str
+	quote_asset: str
+	tick_size: Decimal
+	step_size: Decimal
+	min_qty: Decimal
+	min_notional: Decimal
+	tick_size_str: str
+	step_size_str: str
+	info: Dict[str, Any] = field(repr=False, compare=False, default_factory=dict)
+
+	@property
+	def is_um_usdt_perpetual(self) -> bool:
+		return self.contract_type == "PERPETUAL" and self.quote_asset == "USDT" and self.status == "TRADING"
+
+	@classmethod
+	def from_symbol_info(cls, info: Dict[str, Any]) -> "SymbolFilters":
+		filters = {f.get("filterType"): f for f in info.get("filters", [])}
+		price_filter = filters.get("PRICE_FILTER", {})
+		lot_size = filters.get("LOT_SIZE", {})
+		min_notional = filters.get("MIN_NOTIONAL", {})
+		tick_size_str = str(price_filter.get("tickSize", "0.0001"))
+		step_size_str = str(lot_size.get("stepSize", "1"))
+		return cls(
+			symbol=info.get("symbol"),
+			status=info.get("status", ""),
+			contract_type=info.get("contractType", ""),
+			quote_asset=info.get("quoteAsset", ""),
+			tick_size=Decimal(str(price_filter.get("tickSize", "0") or "0")),
+			step_size=Decimal(str(lot_size.get("stepSize", "0") or "0")),
+			min_qty=Decimal(str(lot_size.get("minQty", "0") or "0")),
+			min_notional=Decimal(str(min_notional.get("notional", min_notional.get("minNotional", "0")) or "0")),
+			tick_size_str=tick_size_str,
+			step_size_str=step_size_str,
+			info=info,
+		)
+
+
+def _fetch_public_exchange_info(base_url: str = "https://fapi.binance.com") -> dict:
+	resp = requests.get(f"{base_url}/fapi/v1/exchangeInfo", timeout=10)
+	resp.raise_for_status()
+	return resp.json()
+
+
+class ExchangeInfoCache:
+	"""
+	Symbol metadata of USDT-M futures shared by Binance_connect and the pair filters of bot_funcs.
+	- exchangeInfo is downloaded once per ttl_sec (or on refresh()), parsed into SymbolFilters per symbol
+	- an unknown symbol triggers one early refresh (new listing), at most once per min_refresh_interval_sec
+	- if a refresh fails, the previous data is kept and served
+	- thread-safe: one download at a time, reads of fresh data take no lock
+	"""
+
+	def __init__(self, fetch: Optional[Callable[[], dict]] = None, ttl_sec: float = 3600.0, min_refresh_interval_sec: float = 60.0) -> None:
+		self.fetch = fetch or _fetch_public_exchange_info
+		self.ttl_sec = ttl_sec
+		self.min_refresh_interval_sec = min_refresh_interval_sec
+		self._symbols: Dict[str, SymbolFilters] = {}
+		self._loaded_at = 0.0
+		self._attempted_at = 0.0
+		self._lock = threading.Lock()
+
+	def _refresh_locked(self) -> bool:
+		self._attempted_at = time.monotonic()
+		try:
+			data = self.fetch()
+			symbols = {info.get("symbol"): SymbolFilters.from_symbol_info(info) for info in data.get("symbols", [])}
+		except Exception as ex:
+			print(f"ExchangeInfoCache: refresh failed: {ex}")
+			return False
+		if not symbols:
+			print(f"ExchangeInfoCache: refresh returned no symbols: {str(data)[:200]}")
+			return False
+		self._symbols = symbols
+		self._loaded_at = time.monotonic()
+		return True
+
+	def refresh(self) -> bool:
+		"""Downloads exchangeInfo now. Returns False (and keeps the old data) on failure"""
+		with self._lock:
+			return self._refresh_locked()
+
+	def _is_fresh(self) -> bool:
+		now = time.monotonic()
+		if not self._symbols:
+			return False
+		# after a failed refresh the stale copy is served until the next attempt is allowed
+		return now - self._loaded_at < self.ttl_sec or now - self._attempted_at < self.min_refresh_interval_sec
+
+	def _ensure_fresh(self) -> None:
+		if self._is_fresh():
+			return
+		with self._lock:
+			if not self._is_fresh():		# another thread may have refreshed while we waited
+				self._refresh_locked()
+
+	def symbols(self) -> Dict[str, SymbolFilters]:
+		self._ensure_fresh()
+		return self._symbols
+
+	def get(self, symbol: str) -> SymbolFilters:
+		self._ensure_fresh()
+		filters = self._symbols.get(symbol)
+		if filters is None:
+			with self._lock:
+				if symbol not in self._symbols and time.monotonic() - self._attempted_at >= self.min_refresh_interval_sec:
+					self._refresh_locked()
+			filters = self._symbols.get(symbol)
+		if filters is None:
+			raise ValueError(f"Symbol {symbol} not found in exchange info")
+		return filters
+
+	def symbol_info(self, symbol: str) -> Dict[str, Any]:
+		"""Raw exchangeInfo entry of the symbol"""
+		return self.get(symbol).info
+
+	def um_usdt_perpetuals(self) -> Dict[str, SymbolFilters]:
+		return {symbol: filters for symbol, filters in self.symbols().items() if filters.is_um_usdt_perpetual}
+
+
+_shared_cache: Optional[ExchangeInfoCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_exchange_info() -> ExchangeInfoCache:
+	"""Process-wide cache of the public mainnet exchangeInfo"""
+	global _shared_cache
+	with _shared_lock:
+		if _shared_cache is None:
+			_shared_cache = ExchangeInfoCache()
+		return _shared_cache
+
+
+def use_shared_exchange_info(cache: ExchangeInfoCache) -> None:
+	"""Replaces the process-wide cache, e.g. with one reading a mock exchange"""
+	global _shared_cache
+	with _shared_lock:
+		_shared_cache = cache
@@ -1,36 +1,213 @@
-import sqlite3
 import csv
+import json
+import os
+import sqlite3
+from datetime import datetime as dt
+
+# Streaming export of deals (or any table) to CSV, Parquet or Arrow (Feather v2).
+# Rows go through cursor.fetchmany() chunk by chunk, so memory stays flat whatever the DB size.
+# Parquet / Arrow need pyarrow (optional, imported only for these formats).
+#
+# Incremental export keeps a watermark in <out>.state.json:
+# - by deal_id: deals with deal_id above the last exported one (new deals of any status);
+# - finished (--finished): win/loss deals finished after the last exported one, ordered by finish time,
+#   so a deal that was active during the previous export is picked up when it finishes.
+# CSV is appended to, Parquet / Arrow get a new part file per run (<out>/part-00001.parquet, ...),
+# a directory of parquet parts is read by pd.read_parquet(<out>).
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+def _connect(db_file):
+    # read-only connection: the export never blocks the bot writing deals
+    return sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+
+
+def _deals_query(table_name, after_id=None, finished=False, since_ms=None):
+    """Query and parameters of the rows to export, in watermark order"""
+    if not finished:
+        return f'SELECT * FROM {table_name} WHERE deal_id > ? ORDER BY deal_id', (after_id or 0,)
+
+    # redundant IN clause lets SQLite pick the partial idx_deals_finished index
+    query = f"SELECT * FROM {table_name} WHERE status IN ('win', 'loss')"
+    params = ()
+    if since_ms is not None:
+        query += ' AND (finish_ms > ? OR (finish_ms = ? AND deal_id > ?))'
+        params = (since_ms, since_ms, after_id or 0)
+    return query + ' ORDER BY finish_ms, deal_id', params
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet / Arrow export needs pyarrow: pip install pyarrow')
+    return pyarrow
+
+
+def _arrow_schema(connection, table_name, column_names):
+    """pyarrow schema from the declared column types, so an all-NULL first chunk doesn't break later chunks"""
+    pa = _pyarrow()
+
+    declared = {column[1]: (column[2] or '').upper() for column in connection.execute(f'PRAGMA table_xinfo({table_name})')}
+    types = {'INTEGER': pa.int64(), 'REAL': pa.float64()}
+    return pa.schema([(name, types.get(declared.get(name), pa.string())) for name in column_names])
+
+
+class _CsvSink():
+
+    def __init__(self, path, column_names, append):
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, mode='a' if append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        if write_header:
+            self.writer.writerow(column_names)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
 
-def export_to_csv(db_file, table_name, csv_file):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    
-    # Execute a query to select all data from the specified table
-    cursor.execute(f"SELECT * FROM {table_name}")
+    def close(self):
+        self.file.close()
 
-    # Fetch all rows from the executed query
-    rows = cursor.fetchall()
 
-    # Get column names from the table for headers in CSV
+class _ArrowSink():
+
+    def __init__(self, path, fmt, schema):
+        pa = _pyarrow()
+
+        self.pa = pa
+        self.schema = schema
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def write(self, rows):
+        # one row group / record batch per chunk
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _state_path(out):
+    return out.rstrip('/\\') + '.state.json'
+
+
+def _load_state(out, finished):
+    if not os.path.exists(_state_path(out)):
+        return {}
+    with open(_state_path(out)) as state_file:
+        state = json.load(state_file)
+    if state.get('finished', False) != finished:
+        raise ValueError(f'{_state_path(out)} was written by an export with finished={state.get("finished")}')
+    return state
+
+
+def export_deals(db_file, out, fmt=None, table_name='deals', after_id=None, finished=False, since_ms=None,
+                 incremental=False, chunk_size=10_000):
+    """Streams deals into out and returns {'rows': exported rows, 'out': written file}.
+    fmt - 'csv', 'parquet' or 'arrow', by default from the extension of out"""
+    if since_ms is not None and not finished:
+        raise ValueError('since_ms filters by finish time and needs finished=True')
+    fmt = fmt or FORMATS.get(os.path.splitext(out)[1].lower(), 'csv')
+
+    state = {}
+    if incremental:
+        state = _load_state(out, finished)
+        after_id = state.get('deal_id', after_id)
+        since_ms = state.get('finish_ms', since_ms)
+
+    path = out
+    if incremental and fmt != 'csv':
+        os.makedirs(out, exist_ok=True)
+        state['parts'] = state.get('parts', 0)
+        extension = 'parquet' if fmt == 'parquet' else 'arrow'
+        path = os.path.join(out, f"part-{state['parts'] + 1:05d}.{extension}")
+
+    connection = _connect(db_file)
+    cursor = connection.cursor()
+    query, params = _deals_query(table_name, after_id, finished, since_ms)
+    cursor.execute(query, params)
     column_names = [description[0] for description in cursor.description]
+    deal_id_index = column_names.index('deal_id')
+    finish_ms_index = column_names.index('finish_ms')
+
+    sink = None
+    exported = 0
+    last_row = None
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if sink is None:
+                if fmt == 'csv':
+                    sink = _CsvSink(path, column_names, append=incremental)
+                else:
+                    sink = _ArrowSink(path, fmt, _arrow_schema(connection, table_name, column_names))
+            sink.write(rows)
+            exported += len(rows)
+            last_row = rows[-1]
+    finally:
+        if sink is not None:
+            sink.close()
+        connection.close()
+
+    if incremental and last_row is not None:
+        state.update({'finished': finished, 'deal_id': last_row[deal_id_index], 'exported_at': dt.now().isoformat(timespec='seconds')})
+        if finished:
+            state['finish_ms'] = last_row[finish_ms_index]
+        if fmt != 'csv':
+            state['parts'] += 1
+        with open(_state_path(out), 'w') as state_file:
+            json.dump(state, state_file, indent=4)
+
+    return {'rows': exported, 'out': path if exported else None}
+
+
+def export_to_csv(db_file, table_name, csv_file, chunk_size=10_000):
+    """Whole table to CSV, streamed in chunks"""
+    connection = _connect(db_file)
+    cursor = connection.cursor()
+    cursor.execute(f'SELECT * FROM {table_name}')
+    sink = _CsvSink(csv_file, [description[0] for description in cursor.description], append=False)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            sink.write(rows)
+    finally:
+        sink.close()
+        connection.close()
 
-    # Open a CSV file and write data into it
-    with open(csv_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
 
-        # Write the column headers first
-        writer.writerow(column_names)
+def main():
+    import argparse
 
-        # Write all rows of data
-        writer.writerows(rows)
+    parser = argparse.ArgumentParser(description='Streaming export of deals to CSV / Parquet / Arrow')
+    parser.add_argument('dbname', help='deals database, e.g. deals_5m.sqlite')
+    parser.add_argument('out', help='output file (.csv, .parquet, .arrow); a directory of parts for incremental parquet/arrow')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], help='default: from the out extension')
+    parser.add_argument('--after-id', type=int, help='only deals with deal_id above this one')
+    parser.add_argument('--finished', action='store_true', help='only win/loss deals, ordered by finish time')
+    parser.add_argument('--since', help="with --finished: finished after 'YYYY-mm-dd HH:MM:SS' (local time)")
+    parser.add_argument('--incremental', action='store_true', help='continue from the watermark in <out>.state.json')
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    args = parser.parse_args()
+    if args.since and not args.finished:
+        parser.error('--since filters by finish time and needs --finished')
 
-    # Close the database connection
-    conn.close()
+    since_ms = int(dt.strptime(args.since, '%Y-%m-%d %H:%M:%S').timestamp() * 1000) if args.since else None
+    result = export_deals(args.dbname, args.out, args.format, after_id=args.after_id, finished=args.finished,
+                          since_ms=since_ms, incremental=args.incremental, chunk_size=args.chunk_size)
+    print(f"Exported {result['rows']} rows" + (f" to {result['out']}" if result['out'] else ''))
 
-# Example usage:
-db_filename = 'deals_5m.sqlite'
-table_name = 'deals'
-csv_filename = 'deals_5m.csv'
 
-export_to_csv(db_filename, table_name, csv_filename)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
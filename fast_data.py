@@ -8,6 +8,10 @@ from typing import Dict, Tuple, Optional
 import pandas as pd
 import requests
 
+# REST roots of klines (mock_exchange.route_public_data points them at a local mock)
+FUTURES_BASE_URL = "https://fapi.binance.com"
+SPOT_BASE_URL = "https://api.binance.com"
+
 
 class FastDataManager:
 	"""
@@ -44,9 +48,9 @@ class FastDataManager:
 
 	def _build_urls(self, pair: str, timeframe: str, limit: int, futures: bool) -> Tuple[str, str]:
 		if futures:
-			base = "https://fapi.binance.com/fapi/v1/klines"
+			base = f"{FUTURES_BASE_URL}/fapi/v1/klines"
 		else:
-			base = "https://api.binance.com/api/v3/klines"
+			base = f"{SPOT_BASE_URL}/api/v3/klines"
 		full = f"{base}?symbol={pair}&interval={timeframe}&limit={limit}"
 		inc = f"{base}?symbol={pair}&interval={timeframe}&limit=2"
 		return full, inc
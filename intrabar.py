@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+from aux_funcs import TIMEFRAME_MS
+
+
+class IntrabarResolver():
+    """Finds out whether take or stop was hit first when one bar crosses both.
+
+    A bar longer than 1m is walked through its 1m candles (from KlineStore if given, else Binance klines),
+    an ambiguous 1m candle is walked through the aggregated trades of that minute.
+    Drilled-down windows are kept in an LRU cache, so repeated checks of the same bar cost nothing.
+    Crossing rules are the ones of bf.update_active_deals: long - take when price > take, stop when price < stop,
+    short - take when price < take, stop when price > stop.
+    """
+
+    def __init__(self, store: object = None, cache_size: int = 256, futures: bool = True):
+        self.store = store          # backtest.KlineStore with 1m klines, optional
+        self.cache_size = cache_size
+        self.base_url = 'https://fapi.binance.com/fapi/v1' if futures else 'https://api.binance.com/api/v3'
+        self.session = requests.Session()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _cached(self, key: tuple, loader):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        value = loader()
+        with self.lock:
+            self.cache[key] = value
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return value
+
+    def _minute_klines(self, pair: str, start_ms: int, end_ms: int) -> np.ndarray:
+        """1m candles (O_time, Open, High, Low, Close) opened in [start_ms, end_ms)"""
+        def load():
+            if self.store is not None:
+                klines = self.store.load(pair, '1m')
+                first, last = np.searchsorted(klines[:, 0], [start_ms, end_ms])
+                if last - first == (end_ms - start_ms) // 60_000:
+                    return np.array(klines[first:last, :5])
+            response = self.session.get(f'{self.base_url}/klines', params={
+                'symbol': pair, 'interval': '1m', 'startTime': start_ms, 'endTime': end_ms - 1, 'limit': 1500})
+            data = response.json()
+            if not isinstance(data, list):
+                print(f'Intrabar: error fetching 1m klines ({pair}): {data}')
+                return np.empty((0, 5))
+            return np.array([candle[0:5] for candle in data], dtype=float)
+        return self._cached(('1m', pair, start_ms, end_ms), load)
+
+    def _trade_prices(self, pair: str, start_ms: int, end_ms: int) -> np.ndarray:
+        """Prices of aggregated trades in [start_ms, end_ms) in time order"""
+        def load():
+            prices = []
+            params = {'symbol': pair, 'startTime': start_ms, 'endTime': end_ms - 1, 'limit': 1000}
+            while True:
+                data = self.session.get(f'{self.base_url}/aggTrades', params=params).json()
+                if not isinstance(data, list):
+                    print(f'Intrabar: error fetching aggTrades ({pair}): {data}')
+                    break
+                prices += [float(trade['p']) for trade in data if trade['T'] < end_ms]
+                if len(data) < 1000 or data[-1]['T'] >= end_ms:
+                    break
+                params = {'symbol': pair, 'fromId': data[-1]['a'] + 1, 'limit': 1000}
+            return np.array(prices)
+        return self._cached(('trades', pair, start_ms, end_ms), load)
+
+    @staticmethod
+    def _first_hit(direction: str, take_price: float, stop_price: float, highs: np.ndarray, lows: np.ndarray) -> tuple:
+        """Index of the first take and stop crossing (len if none)"""
+        if direction == 'long':
+            take_hits, stop_hits = highs > take_price, lows < stop_price
+        else:
+            take_hits, stop_hits = lows < take_price, highs > stop_price
+        none = highs.shape[0]
+        take_index = int(take_hits.argmax()) if take_hits.any() else none
+        stop_index = int(stop_hits.argmax()) if stop_hits.any() else none
+        return take_index, stop_index
+
+    def resolve(self, pair: str, direction: str, take_price: float, stop_price: float, open_ms: int, timeframe: str = '1m') -> str:
+        """'win' or 'loss' for a bar that crossed both take and stop, None if it can't be told"""
+        end_ms = open_ms + TIMEFRAME_MS[timeframe]
+
+        if timeframe != '1m':
+            candles = self._minute_klines(pair, open_ms, end_ms)
+            if candles.shape[0] == 0:
+                return None
+            take_index, stop_index = self._first_hit(direction, take_price, stop_price, candles[:, 2], candles[:, 3])
+            if take_index != stop_index:
+                return 'win' if take_index < stop_index else 'loss'
+            if take_index == candles.shape[0]:
+                return None
+            open_ms = int(candles[take_index, 0])     # both in the same minute
+            end_ms = open_ms + 60_000
+
+        prices = self._trade_prices(pair, open_ms, end_ms)
+        if prices.shape[0] == 0:
+            return None
+        take_index, stop_index = self._first_hit(direction, take_price, stop_price, prices, prices)
+        if take_index == stop_index:
+            return None
+        return 'win' if take_index < stop_index else 'loss'
@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class LatencyHistogram:
+	"""
+	Durations of one step in milliseconds, log-scale buckets (each 10% wider than the previous one from 0.01 ms):
+	fixed memory however many samples, O(1) record, percentiles accurate to one bucket.
+	"""
+
+	MIN_MS = 0.01
+	GROWTH = 1.1
+	_LOG_GROWTH = math.log(GROWTH)
+
+	def __init__(self) -> None:
+		self.buckets: Dict[int, int] = {}
+		self.count = 0
+		self.total_ms = 0.0
+		self.min_ms = float("inf")
+		self.max_ms = 0.0
+
+	def record(self, ms: float) -> None:
+		index = 0 if ms <= self.MIN_MS else int(math.log(ms / self.MIN_MS) / self._LOG_GROWTH) + 1
+		self.buckets[index] = self.buckets.get(index, 0) + 1
+		self.count += 1
+		self.total_ms += ms
+		if ms < self.min_ms:
+			self.min_ms = ms
+		if ms > self.max_ms:
+			self.max_ms = ms
+
+	def _upper_bound(self, index: int) -> float:
+		return self.MIN_MS * self.GROWTH ** index
+
+	def percentile(self, p: float) -> Optional[float]:
+		"""Upper bound of the bucket holding the p-th percentile (clamped to the observed min/max), None if empty"""
+		if not self.count:
+			return None
+		rank = max(1, math.ceil(self.count * p / 100.0))
+		seen = 0
+		for index in sorted(self.buckets):
+			seen += self.buckets[index]
+			if seen >= rank:
+				return min(max(self._upper_bound(index), self.min_ms), self.max_ms)
+		return self.max_ms
+
+	def summary(self, percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, float]:
+		if not self.count:
+			return {"count": 0}
+		result = {
+			"count": self.count,
+			"mean": round(self.total_ms / self.count, 3),
+			"min": round(self.min_ms, 3),
+			"max": round(self.max_ms, 3),
+		}
+		for p in percentiles:
+			result[f"p{p:g}"] = round(self.percentile(p), 3)
+		return result
+
+
+class _Span:
+	__slots__ = ("timer", "step", "_started")
+
+	def __init__(self, timer: "PlacementTimer", step: str) -> None:
+		self.timer = timer
+		self.step = step
+
+	def __enter__(self) -> "_Span":
+		self._started = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc) -> bool:
+		# the step is timed whether it succeeded or raised: a slow failure is what we are looking for
+		self.timer.add(self.step, (time.perf_counter() - self._started) * 1000.0)
+		return False
+
+
+class PlacementTimer:
+	"""
+	Step durations of one placement: `with timer.span("entry"): ...` per step, finish() adds "total" and returns
+	{step: ms}. A step timed twice (an order retried alone) accumulates; every span also goes to the recorder histograms.
+	"""
+
+	def __init__(self, recorder: "LatencyRecorder") -> None:
+		self.recorder = recorder
+		self.timings: Dict[str, float] = {}
+		self._started = time.perf_counter()
+
+	def span(self, step: str) -> _Span:
+		return _Span(self, step)
+
+	def add(self, step: str, ms: float) -> None:
+		self.timings[step] = self.timings.get(step, 0.0) + ms
+		self.recorder.record(step, ms)
+
+	def finish(self) -> Dict[str, float]:
+		self.add("total", (time.perf_counter() - self._started) * 1000.0)
+		return {step: round(ms, 3) for step, ms in self.timings.items()}
+
+
+class _NullSpan:
+	__slots__ = ()
+
+	def __enter__(self) -> "_NullSpan":
+		return self
+
+	def __exit__(self, *exc) -> bool:
+		return False
+
+
+class _NullTimer:
+	"""Timer of a disabled recorder: spans are shared no-ops, nothing is read from the clock or stored"""
+
+	__slots__ = ()
+	_SPAN = _NullSpan()
+
+	def span(self, step: str) -> _NullSpan:
+		return self._SPAN
+
+	def add(self, step: str, ms: float) -> None:
+		pass
+
+	def finish(self) -> Dict[str, float]:
+		return {}
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class LatencyRecorder:
+	"""
+	Latency histograms per placement step (symbol metadata, account setup, sizing, entry, stop, take profit, trailing ...).
+	- timer() starts timing one placement; when disabled it returns a shared no-op timer
+	- summary() / format_summary() give count, mean, min, max and percentiles per step, reset() starts over
+	Thread-safe: placements of different symbols record concurrently.
+	"""
+
+	def __init__(self, enabled: bool = False, percentiles: Iterable[float] = (50, 90, 99)) -> None:
+		self.enabled = enabled
+		self.percentiles = tuple(percentiles)
+		self._histograms: Dict[str, LatencyHistogram] = {}
+		self._lock = threading.Lock()
+
+	def timer(self):
+		return PlacementTimer(self) if self.enabled else _NULL_TIMER
+
+	def record(self, step: str, ms: float) -> None:
+		with self._lock:
+			histogram = self._histograms.get(step)
+			if histogram is None:
+				histogram = self._histograms[step] = LatencyHistogram()
+			histogram.record(ms)
+
+	def summary(self) -> Dict[str, Dict[str, float]]:
+		"""{step: {"count", "mean", "min", "max", "p50", ...}} in milliseconds"""
+		with self._lock:
+			return {step: histogram.summary(self.percentiles) for step, histogram in self._histograms.items()}
+
+	def format_summary(self) -> str:
+		summary = self.summary()
+		if not summary:
+			return "no placements timed"
+		lines: List[str] = []
+		for step, stats in summary.items():
+			percentiles = " ".join(f"p{p:g}={stats[f'p{p:g}']}" for p in self.percentiles)
+			lines.append(f"{step}: n={stats['count']} mean={stats['mean']} {percentiles} max={stats['max']} ms")
+		return "\n".join(lines)
+
+	def reset(self) -> None:
+		with self._lock:
+			self._histograms.clear()
@@ -2,9 +2,12 @@ import pprint
 from dataclasses import dataclass
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 import bot_funcs as bf
+from log_sink import get_sink
 
 
 def _log_calc(enabled: bool, message: str):
@@ -13,18 +16,8 @@ def _log_calc(enabled: bool, message: str):
 
 
 def _write_calc_log(enabled: bool, event: str, details: dict):
-	if not enabled:
-		return
-	record = {
-		"ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-		"event": event,
-		"details": details,
-	}
-	try:
-		with open("logs/deal_calc.log", "a", encoding="utf-8") as f:
-			f.write(str(record) + "\n")
-	except Exception:
-		pass
+	if enabled:
+		get_sink("logs/deal_calc.log").write(event, details)
 
 
 def _level_to_dict(level) -> dict:
@@ -187,6 +180,59 @@ def find_levels(candles: pd.DataFrame, timeframe: str) -> list:
 	#     print(f'Resistance time: {resistance.time}, low: {resistance.low}, high: {resistance.high}')
 		
 	return levels
+
+
+def find_level_candidates(candles: np.ndarray) -> dict:
+	"""Level patterns of find_levels for a whole numeric candle series at once.
+	candles: array of rows O_time, Open, High, Low, Close(, Volume) in float.
+	Returns arrays indexed by pattern start: 'start', 'kind' (0 - support, 1 - resistance), 'low', 'high', 'time_ms'.
+	A pattern depends on its own 5 candles only, so candidates are computed once and any window is cut from them
+	by levels_from_candidates"""
+	n = candles.shape[0]
+	if n < 5:
+		empty = np.array([], dtype=float)
+		return {'start': np.array([], dtype=int), 'kind': np.array([], dtype=int), 'low': empty, 'high': empty, 'time_ms': empty}
+	
+	o_time, opens, highs, lows, closes = (candles[:, column] for column in range(5))
+	
+	# same pattern codes as analyze_pattern: 1 - up (green) candle, first candle is the highest bit
+	up = (opens <= closes).astype(int)
+	codes = np.zeros(n - 4, dtype=int)
+	for i in range(5):
+		codes = codes * 2 + up[i:n - 4 + i]
+	pattern_kinds = np.array([analyze_pattern([(code >> (4 - i)) & 1 for i in range(5)]) for code in range(32)])
+	kinds = pattern_kinds[codes]
+	start = np.nonzero(kinds != 2)[0]
+	kind = kinds[start]
+	
+	window = lambda values: sliding_window_view(values, 5)[start]
+	lows_w, highs_w, opens_w, closes_w = window(lows), window(highs), window(opens), window(closes)
+	is_support = kind == 0
+	
+	# argmin/argmax return the first extreme like list.index in find_levels
+	level_shift = np.where(is_support, lows_w.argmin(axis=1), highs_w.argmax(axis=1))
+	low = np.where(is_support, lows_w.min(axis=1), np.maximum(opens_w.max(axis=1), closes_w.max(axis=1)))
+	high = np.where(is_support, np.minimum(opens_w.min(axis=1), closes_w.min(axis=1)), highs_w.max(axis=1))
+	
+	return {'start': start, 'kind': kind, 'low': low, 'high': high, 'time_ms': o_time[start + level_shift]}
+
+
+def levels_from_candidates(candidates: dict, start: int, end: int, timeframe: str, prelast_candle_close: float) -> list:
+	"""Same levels as find_levels(candles[start:end], timeframe) for numeric candles"""
+	first, last = np.searchsorted(candidates['start'], [start, end - 4])
+	seen = set()
+	levels = []
+	
+	window = zip(*(candidates[key][first:last].tolist() for key in ('kind', 'time_ms', 'low', 'high')))
+	for kind, time_ms, low, high in window:
+		if (kind, time_ms, low, high) in seen:
+			continue
+		seen.add((kind, time_ms, low, high))
+		
+		level_class = Support if kind == 0 else Resistance
+		levels.append(level_class(time=datetime.fromtimestamp(time_ms/1000), low=low, high=high, timeframe=timeframe))
+	
+	return check_level_breaks(levels, prelast_candle_close)
 					
 
 
@@ -0,0 +1,168 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class JsonlLogSink:
+	"""
+	Buffered JSONL log file: one {"ts", "event", "details"} line per record.
+	- write() only puts the record on an in-memory queue; formatting and disk writes happen in a background thread,
+	  so details must not be mutated by the caller afterwards
+	- the thread writes what has queued up every flush_interval_sec (at once after max_batch records), the file stays open
+	- rotation: once the file exceeds max_bytes or was opened more than rotate_interval_sec ago (0 - never) it becomes path.1,
+	  path.1 becomes path.2 ... up to backup_count files
+	- flush() returns when everything written before it is on disk, close() flushes and stops the thread;
+	  every sink is closed at interpreter exit
+	"""
+
+	_STOP = object()
+
+	def __init__(self, path: str, *, flush_interval_sec: float = 0.5, max_batch: int = 1000, max_bytes: int = 50 * 1024 * 1024,
+			backup_count: int = 5, rotate_interval_sec: float = 0.0) -> None:
+		self.path = path
+		self.flush_interval_sec = flush_interval_sec
+		self.max_batch = max_batch
+		self.max_bytes = max_bytes
+		self.backup_count = backup_count
+		self.rotate_interval_sec = rotate_interval_sec
+		self.queue: "queue.SimpleQueue" = queue.SimpleQueue()
+		self._file = None
+		self._opened_at = 0.0
+		self._thread: Optional[threading.Thread] = None
+		self._start_lock = threading.Lock()
+
+	def write(self, event: str, details: Optional[Dict[str, Any]] = None) -> None:
+		if self._thread is None:
+			self._start()
+		self.queue.put((time.time(), event, details))
+
+	def _start(self) -> None:
+		with self._start_lock:
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._run, name=f"log_sink:{os.path.basename(self.path)}", daemon=True)
+				self._thread.start()
+
+	def flush(self, timeout: Optional[float] = None) -> bool:
+		if self._thread is None or not self._thread.is_alive():
+			return True
+		barrier = threading.Event()
+		self.queue.put(barrier)
+		return barrier.wait(timeout)
+
+	def close(self, timeout: Optional[float] = None) -> None:
+		if self._thread is None or not self._thread.is_alive():
+			return
+		self.queue.put(self._STOP)
+		self._thread.join(timeout)
+		# a later write() starts a new thread
+		self._thread = None
+
+	def _run(self) -> None:
+		running = True
+		while running:
+			batch = [self.queue.get()]
+			deadline = time.monotonic() + self.flush_interval_sec
+			# collect whatever arrives within flush_interval_sec, a barrier or stop closes the batch at once
+			while len(batch) < self.max_batch and isinstance(batch[-1], tuple):
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					break
+				try:
+					batch.append(self.queue.get(timeout=remaining))
+				except queue.Empty:
+					break
+
+			records = [item for item in batch if isinstance(item, tuple)]
+			if records:
+				try:
+					self._write_batch(records)
+				except Exception as ex:
+					# logging must never take the bot down: the batch is dropped, the next one reopens the file
+					print(f"JsonlLogSink: writing {self.path} failed: {ex}")
+					self._close_file()
+
+			for item in batch:
+				if isinstance(item, threading.Event):
+					item.set()
+				elif item is self._STOP:
+					running = False
+		self._close_file()
+
+	def _format(self, record: tuple) -> str:
+		ts, event, details = record
+		line = {"ts": datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"), "event": event, "details": details or {}}
+		return json.dumps(line, ensure_ascii=False, default=str) + "\n"
+
+	def _write_batch(self, records: list) -> None:
+		if self._file is None:
+			self._open_file()
+		elif self._should_rotate():
+			self._rotate()
+		self._file.write("".join(self._format(record) for record in records))
+		self._file.flush()
+
+	def _open_file(self) -> None:
+		directory = os.path.dirname(self.path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self._file = open(self.path, "a", encoding="utf-8")
+		self._opened_at = time.time()
+
+	def _close_file(self) -> None:
+		if self._file is not None:
+			try:
+				self._file.close()
+			except Exception:
+				pass
+			self._file = None
+
+	def _should_rotate(self) -> bool:
+		if self.max_bytes and self._file.tell() >= self.max_bytes:
+			return True
+		return bool(self.rotate_interval_sec) and time.time() - self._opened_at >= self.rotate_interval_sec
+
+	def _rotate(self) -> None:
+		self._close_file()
+		if self.backup_count > 0:
+			for index in range(self.backup_count - 1, 0, -1):
+				older = f"{self.path}.{index}"
+				if os.path.exists(older):
+					os.replace(older, f"{self.path}.{index + 1}")
+			os.replace(self.path, f"{self.path}.1")
+		else:
+			os.remove(self.path)
+		self._open_file()
+
+
+_sinks: Dict[str, JsonlLogSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path: str, **options: Any) -> JsonlLogSink:
+	"""Process-wide sink of the file (options apply when it is created): every writer of one path shares its queue and thread"""
+	sink = _sinks.get(path)
+	if sink is None:
+		with _sinks_lock:
+			sink = _sinks.get(path)
+			if sink is None:
+				sink = _sinks[path] = JsonlLogSink(path, **options)
+	return sink
+
+
+def flush_all(timeout: Optional[float] = None) -> None:
+	for sink in list(_sinks.values()):
+		sink.flush(timeout)
+
+
+def close_all(timeout: Optional[float] = 5.0) -> None:
+	for sink in list(_sinks.values()):
+		sink.close(timeout)
+
+
+# records still queued at exit are written before the interpreter stops the daemon threads
+atexit.register(close_all)
@@ -0,0 +1,852 @@
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from user_stream import account_update_event, order_update_event
+
+
+INTERVAL_MS = {
+	"1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+	"1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000, "8h": 28_800_000, "12h": 43_200_000,
+	"1d": 86_400_000, "3d": 259_200_000, "1w": 604_800_000,
+}
+
+CONDITIONAL_ORDER_TYPES = ("STOP_MARKET", "TAKE_PROFIT_MARKET", "TRAILING_STOP_MARKET")
+
+
+class MockApiError(Exception):
+	"""Binance error response: HTTP status and {"code", "msg"} body"""
+
+	def __init__(self, code: int, msg: str, status: int = 400) -> None:
+		super().__init__(msg)
+		self.code = code
+		self.msg = msg
+		self.status = status
+
+
+@dataclass
+class SymbolSpec:
+	"""Mock symbol: reference price the synthetic klines oscillate around and its trading filters"""
+	symbol: str
+	price: float
+	tick_size: str = "0.01"
+	step_size: str = "0.001"
+	min_qty: str = "0.001"
+	min_notional: str = "5"
+
+	def symbol_info(self) -> Dict[str, Any]:
+		base = self.symbol[:-4] if self.symbol.endswith("USDT") else self.symbol
+		return {
+			"symbol": self.symbol,
+			"pair": self.symbol,
+			"contractType": "PERPETUAL",
+			"status": "TRADING",
+			"baseAsset": base,
+			"quoteAsset": "USDT",
+			"marginAsset": "USDT",
+			"pricePrecision": _decimals(self.tick_size),
+			"quantityPrecision": _decimals(self.step_size),
+			"filters": [
+				{"filterType": "PRICE_FILTER", "minPrice": self.tick_size, "maxPrice": "10000000", "tickSize": self.tick_size},
+				{"filterType": "LOT_SIZE", "minQty": self.min_qty, "maxQty": "10000000", "stepSize": self.step_size},
+				{"filterType": "MARKET_LOT_SIZE", "minQty": self.min_qty, "maxQty": "10000000", "stepSize": self.step_size},
+				{"filterType": "MIN_NOTIONAL", "notional": self.min_notional},
+			],
+			"orderTypes": ["LIMIT", "MARKET", "STOP", "STOP_MARKET", "TAKE_PROFIT", "TAKE_PROFIT_MARKET", "TRAILING_STOP_MARKET"],
+			"timeInForce": ["GTC", "IOC", "FOK", "GTX"],
+		}
+
+
+DEFAULT_SYMBOLS = (
+	SymbolSpec("BTCUSDT", 60000.0, tick_size="0.10", min_notional="100"),
+	SymbolSpec("ETHUSDT", 3000.0, min_notional="20"),
+	SymbolSpec("BNBUSDT", 600.0),
+	SymbolSpec("SOLUSDT", 150.0, tick_size="0.0100", step_size="1", min_qty="1"),
+	SymbolSpec("XRPUSDT", 0.6, tick_size="0.0001", step_size="0.1", min_qty="0.1"),
+)
+
+
+def _decimals(step: str) -> int:
+	return len(step.rstrip("0").split(".")[1]) if "." in step.rstrip("0") else 0
+
+
+def _fmt(value: float, step: str = "0.00000001") -> str:
+	return f"{value:.{_decimals(step)}f}"
+
+
+def _is_multiple(value: float, step: str) -> bool:
+	step_value = float(step)
+	return step_value <= 0 or abs(value / step_value - round(value / step_value)) < 1e-6
+
+
+class MockFuturesExchange:
+	"""
+	Local Binance USDT-M futures exchange for offline end-to-end runs and load tests, classic /fapi and PM /papi/v1/um.
+	- market data: exchangeInfo, klines (deterministic synthetic series per seed), ticker/24hr, ticker/price, premiumIndex
+	- trading: order, batchOrders, openOrders, allOpenOrders, positionRisk, account, leverage, marginType, listenKey;
+	  LIMIT / MARKET orders fill against the mark price, STOP / TAKE_PROFIT / TRAILING_STOP_MARKET trigger on set_price()
+	- latency_ms + jitter_ms per request (path_latency_ms per path), inject_error() and error_rate failures
+	- X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* headers, -1003 with HTTP 429 above weight_limit
+	- with api_key / api_secret set, signed requests are checked: API key (-2015), signature (-1022), recvWindow (-1021)
+	- attach_stream(LocalUserDataStream()) delivers ORDER_TRADE_UPDATE / ACCOUNT_UPDATE events of the mock account
+	start() serves HTTP on host:port (port 0: any free one, see self.url); handle() answers without HTTP.
+	"""
+
+	def __init__(self, *, symbols: Optional[List[SymbolSpec]] = None, extra_symbols: int = 0, balance_usdt: float = 10000.0,
+			latency_ms: float = 0.0, jitter_ms: float = 0.0, path_latency_ms: Optional[Dict[str, float]] = None,
+			error_rate: float = 0.0, weight_limit: int = 2400, api_key: Optional[str] = None, api_secret: Optional[str] = None,
+			clock_offset_ms: int = 0, seed: int = 0, clock: Optional[Callable[[], float]] = None,
+			host: str = "127.0.0.1", port: int = 0) -> None:
+		specs = list(symbols or DEFAULT_SYMBOLS)
+		for i in range(extra_symbols):
+			# synthetic pairs for scan load tests
+			specs.append(SymbolSpec(f"MOCK{i:03d}USDT", round(1.0 + (zlib.crc32(f"{seed}:{i}".encode()) % 50000) / 100.0, 2)))
+		self.symbols: Dict[str, SymbolSpec] = {spec.symbol: spec for spec in specs}
+		self.latency_ms = latency_ms
+		self.jitter_ms = jitter_ms
+		self.path_latency_ms = dict(path_latency_ms or {})
+		self.error_rate = error_rate
+		self.weight_limit = weight_limit
+		self.api_key = api_key
+		self.api_secret = api_secret
+		self.clock_offset_ms = clock_offset_ms
+		self.seed = seed
+		self.clock = clock or time.time
+		self.host = host
+		self.port = port
+		self.wallet_usdt = balance_usdt
+		self.stream: Any = None
+		self.request_log: List[Tuple[str, str]] = []
+		self._rng = random.Random(seed)
+		self._lock = threading.RLock()
+		self._errors: List[Dict[str, Any]] = []
+		self._prices: Dict[str, float] = {}
+		self._klines: Dict[Tuple[str, str], List[list]] = {}
+		self._orders: Dict[int, Dict[str, Any]] = {}
+		self._positions: Dict[str, Dict[str, float]] = {}
+		self._settings: Dict[str, Dict[str, Any]] = {}
+		self._next_order_id = 1
+		self._events: List[Dict[str, Any]] = []		# stream events of the request being handled, published after the lock
+		self._weight_minute = 0
+		self._used_weight = 0
+		self._order_windows: Dict[str, Tuple[int, int]] = {}
+		self._server: Optional[ThreadingHTTPServer] = None
+		self._thread: Optional[threading.Thread] = None
+		self._routes = self._build_routes()
+
+	# -------- Lifecycle --------
+	@property
+	def url(self) -> str:
+		return f"http://{self.host}:{self.port}"
+
+	def start(self) -> "MockFuturesExchange":
+		if self._server is not None:
+			return self
+		self._server = ThreadingHTTPServer((self.host, self.port), _MockRequestHandler)
+		self._server.daemon_threads = True
+		self._server.exchange = self
+		self.port = self._server.server_address[1]
+		self._thread = threading.Thread(target=self._server.serve_forever, name="mock_exchange", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+	def __enter__(self) -> "MockFuturesExchange":
+		return self.start()
+
+	def __exit__(self, *exc) -> None:
+		self.stop()
+
+	def attach_stream(self, stream: Any) -> None:
+		"""Any object with push(event), e.g. user_stream.LocalUserDataStream"""
+		self.stream = stream
+
+	# -------- Scenario control --------
+	def now_ms(self) -> int:
+		return int(self.clock() * 1000)
+
+	def set_price(self, symbol: str, price: float) -> None:
+		"""Moves the mark price: resting LIMIT orders fill, conditional orders trigger"""
+		events: List[Dict[str, Any]] = []
+		with self._lock:
+			self._prices[symbol] = float(price)
+			self._match(symbol, events)
+		self._publish(events)
+
+	def mark_price(self, symbol: str) -> float:
+		price = self._prices.get(symbol)
+		return price if price is not None else self._curve(symbol, self.now_ms() / 1000.0)
+
+	def set_klines(self, symbol: str, interval: str, rows: List[list]) -> None:
+		"""Serves these klines (Binance row format) instead of the synthetic series"""
+		self._klines[(symbol, interval)] = rows
+
+	def inject_error(self, path: str, *, code: int = -1001, msg: str = "Internal error; unable to process your request. Please try again.",
+			status: int = 400, times: int = 1, method: Optional[str] = None) -> None:
+		"""Next `times` requests to path (optionally only of method) fail with this Binance error"""
+		with self._lock:
+			self._errors.append({"path": path, "method": method, "code": code, "msg": msg, "status": status, "remaining": times})
+
+	def open_orders(self, symbol: Optional[str] = None) -> List[Dict[str, Any]]:
+		with self._lock:
+			return [dict(o) for o in self._orders.values() if o["status"] == "NEW" and (symbol is None or o["symbol"] == symbol)]
+
+	def position_amount(self, symbol: str) -> float:
+		return self._positions.get(symbol, {}).get("amount", 0.0)
+
+	def reset_account(self, balance_usdt: Optional[float] = None) -> None:
+		with self._lock:
+			self._orders.clear()
+			self._positions.clear()
+			self._settings.clear()
+			if balance_usdt is not None:
+				self.wallet_usdt = balance_usdt
+
+	# -------- Request handling --------
+	def _build_routes(self) -> Dict[Tuple[str, str], Tuple[Callable, Any, str]]:
+		# (method, path) -> (handler, weight or weight(params), security: NONE / USER_STREAM / SIGNED)
+		public = {
+			("GET", "/fapi/v1/ping"): (lambda p: {}, 1, "NONE"),
+			("GET", "/fapi/v1/time"): (lambda p: {"serverTime": self.now_ms() + self.clock_offset_ms}, 1, "NONE"),
+			("GET", "/fapi/v1/exchangeInfo"): (self._exchange_info, 1, "NONE"),
+			("GET", "/fapi/v1/klines"): (self._klines_endpoint, _klines_weight, "NONE"),
+			("GET", "/api/v3/klines"): (self._klines_endpoint, 2, "NONE"),
+			("GET", "/fapi/v1/ticker/24hr"): (self._ticker_24hr, lambda p: 1 if p.get("symbol") else 40, "NONE"),
+			("GET", "/fapi/v1/ticker/price"): (self._ticker_price, lambda p: 1 if p.get("symbol") else 2, "NONE"),
+			("GET", "/fapi/v1/premiumIndex"): (self._premium_index, lambda p: 1 if p.get("symbol") else 10, "NONE"),
+		}
+		account = {
+			("POST", "/order"): (self._new_order, 0, "SIGNED"),
+			("GET", "/order"): (self._query_order, 1, "SIGNED"),
+			("DELETE", "/order"): (self._cancel_order, 1, "SIGNED"),
+			("POST", "/batchOrders"): (self._batch_orders, 5, "SIGNED"),
+			("GET", "/openOrders"): (self._open_orders, lambda p: 1 if p.get("symbol") else 40, "SIGNED"),
+			("DELETE", "/allOpenOrders"): (self._cancel_all, 1, "SIGNED"),
+			("GET", "/positionRisk"): (self._position_risk, 5, "SIGNED"),
+			("GET", "/account"): (self._account, 5, "SIGNED"),
+			("POST", "/leverage"): (self._leverage, 1, "SIGNED"),
+			("POST", "/marginType"): (self._margin_type, 1, "SIGNED"),
+			("GET", "/premiumIndex"): (self._premium_index, 1, "NONE"),
+		}
+		routes = dict(public)
+		for (method, suffix), route in account.items():
+			routes[(method, f"/papi/v1/um{suffix}")] = route
+			if suffix in ("/positionRisk", "/account"):
+				routes[(method, f"/fapi/v2{suffix}")] = route
+				routes[(method, f"/fapi/v3{suffix}")] = route
+			elif suffix != "/premiumIndex":
+				routes[(method, f"/fapi/v1{suffix}")] = route
+		for prefix in ("/fapi/v1", "/papi/v1"):
+			routes[("POST", f"{prefix}/listenKey")] = (lambda p: {"listenKey": f"mock-{self.seed}-listen-key"}, 1, "USER_STREAM")
+			routes[("PUT", f"{prefix}/listenKey")] = (lambda p: {}, 1, "USER_STREAM")
+			routes[("DELETE", f"{prefix}/listenKey")] = (lambda p: {}, 1, "USER_STREAM")
+		routes[("GET", "/papi/v1/ping")] = (lambda p: {}, 1, "NONE")
+		return routes
+
+	def handle(self, method: str, path: str, query: str = "", body: str = "", headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any, Dict[str, str]]:
+		"""One request: (HTTP status, JSON payload, response headers)"""
+		headers = headers or {}
+		self._sleep(path)
+		params = dict(parse_qsl(query, keep_blank_values=True))
+		params.update(parse_qsl(body, keep_blank_values=True))
+		route = self._routes.get((method, path))
+		if route is None:
+			return 404, {"code": -5000, "msg": f"Path {path}, Method {method} is invalid"}, {}
+		handler, weight, security = route
+		response_headers: Dict[str, str] = {}
+		events: List[Dict[str, Any]] = []
+		try:
+			with self._lock:
+				self.request_log.append((method, path))
+				self._count_weight(weight(params) if callable(weight) else weight, response_headers)
+				if method == "POST" and path.endswith(("/order", "/batchOrders")):
+					self._count_orders(params.get("batchOrders", "").count("{") or 1, response_headers)
+				self._injected_error(method, path)
+				if security != "NONE":
+					self._authorize(security, query, body, params, headers)
+				self._events = events
+				payload = handler(params)
+			self._publish(events)
+			return 200, payload, response_headers
+		except MockApiError as ex:
+			return ex.status, {"code": ex.code, "msg": ex.msg}, response_headers
+
+	def _sleep(self, path: str) -> None:
+		delay_ms = self.path_latency_ms.get(path, self.latency_ms)
+		if self.jitter_ms:
+			with self._lock:
+				delay_ms += self._rng.uniform(0, self.jitter_ms)
+		if delay_ms > 0:
+			time.sleep(delay_ms / 1000.0)
+
+	def _count_weight(self, weight: int, response_headers: Dict[str, str]) -> None:
+		minute = self.now_ms() // 60_000
+		if minute != self._weight_minute:
+			self._weight_minute = minute
+			self._used_weight = 0
+		self._used_weight += weight
+		response_headers["X-MBX-USED-WEIGHT-1M"] = str(self._used_weight)
+		if self._used_weight > self.weight_limit:
+			raise MockApiError(-1003, f"Too many requests; current limit is {self.weight_limit} requests per minute.", 429)
+
+	def _count_orders(self, count: int, response_headers: Dict[str, str]) -> None:
+		now = self.now_ms()
+		for name, window_ms in (("10S", 10_000), ("1M", 60_000)):
+			window, used = self._order_windows.get(name, (0, 0))
+			if now // window_ms != window:
+				window, used = now // window_ms, 0
+			self._order_windows[name] = (window, used + count)
+			response_headers[f"X-MBX-ORDER-COUNT-{name}"] = str(used + count)
+
+	def _injected_error(self, method: str, path: str) -> None:
+		for rule in self._errors:
+			if rule["path"] == path and rule["method"] in (None, method) and rule["remaining"] > 0:
+				rule["remaining"] -= 1
+				raise MockApiError(rule["code"], rule["msg"], rule["status"])
+		if self.error_rate and self._rng.random() < self.error_rate:
+			raise MockApiError(-1001, "Internal error; unable to process your request. Please try again.", 503)
+
+	def _authorize(self, security: str, query: str, body: str, params: Dict[str, str], headers: Dict[str, str]) -> None:
+		if self.api_key is not None and headers.get("X-MBX-APIKEY") != self.api_key:
+			raise MockApiError(-2015, "Invalid API-key, IP, or permissions for action.", 401)
+		if security != "SIGNED":
+			return
+		if "timestamp" not in params:
+			raise MockApiError(-1102, "Mandatory parameter 'timestamp' was not sent, was empty/null, or malformed.")
+		if self.api_secret is not None:
+			total_params = re.sub(r"&?signature=[0-9a-fA-F]*", "", query) + re.sub(r"&?signature=[0-9a-fA-F]*", "", body)
+			expected = hmac.new(self.api_secret.encode(), total_params.encode(), hashlib.sha256).hexdigest()
+			if not hmac.compare_digest(expected, params.get("signature", "")):
+				raise MockApiError(-1022, "Signature for this request is not valid.")
+		server_ms = self.now_ms() + self.clock_offset_ms
+		timestamp = int(params["timestamp"])
+		recv_window = int(params.get("recvWindow", 5000))
+		if timestamp >= server_ms + 1000 or server_ms - timestamp > recv_window:
+			raise MockApiError(-1021, "Timestamp for this request is outside of the recvWindow.")
+
+	def _publish(self, events: List[Dict[str, Any]]) -> None:
+		# outside the lock: a subscriber may call back into the exchange over HTTP
+		if self.stream is not None:
+			for event in events:
+				self.stream.push(event)
+
+	# -------- Market data --------
+	def _spec(self, params: Dict[str, str]) -> SymbolSpec:
+		spec = self.symbols.get(params.get("symbol", ""))
+		if spec is None:
+			raise MockApiError(-1121, "Invalid symbol.")
+		return spec
+
+	def _noise(self, symbol: str, point: int) -> float:
+		return (zlib.crc32(f"{self.seed}:{symbol}:{point}".encode()) % 20001) / 10000.0 - 1.0
+
+	def _curve(self, symbol: str, t_sec: float) -> float:
+		"""Deterministic price path: daily and 3-hour swings plus per-minute noise around the reference price"""
+		spec = self.symbols[symbol]
+		phase = (zlib.crc32(symbol.encode()) % 1000) / 1000.0 * 2 * math.pi
+		swing = 0.03 * math.sin(2 * math.pi * t_sec / 86400 + phase) + 0.01 * math.sin(2 * math.pi * t_sec / 10800 + 2 * phase)
+		return spec.price * (1 + swing + 0.002 * self._noise(symbol, int(t_sec // 60)))
+
+	def _kline(self, spec: SymbolSpec, interval_ms: int, open_ms: int) -> list:
+		points = [self._curve(spec.symbol, (open_ms + interval_ms * k / 4) / 1000.0) for k in range(5)]
+		wick = spec.price * 0.001 * (1 + self._noise(spec.symbol, open_ms // interval_ms))
+		high, low = max(points) + wick, min(points) - wick
+		volume = 1000 * (2 + self._noise(spec.symbol, -open_ms // interval_ms))
+		tick = spec.tick_size
+		return [open_ms, _fmt(points[0], tick), _fmt(high, tick), _fmt(low, tick), _fmt(points[-1], tick), _fmt(volume, spec.step_size),
+				open_ms + interval_ms - 1, _fmt(volume * points[-1], "0.0001"), 100, _fmt(volume / 2, spec.step_size), _fmt(volume * points[-1] / 2, "0.0001"), "0"]
+
+	def _klines_endpoint(self, params: Dict[str, str]) -> List[list]:
+		spec = self._spec(params)
+		interval = params.get("interval", "")
+		if interval not in INTERVAL_MS:
+			raise MockApiError(-1120, "Invalid interval.")
+		limit = min(int(params.get("limit", 500)), 1500)
+		rows = self._klines.get((spec.symbol, interval))
+		if rows is not None:
+			return rows[-limit:]
+		interval_ms = INTERVAL_MS[interval]
+		end_ms = int(params["endTime"]) if "endTime" in params else self.now_ms()
+		last_open = end_ms // interval_ms * interval_ms
+		first_open = last_open - (limit - 1) * interval_ms
+		if "startTime" in params:
+			first_open = max(first_open, -(-int(params["startTime"]) // interval_ms) * interval_ms)
+		return [self._kline(spec, interval_ms, open_ms) for open_ms in range(first_open, last_open + 1, interval_ms)]
+
+	def _exchange_info(self, params: Dict[str, str]) -> Dict[str, Any]:
+		return {
+			"timezone": "UTC",
+			"serverTime": self.now_ms(),
+			"rateLimits": [{"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1, "limit": self.weight_limit}],
+			"symbols": [spec.symbol_info() for spec in self.symbols.values()],
+		}
+
+	def _for_symbols(self, params: Dict[str, str], build: Callable[[SymbolSpec], Dict[str, Any]]) -> Any:
+		if params.get("symbol"):
+			return build(self._spec(params))
+		return [build(spec) for spec in self.symbols.values()]
+
+	def _ticker_24hr(self, params: Dict[str, str]) -> Any:
+		def build(spec: SymbolSpec) -> Dict[str, Any]:
+			now = self.now_ms()
+			last, open_price = self.mark_price(spec.symbol), self._curve(spec.symbol, now / 1000.0 - 86400)
+			volume = 1_000_000 * (1 + (zlib.crc32(f"{self.seed}:{spec.symbol}:volume".encode()) % 1000) / 10.0) / spec.price
+			return {
+				"symbol": spec.symbol,
+				"priceChange": _fmt(last - open_price, spec.tick_size),
+				"priceChangePercent": f"{(last / open_price - 1) * 100:.3f}",
+				"lastPrice": _fmt(last, spec.tick_size),
+				"openPrice": _fmt(open_price, spec.tick_size),
+				"highPrice": _fmt(max(last, open_price) * 1.01, spec.tick_size),
+				"lowPrice": _fmt(min(last, open_price) * 0.99, spec.tick_size),
+				"volume": _fmt(volume, spec.step_size),
+				"quoteVolume": _fmt(volume * last, "0.01"),
+				"openTime": now - 86_400_000,
+				"closeTime": now,
+				"count": 100000,
+			}
+		return self._for_symbols(params, build)
+
+	def _ticker_price(self, params: Dict[str, str]) -> Any:
+		return self._for_symbols(params, lambda spec: {"symbol": spec.symbol, "price": _fmt(self.mark_price(spec.symbol), spec.tick_size), "time": self.now_ms()})
+
+	def _premium_index(self, params: Dict[str, str]) -> Any:
+		def build(spec: SymbolSpec) -> Dict[str, Any]:
+			mark = _fmt(self.mark_price(spec.symbol), spec.tick_size)
+			return {"symbol": spec.symbol, "markPrice": mark, "indexPrice": mark, "estimatedSettlePrice": mark, "lastFundingRate": "0.00010000",
+					"interestRate": "0.00010000", "nextFundingTime": (self.now_ms() // 28_800_000 + 1) * 28_800_000, "time": self.now_ms()}
+		return self._for_symbols(params, build)
+
+	# -------- Account --------
+	def _symbol_settings(self, symbol: str) -> Dict[str, Any]:
+		return self._settings.setdefault(symbol, {"leverage": 20, "margin_type": "CROSSED"})
+
+	def _unrealized(self, symbol: str) -> float:
+		pos = self._positions.get(symbol)
+		if not pos or not pos["amount"]:
+			return 0.0
+		return (self.mark_price(symbol) - pos["entry_price"]) * pos["amount"]
+
+	def _used_margin(self) -> float:
+		used = 0.0
+		for symbol, pos in self._positions.items():
+			used += abs(pos["amount"]) * self.mark_price(symbol) / self._symbol_settings(symbol)["leverage"]
+		for order in self._orders.values():
+			if order["status"] == "NEW" and order["type"] in ("LIMIT", "MARKET") and not order["reduceOnly"]:
+				used += float(order["origQty"]) * float(order["price"] or self.mark_price(order["symbol"])) / self._symbol_settings(order["symbol"])["leverage"]
+		return used
+
+	def _balances(self) -> Tuple[float, float, float]:
+		unrealized = sum(self._unrealized(symbol) for symbol in self._positions)
+		available = self.wallet_usdt + unrealized - self._used_margin()
+		return self.wallet_usdt, unrealized, max(available, 0.0)
+
+	def _position_row(self, spec: SymbolSpec) -> Dict[str, Any]:
+		pos = self._positions.get(spec.symbol, {"amount": 0.0, "entry_price": 0.0})
+		settings = self._symbol_settings(spec.symbol)
+		mark = self.mark_price(spec.symbol)
+		return {
+			"symbol": spec.symbol,
+			"positionAmt": _fmt(pos["amount"], spec.step_size),
+			"entryPrice": _fmt(pos["entry_price"], "0.00000001"),
+			"markPrice": _fmt(mark, "0.00000001"),
+			"unRealizedProfit": _fmt(self._unrealized(spec.symbol)),
+			"unrealizedProfit": _fmt(self._unrealized(spec.symbol)),
+			"liquidationPrice": "0",
+			"leverage": str(settings["leverage"]),
+			"marginType": "isolated" if settings["margin_type"] == "ISOLATED" else "cross",
+			"isolated": settings["margin_type"] == "ISOLATED",
+			"initialMargin": _fmt(abs(pos["amount"]) * mark / settings["leverage"]),
+			"notional": _fmt(pos["amount"] * mark),
+			"positionSide": "BOTH",
+			"updateTime": self.now_ms(),
+		}
+
+	def _position_risk(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+		specs = [self._spec(params)] if params.get("symbol") else list(self.symbols.values())
+		return [self._position_row(spec) for spec in specs]
+
+	def _account(self, params: Dict[str, str]) -> Dict[str, Any]:
+		wallet, unrealized, available = self._balances()
+		return {
+			"feeTier": 0,
+			"canTrade": True,
+			"totalWalletBalance": _fmt(wallet),
+			"totalUnrealizedProfit": _fmt(unrealized),
+			"totalMarginBalance": _fmt(wallet + unrealized),
+			"availableBalance": _fmt(available),
+			"maxWithdrawAmount": _fmt(available),
+			"assets": [{
+				"asset": "USDT",
+				"walletBalance": _fmt(wallet),
+				"unrealizedProfit": _fmt(unrealized),
+				"marginBalance": _fmt(wallet + unrealized),
+				"crossWalletBalance": _fmt(wallet),
+				"availableBalance": _fmt(available),
+				"maxWithdrawAmount": _fmt(available),
+			}],
+			"positions": [self._position_row(spec) for spec in self.symbols.values()],
+		}
+
+	def _leverage(self, params: Dict[str, str]) -> Dict[str, Any]:
+		spec = self._spec(params)
+		leverage = int(params.get("leverage", 0))
+		if not 1 <= leverage <= 125:
+			raise MockApiError(-4028, f"Leverage {leverage} is not valid")
+		self._symbol_settings(spec.symbol)["leverage"] = leverage
+		return {"symbol": spec.symbol, "leverage": leverage, "maxNotionalValue": "1000000"}
+
+	def _margin_type(self, params: Dict[str, str]) -> Dict[str, Any]:
+		spec = self._spec(params)
+		margin_type = {"CROSS": "CROSSED"}.get(params.get("marginType", "").upper(), params.get("marginType", "").upper())
+		if margin_type not in ("ISOLATED", "CROSSED"):
+			raise MockApiError(-4044, "The margin type is invalid.")
+		settings = self._symbol_settings(spec.symbol)
+		if settings["margin_type"] == margin_type:
+			raise MockApiError(-4046, "No need to change margin type.")
+		if self.position_amount(spec.symbol) or any(o["symbol"] == spec.symbol and o["status"] == "NEW" for o in self._orders.values()):
+			raise MockApiError(-4048, "Margin type cannot be changed if there exists position.")
+		settings["margin_type"] = margin_type
+		return {"code": 200, "msg": "success"}
+
+	# -------- Orders --------
+	def _new_order(self, params: Dict[str, str]) -> Dict[str, Any]:
+		spec = self._spec(params)
+		side = params.get("side", "").upper()
+		order_type = params.get("type", "").upper()
+		if side not in ("BUY", "SELL"):
+			raise MockApiError(-1117, "Invalid side.")
+		if order_type not in ("LIMIT", "MARKET") + CONDITIONAL_ORDER_TYPES:
+			raise MockApiError(-1116, "Invalid orderType.")
+		close_position = params.get("closePosition", "false").lower() == "true"
+		reduce_only = close_position or params.get("reduceOnly", "false").lower() == "true"
+		quantity = float(params.get("quantity", 0) or 0)
+		price = float(params.get("price", 0) or 0)
+		stop_price = float(params.get("stopPrice", 0) or 0)
+		if not close_position:
+			if quantity < float(spec.min_qty):
+				raise MockApiError(-4003, "Quantity less than or equal to zero." if quantity <= 0 else "Quantity less than min qty.")
+			if not _is_multiple(quantity, spec.step_size):
+				raise MockApiError(-1111, "Precision is over the maximum defined for this asset.")
+		for value in (price, stop_price, float(params.get("activationPrice", 0) or 0)):
+			if value and not _is_multiple(value, spec.tick_size):
+				raise MockApiError(-4014, "Price not increased by tick size.")
+		if order_type == "LIMIT" and price <= 0:
+			raise MockApiError(-1102, "Mandatory parameter 'price' was not sent, was empty/null, or malformed.")
+		if order_type in ("STOP_MARKET", "TAKE_PROFIT_MARKET") and stop_price <= 0:
+			raise MockApiError(-1102, "Mandatory parameter 'stopPrice' was not sent, was empty/null, or malformed.")
+		if order_type == "TRAILING_STOP_MARKET" and not 0.1 <= float(params.get("callbackRate", 0) or 0) <= 5:
+			raise MockApiError(-2007, "Invalid callBack rate.")
+		if order_type in ("LIMIT", "MARKET"):
+			mark = self.mark_price(spec.symbol)
+			if not reduce_only and quantity * (price or mark) < float(spec.min_notional):
+				raise MockApiError(-4164, f"Order's notional must be no smaller than {spec.min_notional} (unless you choose reduce only).")
+			pos_amount = self.position_amount(spec.symbol)
+			if reduce_only and (pos_amount == 0 or (pos_amount > 0) == (side == "BUY")):
+				raise MockApiError(-2022, "ReduceOnly Order is rejected.")
+			_, _, available = self._balances()
+			if not reduce_only and quantity * (price or mark) / self._symbol_settings(spec.symbol)["leverage"] > available:
+				raise MockApiError(-2019, "Margin is insufficient.")
+		order_id = self._next_order_id
+		self._next_order_id += 1
+		now = self.now_ms()
+		order = {
+			"orderId": order_id,
+			"symbol": spec.symbol,
+			"status": "NEW",
+			"clientOrderId": params.get("newClientOrderId") or f"mock_{order_id}",
+			"price": params.get("price", "0"),
+			"avgPrice": "0",
+			"origQty": params.get("quantity", "0"),
+			"executedQty": "0",
+			"cumQuote": "0",
+			"timeInForce": params.get("timeInForce", "GTC"),
+			"type": order_type,
+			"origType": order_type,
+			"reduceOnly": reduce_only,
+			"closePosition": close_position,
+			"side": side,
+			"positionSide": params.get("positionSide", "BOTH"),
+			"stopPrice": params.get("stopPrice", "0"),
+			"workingType": params.get("workingType", "CONTRACT_PRICE"),
+			"priceProtect": False,
+			"time": now,
+			"updateTime": now,
+		}
+		if order_type == "TRAILING_STOP_MARKET":
+			order["activatePrice"] = params.get("activationPrice") or _fmt(self.mark_price(spec.symbol), spec.tick_size)
+			order["priceRate"] = params.get("callbackRate")
+			order["_activated"] = "activationPrice" not in params
+			order["_extreme"] = self.mark_price(spec.symbol)
+		self._orders[order_id] = order
+		self._emit_order(order)
+		self._match(spec.symbol, self._events)
+		return self._public(order)
+
+	def _batch_orders(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+		try:
+			batch = json.loads(params.get("batchOrders", ""))
+		except ValueError:
+			raise MockApiError(-1130, "Data sent for parameter 'batchOrders' is not valid.")
+		if not isinstance(batch, list) or not 1 <= len(batch) <= 5:
+			raise MockApiError(-1130, "Data sent for parameter 'batchOrders' is not valid.")
+		results = []
+		for item in batch:
+			# orders are independent: one rejection does not undo the others
+			try:
+				results.append(self._new_order({k: str(v) for k, v in item.items()}))
+			except MockApiError as ex:
+				results.append({"code": ex.code, "msg": ex.msg})
+		return results
+
+	def _find_order(self, params: Dict[str, str]) -> Dict[str, Any]:
+		spec = self._spec(params)
+		order = None
+		if params.get("orderId"):
+			order = self._orders.get(int(params["orderId"]))
+		elif params.get("origClientOrderId"):
+			order = next((o for o in self._orders.values() if o["clientOrderId"] == params["origClientOrderId"]), None)
+		else:
+			raise MockApiError(-1102, "Param 'orderId' or 'origClientOrderId' must be sent, but both were empty/null!")
+		if order is None or order["symbol"] != spec.symbol:
+			raise MockApiError(-2013, "Order does not exist.")
+		return order
+
+	def _query_order(self, params: Dict[str, str]) -> Dict[str, Any]:
+		return self._public(self._find_order(params))
+
+	def _cancel_order(self, params: Dict[str, str]) -> Dict[str, Any]:
+		order = self._find_order(params)
+		if order["status"] != "NEW":
+			raise MockApiError(-2011, "Unknown order sent.")
+		self._set_status(order, "CANCELED")
+		return self._public(order)
+
+	def _cancel_all(self, params: Dict[str, str]) -> Dict[str, Any]:
+		spec = self._spec(params)
+		for order in list(self._orders.values()):
+			if order["symbol"] == spec.symbol and order["status"] == "NEW":
+				self._set_status(order, "CANCELED")
+		return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+	def _open_orders(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+		symbol = self._spec(params).symbol if params.get("symbol") else None
+		return [self._public(o) for o in self._orders.values() if o["status"] == "NEW" and (symbol is None or o["symbol"] == symbol)]
+
+	def _public(self, order: Dict[str, Any]) -> Dict[str, Any]:
+		return {k: v for k, v in order.items() if not k.startswith("_")}
+
+	# -------- Matching --------
+	def _set_status(self, order: Dict[str, Any], status: str) -> None:
+		order["status"] = status
+		order["updateTime"] = self.now_ms()
+		self._emit_order(order)
+
+	def _emit_order(self, order: Dict[str, Any]) -> None:
+		if self.stream is None:
+			return
+		self._events.append(order_update_event(order["symbol"], order["orderId"], order["type"], order["status"], side=order["side"],
+			price=float(order["price"]), stop_price=float(order["stopPrice"]), quantity=float(order["origQty"]),
+			reduce_only=order["reduceOnly"], time_ms=order["updateTime"]))
+
+	def _triggered(self, order: Dict[str, Any], mark: float) -> bool:
+		order_type, buy = order["type"], order["side"] == "BUY"
+		stop_price = float(order["stopPrice"])
+		if order_type == "STOP_MARKET":
+			return mark >= stop_price if buy else mark <= stop_price
+		if order_type == "TAKE_PROFIT_MARKET":
+			return mark <= stop_price if buy else mark >= stop_price
+		# trailing: activates at activatePrice, then triggers after a priceRate % pullback from the best price since
+		activation = float(order["activatePrice"])
+		if not order["_activated"]:
+			order["_activated"] = mark <= activation if buy else mark >= activation
+			order["_extreme"] = mark
+		if not order["_activated"]:
+			return False
+		order["_extreme"] = min(order["_extreme"], mark) if buy else max(order["_extreme"], mark)
+		rate = float(order["priceRate"]) / 100.0
+		return mark >= order["_extreme"] * (1 + rate) if buy else mark <= order["_extreme"] * (1 - rate)
+
+	def _match(self, symbol: str, events: List[Dict[str, Any]]) -> None:
+		self._events = events
+		mark = self.mark_price(symbol)
+		for order in sorted((o for o in self._orders.values() if o["symbol"] == symbol and o["status"] == "NEW"), key=lambda o: o["orderId"]):
+			if order["type"] == "LIMIT":
+				price = float(order["price"])
+				if (order["side"] == "BUY" and mark <= price) or (order["side"] == "SELL" and mark >= price):
+					self._fill(order, min(price, mark) if order["side"] == "BUY" else max(price, mark))
+			elif order["type"] == "MARKET":
+				self._fill(order, mark)
+			elif self._triggered(order, mark):
+				self._fill(order, mark)
+
+	def _fill(self, order: Dict[str, Any], price: float) -> None:
+		symbol = order["symbol"]
+		pos = self._positions.setdefault(symbol, {"amount": 0.0, "entry_price": 0.0})
+		quantity = float(order["origQty"])
+		if order["reduceOnly"]:
+			# reduce-only never flips the position: capped at its size, expired if there is nothing to reduce
+			reducible = abs(pos["amount"]) if (pos["amount"] > 0) != (order["side"] == "BUY") else 0.0
+			quantity = reducible if order["closePosition"] else min(quantity, reducible)
+			if quantity <= 0:
+				self._set_status(order, "EXPIRED")
+				return
+		signed = quantity if order["side"] == "BUY" else -quantity
+		amount = pos["amount"]
+		if amount == 0 or (amount > 0) == (signed > 0):
+			pos["entry_price"] = (pos["entry_price"] * abs(amount) + price * quantity) / (abs(amount) + quantity)
+		else:
+			closed = min(abs(amount), quantity)
+			self.wallet_usdt += (price - pos["entry_price"]) * closed * (1 if amount > 0 else -1)
+			if quantity > abs(amount):
+				pos["entry_price"] = price
+		pos["amount"] = round(amount + signed, 12)
+		if pos["amount"] == 0:
+			pos["entry_price"] = 0.0
+		order["executedQty"] = _fmt(quantity, self.symbols[symbol].step_size)
+		order["avgPrice"] = _fmt(price, "0.00000001")
+		order["cumQuote"] = _fmt(price * quantity)
+		self._set_status(order, "FILLED")
+		if self.stream is not None:
+			self._events.append(account_update_event(symbol, pos["amount"], pos["entry_price"], wallet_balance=self.wallet_usdt, time_ms=self.now_ms()))
+
+
+def _klines_weight(params: Dict[str, str]) -> int:
+	limit = int(params.get("limit", 500))
+	return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"		# keep-alive, requests.Session reuses the connection
+	disable_nagle_algorithm = True		# headers and body go out as separate writes, don't wait for the delayed ACK
+
+	def _serve(self) -> None:
+		parts = urlsplit(self.path)
+		length = int(self.headers.get("Content-Length") or 0)
+		body = self.rfile.read(length).decode() if length else ""
+		status, payload, headers = self.server.exchange.handle(self.command, parts.path, parts.query, body, dict(self.headers))
+		data = json.dumps(payload, separators=(",", ":")).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(data)
+
+	do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+	def log_message(self, format: str, *args: Any) -> None:
+		pass
+
+
+def route_public_data(base_url: str) -> None:
+	"""Points the public market data of bot_funcs, fast_data and the shared exchangeInfo cache at base_url (e.g. a mock exchange)"""
+	import bot_funcs as bf
+	import fast_data
+	from exchange_info import ExchangeInfoCache, _fetch_public_exchange_info, use_shared_exchange_info
+
+	bf.FUTURES_BASE_URL = fast_data.FUTURES_BASE_URL = base_url
+	bf.SPOT_BASE_URL = fast_data.SPOT_BASE_URL = base_url
+	bf._ohlcv_cache.clear()
+	use_shared_exchange_info(ExchangeInfoCache(lambda: _fetch_public_exchange_info(base_url)))
+
+
+def run_benchmark(exchange: MockFuturesExchange, config: Dict[str, Any], *, pairs: List[str], place: bool = True) -> Dict[str, Any]:
+	"""
+	One bot cycle against the mock: kline scan and levels of every pair over the checked timeframes (as check_pair does),
+	then a protected bracket per pair through OrderManager's execution queue. Returns throughput and placement latency.
+	"""
+	import bot_funcs as bf
+	import levels as lv
+	from binance_connect import Binance_connect
+	from exchange_info import ExchangeInfoCache, _fetch_public_exchange_info
+	from order_manager import OrderManager
+
+	route_public_data(exchange.url)
+	trading_timeframe = config["general"]["trading_timeframe"]
+	checked_timeframes = bf.define_checked_timeframes(config["general"]["timeframes_used"][:], trading_timeframe)
+	depth = config["general"]["basic_candle_depth"]
+
+	scan_started = time.perf_counter()
+	last_close: Dict[str, float] = {}
+	for pair in pairs:
+		levels = []
+		for timeframe in checked_timeframes:
+			df = bf.get_ohlcv_data_binance(pair, timeframe, limit=depth[timeframe], futures=True)
+			if timeframe == trading_timeframe:
+				last_close[pair] = float(df.iloc[-1]["Close"])
+			levels += lv.find_levels(df, timeframe)
+		levels = lv.assign_level_density(levels, checked_timeframes, config["levels"])
+		lv.merge_timeframe_levels(lv.optimize_levels(levels, checked_timeframes))
+	scan_sec = time.perf_counter() - scan_started
+	result: Dict[str, Any] = {"pairs": len(pairs), "scan_sec": round(scan_sec, 3), "pairs_per_sec": round(len(pairs) / scan_sec, 1)}
+	if not place:
+		return result
+
+	bnc = Binance_connect(exchange.api_key or "mock", exchange.api_secret or "mock", base_url=exchange.url, pm_base_url=exchange.url,
+		api_mode=config["general"].get("futures_api_mode", "classic"), latency_metrics=True,
+		exchange_info=ExchangeInfoCache(lambda: _fetch_public_exchange_info(exchange.url)))
+	om = OrderManager(bnc, config)
+	om.log_to_file = False
+	place_started = time.perf_counter()
+	futures = {}
+	for pair in pairs:
+		price = last_close[pair]
+		futures[pair] = om.submit_managed_trade(symbol=pair, side="BUY", entry_price=price, deviation_percent=0.1, stop_loss_price=price * 0.98,
+			trailing_activation_price=price * 1.02, trailing_callback_percent=0.5, leverage=10, quantity=None, risk_percent_of_bank=0.5, verbose=False)
+	placed = sum(1 for future in futures.values() if future.result().get("success"))
+	place_sec = time.perf_counter() - place_started
+	om.stop()
+	result.update({"placed": placed, "place_sec": round(place_sec, 3), "placements_per_sec": round(len(pairs) / place_sec, 1),
+		"latency_ms": bnc.latency.summary(), "requests": len(exchange.request_log)})
+	return result
+
+
+def main():
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Local mock of Binance USDT-M futures (classic /fapi and PM /papi/v1/um)')
+	parser.add_argument('command', choices=['serve', 'bench'])
+	parser.add_argument('--config', default='config_5m_rm.json')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--latency-ms', type=float, default=0.0, help='delay of every response')
+	parser.add_argument('--jitter-ms', type=float, default=0.0, help='extra random delay up to this value')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with -1001')
+	parser.add_argument('--pairs', type=int, default=20, help='bench: number of synthetic pairs scanned and traded')
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	exchange = MockFuturesExchange(extra_symbols=args.pairs if args.command == 'bench' else 0, latency_ms=args.latency_ms,
+		jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed, port=args.port if args.command == 'serve' else 0)
+	with exchange:
+		if args.command == 'serve':
+			print(f'Mock Binance futures on {exchange.url}, Ctrl+C to stop')
+			try:
+				while True:
+					time.sleep(1)
+			except KeyboardInterrupt:
+				return
+		import bot_funcs as bf
+		config = bf.load_config(args.config)
+		pairs = [symbol for symbol in exchange.symbols if symbol.startswith('MOCK')]
+		print(json.dumps(run_benchmark(exchange, config, pairs=pairs), indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import perf_stats as ps
+
+DAY_MS = 86_400_000
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def day_blocks(deals: dict, returns: np.ndarray) -> dict:
+    """Folds per-deal bank returns (deals ordered by finish_ms) into calendar days (UTC), empty days included.
+
+    Every day is described by log-growth numbers enough to chain days exactly:
+    - growth: log of the bank change over the day
+    - low / high: lowest / highest point of the bank during the day relative to its start (<= 0 / >= 0)
+    - drawdown: max drawdown inside the day alone
+    """
+    days = ps.finish_times(deals) // DAY_MS
+    first_day = days[0]
+    day_index = days - first_day
+    days_quantity = int(day_index[-1]) + 1
+
+    log_growth = np.log1p(returns)
+    cumulative = np.cumsum(log_growth)
+    day_start = np.searchsorted(day_index, day_index)                 # first deal of the same day
+    intraday = cumulative - cumulative[day_start] + log_growth[day_start]
+
+    growth = np.zeros(days_quantity)
+    low = np.zeros(days_quantity)
+    high = np.zeros(days_quantity)
+    drawdown = np.zeros(days_quantity)
+    np.add.at(growth, day_index, log_growth)
+    np.minimum.at(low, day_index, intraday)
+    np.maximum.at(high, day_index, intraday)
+
+    # running peak restarted every day: the day offset keeps later days above any earlier value
+    offset = day_index * (2 * np.abs(intraday).max() + 1)
+    peak = np.maximum(np.maximum.accumulate(intraday + offset) - offset, 0)
+    np.maximum.at(drawdown, day_index, peak - intraday)
+
+    return {'growth': growth, 'low': low, 'high': high, 'drawdown': drawdown, 'first_day': int(first_day)}
+
+
+def simulate(blocks: dict, paths: int = 10_000, block_days: int = 1, seed: int = None, chunk_paths: int = 2_000) -> dict:
+    """Block bootstrap of the day sequence: every path is as many days as the history,
+    glued from random runs of block_days consecutive days.
+
+    Returns per-path final bank multiplier, max drawdown (fraction) and the longest time under water in days
+    (days until the bank got back above its previous peak, a path that ended under water counts up to its end)"""
+    days_quantity = blocks['growth'].shape[0]
+    block_days = max(1, min(block_days, days_quantity))
+    blocks_per_path = -(-days_quantity // block_days)
+    rng = np.random.default_rng(seed)
+
+    final = np.empty(paths)
+    max_drawdown = np.empty(paths)
+    recovery_days = np.empty(paths, dtype=np.int64)
+
+    for start in range(0, paths, chunk_paths):
+        stop = min(start + chunk_paths, paths)
+        block_starts = rng.integers(0, days_quantity - block_days + 1, size=(stop - start, blocks_per_path))
+        sampled = (block_starts[:, :, None] + np.arange(block_days)).reshape(stop - start, -1)[:, :days_quantity]
+
+        growth = blocks['growth'][sampled]
+        level = np.cumsum(growth, axis=1)
+        day_open = level - growth                                   # log bank at the start of each day
+
+        # peak before the day: max of all earlier intraday highs and of the starting bank
+        day_peak = np.maximum.accumulate(day_open + blocks['high'][sampled], axis=1)
+        peak_before = np.maximum(np.concatenate([np.zeros((stop - start, 1)), day_peak[:, :-1]], axis=1), 0)
+        day_drawdown = np.maximum(peak_before - (day_open + blocks['low'][sampled]), blocks['drawdown'][sampled])
+
+        final[start:stop] = np.exp(level[:, -1])
+        max_drawdown[start:stop] = 1 - np.exp(-day_drawdown.max(axis=1))
+
+        # longest run of days closed below the peak
+        under_water = level < np.maximum(day_peak, 0) - 1e-12
+        index = np.arange(days_quantity)
+        last_above = np.maximum.accumulate(np.where(under_water, -1, index), axis=1)
+        recovery_days[start:stop] = (index - last_above).max(axis=1)
+
+    return {'final': final, 'max_drawdown': max_drawdown, 'recovery_days': recovery_days}
+
+
+def summarize(deals: dict, variant: object, paths: int = 10_000, block_days: int = 1, initial_bank: float = 100,
+              ruin_drawdown: float = 0.5, seed: int = 0) -> dict:
+    """Percentiles of final bank, max drawdown (%) and recovery days over bootstrapped paths of one StatsVariant"""
+    deals_quantity = deals['status'].shape[0]
+    if deals_quantity == 0:
+        return {'variant': variant, 'initial_bank': initial_bank, 'deals': 0}
+
+    units = ps.unit_returns(deals, [variant])[0][0]
+    blocks = day_blocks(deals, variant.risk * units)
+    result = simulate(blocks, paths, block_days, seed)
+
+    return {
+        'variant': variant,
+        'initial_bank': initial_bank,
+        'deals': deals_quantity,
+        'days': blocks['growth'].shape[0],
+        'paths': paths,
+        'block_days': block_days,
+        'final_bank': np.round(initial_bank * np.percentile(result['final'], PERCENTILES), 2),
+        'max_drawdown': np.round(np.percentile(result['max_drawdown'], PERCENTILES) * 100, 2),
+        'recovery_days': np.percentile(result['recovery_days'], PERCENTILES).round().astype(int),
+        'loss_probability': round(float((result['final'] < 1).mean() * 100), 2),
+        'ruin_drawdown': ruin_drawdown,
+        'ruin_probability': round(float((result['max_drawdown'] >= ruin_drawdown).mean() * 100), 2),
+    }
+
+
+def format_summary(summary: dict) -> str:
+    if summary['deals'] == 0:
+        return 'Нет завершённых сделок'
+
+    percentiles = '/'.join(str(percentile) for percentile in PERCENTILES)
+    return f"""Монте-Карло: {summary['paths']} путей, блоки по {summary['block_days']} дн.
+Сделок: {summary['deals']}, дней: {summary['days']}, риск на сделку: {summary['variant'].risk}
+Стартовый банк: {summary['initial_bank']}
+
+Перцентили {percentiles}%:
+Конечный банк: {' / '.join(str(value) for value in summary['final_bank'])}
+Макс. просадка %: {' / '.join(str(value) for value in summary['max_drawdown'])}
+Дней до восстановления: {' / '.join(str(value) for value in summary['recovery_days'])}
+
+Вероятность убытка: {summary['loss_probability']}%
+Вероятность просадки от {round(summary['ruin_drawdown'] * 100)}%: {summary['ruin_probability']}%"""
+
+
+class MonteCarloCache():
+    """Summaries keyed by the state of finished deals (DB_handler.get_finished_deals_state) and the run parameters,
+    so a repeated request costs one small query until a deal finishes"""
+
+    def __init__(self, size: int = 32):
+        self.size = size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def summary(self, db: object, variant: object, paths: int = 10_000, block_days: int = 1,
+                initial_bank: float = 100, ruin_drawdown: float = 0.5, conditions: list = None) -> dict:
+        state = db.get_finished_deals_state(conditions)
+        if not isinstance(state, tuple):
+            raise RuntimeError(f'SQLite error: {state}')
+        key = (state, tuple(conditions or []), variant.risk, variant.threshold, variant.trailing_stop_perc,
+               variant.trailing_mode, paths, block_days, initial_bank, ruin_drawdown)
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        deals = db.get_finished_deals_arrays(conditions)
+        if not isinstance(deals, dict):
+            raise RuntimeError(f'SQLite error: {deals}')
+        summary = summarize(deals, variant, paths, block_days, initial_bank, ruin_drawdown)
+
+        with self.lock:
+            self.cache[key] = summary
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return summary
+
+
+_cache = MonteCarloCache()
+
+
+def monte_carlo_report(db: object, risk: float, paths: int = 10_000, block_days: int = 1,
+                       initial_bank: float = 100, conditions: list = None) -> str:
+    try:
+        summary = _cache.summary(db, ps.StatsVariant(risk), paths, block_days, initial_bank, conditions=conditions)
+    except RuntimeError as error:
+        return str(error)
+    return format_summary(summary)
+
+
+def main():
+    import argparse
+
+    from db_funcs import DB_handler
+
+    parser = argparse.ArgumentParser(description='Monte Carlo day-block bootstrap of finished deals')
+    parser.add_argument('dbname', help='deals database, e.g. deals_5m_rm.sqlite')
+    parser.add_argument('--risk', type=float, default=0.03, help='risk per deal')
+    parser.add_argument('--paths', type=int, default=10_000)
+    parser.add_argument('--block-days', type=int, default=1, help='consecutive days resampled together')
+    parser.add_argument('--bank', type=float, default=100)
+    args = parser.parse_args()
+
+    db = DB_handler(args.dbname)
+    print(monte_carlo_report(db, args.risk, args.paths, args.block_days, args.bank))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,26 @@
 import threading
 import time
 import json
+import inspect
 import os
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Callable, Optional, Dict, Any, List, Tuple
 
 from binance_connect import Binance_connect
+from log_sink import get_sink
+
+PROTECTIVE_ORDER_TYPES = ("STOP_MARKET", "TAKE_PROFIT_MARKET", "TRAILING_STOP_MARKET")
+OPEN_ORDER_STATUSES = ("NEW", "PARTIALLY_FILLED")
 
 
 class OrderManager:
 
-	def __init__(self, bnc: Binance_connect, config: Dict[str, Any]):
+	def __init__(self, bnc: Binance_connect, config: Dict[str, Any], *, clock: Optional[Callable[[], float]] = None):
 		self.bnc = bnc
+		# wall clock (epoch seconds) the order / event times are compared with: TTL of entries and grace of stray protections
+		self.clock: Callable[[], float] = clock or time.time
 		self.cfg = config.get("order_manager", {})
 		self.deal_cfg = config.get("deal_config", {})
 		self.retries: int = int(self.cfg.get("retries", 3))
@@ -25,11 +34,32 @@ class OrderManager:
 		self.log_path: str = os.path.join("logs", "order_manager.log")
 		os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
 		self._locks: Dict[str, threading.Lock] = {}
+		self.stray_grace_sec: float = float(self.cfg.get("stray_grace_sec", 2))
+		self.rearm_guard_sec: float = float(self.cfg.get("rearm_guard_sec", 10))
+		self._rearmed_at: Dict[str, float] = {}
+		# event-driven mode (attach_stream): mirror of open orders {symbol: {orderId: order}} and positions {symbol: position}
+		self.reconcile_interval_sec: float = float(self.cfg.get("reconcile_interval_sec", 300))
+		self.tick_sec: float = float(self.cfg.get("tick_sec", 1))
+		self.stream: Any = None
+		self._orders: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+		self._positions: Dict[str, Dict[str, Any]] = {}
+		self._dirty: set = set()
+		self._last_event_ms: Dict[str, int] = {}
+		self._mirror_lock = threading.Lock()
+		self._wakeup = threading.Event()
+		self._stopped = threading.Event()
+		self._reconcile_requested = False
+		self._snapshot_changes: Optional[List[Tuple[str, Dict[str, Any]]]] = None	# mirror updates made while reconcile() reads REST
+		self._worker: Optional[threading.Thread] = None
+		# execution queue (submit_managed_trade): pending trades per symbol, the head one is being placed
+		self.max_parallel_placements: int = int(self.cfg.get("max_parallel_placements", 4))
+		self._executor = ThreadPoolExecutor(max_workers=self.max_parallel_placements, thread_name_prefix="placement")
+		self._symbol_queues: Dict[str, deque] = {}
+		self._queue_lock = threading.Lock()
 
 	def _lock_for_symbol(self, symbol: str) -> threading.Lock:
-		if symbol not in self._locks:
-			self._locks[symbol] = threading.Lock()
-		return self._locks[symbol]
+		# setdefault: the worker thread and placements may ask for a new symbol at the same time
+		return self._locks.setdefault(symbol, threading.Lock())
 
 	def _slippage_ok(self, symbol: str, planned_entry: float) -> bool:
 		mark = self.bnc.get_mark_price(symbol)
@@ -39,20 +69,15 @@ class OrderManager:
 		return delta <= self.max_slippage_pct
 
 	def _log(self, event: str, details: Dict[str, Any] = None):
-		rec = {
-			"ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-			"event": event,
-			"details": details or {}
-		}
-		line = json.dumps(rec, ensure_ascii=False)
 		if self.log_to_console:
-			print(f"[OrderManager] {line}")
+			rec = {
+				"ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+				"event": event,
+				"details": details or {}
+			}
+			print(f"[OrderManager] {json.dumps(rec, ensure_ascii=False)}")
 		if self.log_to_file:
-			try:
-				with open(self.log_path, "a", encoding="utf-8") as f:
-					f.write(line + "\n")
-			except Exception:
-				pass
+			get_sink(self.log_path).write(event, details)
 
 	def place_managed_trade(self,
 		*,
@@ -72,151 +97,483 @@ class OrderManager:
 		deal_id: Optional[int] = None,
 		verbose: bool = True,
 	) -> Dict[str, Any]:
+		trade = self._trade_params(locals())
 		lock = self._lock_for_symbol(symbol)
 		if not lock.acquire(timeout=1):
 			return {"success": False, "message": "symbol busy"}
 		try:
-			start_ts = time.time()
-			attempt = 0
-			last_error = None
-			while attempt <= self.retries:
-				self._log("place_attempt", {"symbol": symbol, "attempt": attempt})
-				if not self._slippage_ok(symbol, entry_price):
-					self._log("slippage_block", {"symbol": symbol, "entry_price": entry_price})
-					return {"success": False, "message": "slippage too high"}
-				res = self.bnc.place_futures_order_with_protection(
-					symbol=symbol,
-					side=side,
-					entry_price=entry_price,
-					deviation_percent=deviation_percent,
-					stop_loss_price=stop_loss_price,
-					trailing_activation_price=trailing_activation_price,
-					trailing_callback_percent=trailing_callback_percent,
-					leverage=leverage,
-					quantity=quantity,
-					risk_percent_of_bank=risk_percent_of_bank,
-					position_side=position_side,
-					working_type=working_type,
-					time_in_force=time_in_force,
-					skip_account_setup=False,
-					verbose=verbose,
-				)
-				if res.success:
-					self._log("place_success", {"symbol": symbol})
-					return {"success": True, "orders": res.raw}
-				last_error = res.message
-				self._log("place_error", {"symbol": symbol, "message": last_error})
-				if attempt < len(self.backoff):
-					time.sleep(self.backoff[attempt])
-				attempt += 1
-				if time.time() - start_ts > self.placement_timeout:
-					break
-			# rollback best-effort: remove only entry LIMIT if no position and leave STOP if он успел встать
-			try:
-				pos = self.bnc.get_position(symbol)
-				qty = abs(float(pos.get("positionAmt", 0))) if pos else 0.0
-				open_orders = self.bnc.get_open_orders(symbol)
-				if qty == 0:
-					for o in open_orders:
-						if o.get("type") == "LIMIT":
-							self.bnc.cancel_order(symbol, order_id=o.get("orderId"))
-				else:
-					# если позиция уже есть — откат не делаем автоматически
-					self._log("rollback_skipped_position_open", {"symbol": symbol})
-			except Exception:
-				pass
-			return {"success": False, "message": last_error or "placement failed"}
+			state = {"attempt": 0, "start_ts": time.time(), "last_error": None}
+			while True:
+				result = self._place_attempt(trade, state)
+				if result is not None:
+					return result
+				if state["attempt"] - 1 < len(self.backoff):
+					time.sleep(self.backoff[state["attempt"] - 1])
+		finally:
+			lock.release()
+
+	def _trade_params(self, args: Dict[str, Any]) -> Dict[str, Any]:
+		return {k: v for k, v in args.items() if k not in ("self", "trade")}
+
+	def _place_attempt(self, trade: Dict[str, Any], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+		"""One placement attempt under the symbol lock; returns the final result, or None if the attempt should be retried after backoff"""
+		symbol = trade["symbol"]
+		if state["attempt"] > self.retries or (state["attempt"] > 0 and time.time() - state["start_ts"] > self.placement_timeout):
+			return self._rollback(symbol, state["last_error"])
+		self._log("place_attempt", {"symbol": symbol, "attempt": state["attempt"]})
+		if not self._slippage_ok(symbol, trade["entry_price"]):
+			self._log("slippage_block", {"symbol": symbol, "entry_price": trade["entry_price"]})
+			return {"success": False, "message": "slippage too high"}
+		res = self.bnc.place_futures_order_with_protection(
+			symbol=symbol,
+			side=trade["side"],
+			entry_price=trade["entry_price"],
+			deviation_percent=trade["deviation_percent"],
+			stop_loss_price=trade["stop_loss_price"],
+			trailing_activation_price=trade["trailing_activation_price"],
+			trailing_callback_percent=trade["trailing_callback_percent"],
+			leverage=trade["leverage"],
+			quantity=trade["quantity"],
+			risk_percent_of_bank=trade["risk_percent_of_bank"],
+			position_side=trade["position_side"],
+			working_type=trade["working_type"],
+			time_in_force=trade["time_in_force"],
+			skip_account_setup=False,
+			verbose=trade["verbose"],
+		)
+		if res.success:
+			self._log("place_success", {"symbol": symbol, "timings_ms": res.timings})
+			return {"success": True, "orders": res.raw, "timings_ms": res.timings}
+		state["last_error"] = res.message
+		self._log("place_error", {"symbol": symbol, "message": state["last_error"], "timings_ms": res.timings})
+		state["attempt"] += 1
+		return None
+
+	def _rollback(self, symbol: str, last_error: Optional[str]) -> Dict[str, Any]:
+		# rollback best-effort: remove only entry LIMIT if no position and leave STOP if он успел встать
+		try:
+			pos = self.bnc.get_position(symbol)
+			qty = abs(float(pos.get("positionAmt", 0))) if pos else 0.0
+			open_orders = self.bnc.get_open_orders(symbol)
+			if qty == 0:
+				for o in open_orders:
+					if o.get("type") == "LIMIT":
+						self.bnc.cancel_order(symbol, order_id=o.get("orderId"))
+			else:
+				# если позиция уже есть — откат не делаем автоматически
+				self._log("rollback_skipped_position_open", {"symbol": symbol})
+		except Exception:
+			pass
+		return {"success": False, "message": last_error or "placement failed"}
+
+	# -------- Execution queue: concurrent placement across symbols --------
+	def submit_managed_trade(self, **trade: Any) -> Future:
+		"""
+		Queues place_managed_trade(**trade) and returns a Future with its result dict.
+		Trades of different symbols are placed concurrently (up to order_manager.max_parallel_placements),
+		trades of one symbol strictly one after another in submission order.
+		Backoff between retries is a timer, not a sleeping worker, so it doesn't hold up other symbols.
+		"""
+		# same arguments and defaults as place_managed_trade, a bad call fails here and not in a worker
+		bound = inspect.signature(self.place_managed_trade).bind(**trade)
+		bound.apply_defaults()
+		symbol = bound.arguments["symbol"]
+		future: Future = Future()
+		with self._queue_lock:
+			queue = self._symbol_queues.setdefault(symbol, deque())
+			queue.append((dict(bound.arguments), future))
+			first = len(queue) == 1
+		if first:
+			self._start_next(symbol)
+		return future
+
+	def _start_next(self, symbol: str) -> None:
+		# called only by whoever made the trade the head of the queue (submit into an empty queue or _finish)
+		with self._queue_lock:
+			trade, future = self._symbol_queues[symbol][0]
+		if not future.set_running_or_notify_cancel():
+			self._finish(symbol, None, None)
+			return
+		state = {"attempt": 0, "start_ts": time.time(), "last_error": None}
+		if not self._submit(self._queued_attempt, trade, future, state):
+			self._finish(symbol, future, {"success": False, "message": "order manager stopped"})
+
+	def _queued_attempt(self, trade: Dict[str, Any], future: Future, state: Dict[str, Any]) -> None:
+		symbol = trade["symbol"]
+		lock = self._lock_for_symbol(symbol)
+		if not lock.acquire(blocking=False):
+			# the cleanup worker or a direct place_managed_trade holds the symbol: try again shortly
+			self._schedule(0.2, self._queued_attempt, trade, future, state)
+			return
+		try:
+			result = self._place_attempt(trade, state)
+		except Exception as e:
+			result = {"success": False, "message": str(e)}
 		finally:
 			lock.release()
+		if result is None:
+			delay = self.backoff[state["attempt"] - 1] if state["attempt"] - 1 < len(self.backoff) else 0
+			self._schedule(delay, self._queued_attempt, trade, future, state)
+			return
+		self._finish(symbol, future, result)
+
+	def _schedule(self, delay: float, fn, *args: Any) -> None:
+		if self._stopped.is_set():
+			return
+		timer = threading.Timer(delay, self._submit, args=(fn, *args))
+		timer.daemon = True
+		timer.start()
+
+	def _submit(self, fn, *args: Any) -> bool:
+		# after stop() the pool is shut down: a backoff timer or the next trade of a symbol doesn't run
+		if self._stopped.is_set():
+			return False
+		try:
+			self._executor.submit(fn, *args)
+		except RuntimeError:
+			return False
+		return True
+
+	def _resolve(self, future: Future, result: Dict[str, Any]) -> None:
+		# stop() and a placement finishing at the same moment may both resolve the future
+		try:
+			future.set_result(result)
+		except InvalidStateError:
+			pass
+
+	def _finish(self, symbol: str, future: Optional[Future], result: Optional[Dict[str, Any]]) -> None:
+		if future is not None:
+			self._resolve(future, result)
+		with self._queue_lock:
+			queue = self._symbol_queues.get(symbol)
+			if not queue:
+				return		# stop() has emptied the queues
+			queue.popleft()
+			has_next = bool(queue)
+			if not has_next:
+				del self._symbol_queues[symbol]
+		if has_next:
+			self._start_next(symbol)
 
 	def watch_and_cleanup(self, symbol: str, *, verbose: bool = False) -> None:
-		"""Maintain orders per symbol: before entry fill cancel stray protections; enforce TTL for unfilled entry; after fill ensure protections exist."""
+		"""Maintain orders per symbol from a REST snapshot (open orders + position), rules in _apply_rules."""
 		try:
 			open_orders = self.bnc.get_open_orders(symbol)
 			pos = self.bnc.get_position(symbol)
-			qty = abs(float(pos.get("positionAmt", 0))) if pos else 0.0
+			self._apply_rules(symbol, open_orders, pos, verbose=verbose)
+		except Exception as e:
+			self._log("watch_and_cleanup_error", {"symbol": symbol, "error": str(e)})
+			return
 
-			# classify - фильтруем только валидные ордера с orderId
-			entry_orders = [o for o in open_orders if (o.get("type") == "LIMIT" and o.get("orderId"))]
-			prot_orders = [o for o in open_orders if (o.get("type") in ("STOP_MARKET", "TRAILING_STOP_MARKET") and o.get("orderId"))]
-			trailing_present = any(o.get("type") == "TRAILING_STOP_MARKET" for o in prot_orders)
-			stop_order = next((o for o in open_orders if o.get("type") == "STOP_MARKET"), None)
-			
-			if verbose:
-				self._log("cleanup_debug", {
-					"symbol": symbol, 
-					"position_qty": qty,
-					"total_orders": len(open_orders),
-					"entry_orders": len(entry_orders),
-					"prot_orders": len(prot_orders)
-				})
+	def _apply_rules(self, symbol: str, open_orders: List[Dict[str, Any]], pos: Optional[Dict[str, Any]], *, verbose: bool = False) -> None:
+		"""
+		Rules per symbol: without a position and a pending entry cancel stray protections; enforce TTL for unfilled entry;
+		after fill ensure protections exist (re-arm trailing from the STOP distance).
+		Protections are not stray within stray_grace_sec of their creation or of the last stream event of the symbol:
+		events of a just placed bracket or of a fill may arrive in any order.
+		"""
+		qty = abs(float(pos.get("positionAmt", 0) or 0)) if pos else 0.0
 
-			if qty == 0:
-				# No position: protective orders should not hang; use cancel-all to avoid missing IDs
-				if prot_orders:
+		# classify - фильтруем только валидные ордера с orderId
+		entry_orders = [o for o in open_orders if (o.get("type") == "LIMIT" and o.get("orderId"))]
+		prot_orders = [o for o in open_orders if (o.get("type") in PROTECTIVE_ORDER_TYPES and o.get("orderId"))]
+		trailing_present = any(o.get("type") == "TRAILING_STOP_MARKET" for o in prot_orders)
+		stop_order = next((o for o in open_orders if o.get("type") == "STOP_MARKET"), None)
+
+		if verbose:
+			self._log("cleanup_debug", {
+				"symbol": symbol,
+				"position_qty": qty,
+				"total_orders": len(open_orders),
+				"entry_orders": len(entry_orders),
+				"prot_orders": len(prot_orders)
+			})
+
+		now_ms = int(self.clock() * 1000)
+		if qty == 0:
+			# No position and no entry waiting for a fill: protective orders should not hang; use cancel-all to avoid missing IDs
+			if prot_orders and not entry_orders:
+				# fill and position events of one trade may come in any order: wait until the symbol is quiet
+				newest_ms = max([self._order_time_ms(o) for o in prot_orders] + [self._last_event_ms.get(symbol, 0)])
+				if not newest_ms or now_ms - newest_ms > self.stray_grace_sec * 1000:
 					self._log("cleanup_stray_protections", {"symbol": symbol, "count": len(prot_orders)})
-					self.bnc.cancel_all_open_orders(symbol)
-				
-				# Enforce TTL for unfilled entry limit orders
-				if self.entry_ttl_sec > 0 and entry_orders:
-					now_ms = int(time.time() * 1000)
-					oldest_ms = None
-					for o in entry_orders:
-						ms = o.get("time") or o.get("updateTime") or o.get("workingTime") or 0
-						if oldest_ms is None or (ms and ms < oldest_ms):
-							oldest_ms = ms
-					if oldest_ms and now_ms - oldest_ms > self.entry_ttl_sec * 1000:
-						self._log("entry_ttl_expired", {"symbol": symbol, "ttl_sec": self.entry_ttl_sec, "open_entries": len(entry_orders)})
-						# Use cancel-all to ensure removal of stale LIMITs if TTL expired
-						self._log("entry_ttl_fallback_cancel_all", {"symbol": symbol, "open_entries": len(entry_orders)})
-						self.bnc.cancel_all_open_orders(symbol)
-				return
+					if self.bnc.cancel_all_open_orders(symbol):
+						self._forget_orders(symbol)
 
-			# Position exists: ensure at least one protective order is present
-			if not prot_orders or not trailing_present:
-				try:
-					pos_full = self.bnc.get_position(symbol) or {}
-					entry_price_pos = float(pos_full.get("entryPrice", 0) or 0)
-					qty_signed = float(pos_full.get("positionAmt", 0) or 0)
-					qty_abs = abs(qty_signed)
-					if qty_abs <= 0:
-						self._log("no_protection_qty_zero", {"symbol": symbol})
-						return
-
-					# If trailing is missing, try to re-arm it using config and distance to STOP
-					if not trailing_present and stop_order and entry_price_pos > 0:
-						try:
-							stop_price_val = float(stop_order.get("stopPrice")) if stop_order.get("stopPrice") else 0.0
-							if stop_price_val > 0 and entry_price_pos > 0:
-								stop_dist_perc = abs(entry_price_pos - stop_price_val) / entry_price_pos * 100.0
-								act_part = float(self.deal_cfg.get('trailing_activation_of_stop_price', 0))
-								cb_part = float(self.deal_cfg.get('trailing_callback_percent_of_stop_price', 0))
-								if qty_signed > 0:
-									activation = entry_price_pos * (1 + act_part * stop_dist_perc / 100.0)
-									side = "SELL"
-								else:
-									activation = entry_price_pos * (1 - act_part * stop_dist_perc / 100.0)
-									side = "BUY"
-								callback = round(cb_part * stop_dist_perc, 1)
-								self._log("rearm_trailing_attempt", {"symbol": symbol, "entry": entry_price_pos, "stop": stop_price_val, "activation": activation, "callback": callback, "qty": qty_abs, "side": side})
-								ok_tr = self.bnc.place_trailing_reduce_only(
-									symbol=symbol,
-									side=side,
-									activation_price=activation,
-									callback_percent=callback,
-									quantity=qty_abs,
-									position_side="BOTH",
-									reduce_only=True,
-									verbose=True,
-								)
-								self._log("rearm_trailing_result", {"symbol": symbol, "success": ok_tr})
-						except Exception as ex:
-							self._log("rearm_trailing_error", {"symbol": symbol, "error": str(ex)})
+			# Enforce TTL for unfilled entry limit orders
+			if self.entry_ttl_sec > 0 and entry_orders:
+				oldest_ms = None
+				for o in entry_orders:
+					ms = self._order_time_ms(o)
+					if oldest_ms is None or (ms and ms < oldest_ms):
+						oldest_ms = ms
+				if oldest_ms and now_ms - oldest_ms > self.entry_ttl_sec * 1000:
+					self._log("entry_ttl_expired", {"symbol": symbol, "ttl_sec": self.entry_ttl_sec, "open_entries": len(entry_orders)})
+					# Use cancel-all to ensure removal of stale LIMITs if TTL expired
+					self._log("entry_ttl_fallback_cancel_all", {"symbol": symbol, "open_entries": len(entry_orders)})
+					if self.bnc.cancel_all_open_orders(symbol):
+						self._forget_orders(symbol)
+			return
+
+		# Position exists: ensure at least one protective order is present
+		if not prot_orders or not trailing_present:
+			try:
+				entry_price_pos = float(pos.get("entryPrice", 0) or 0)
+				qty_signed = float(pos.get("positionAmt", 0) or 0)
+				qty_abs = abs(qty_signed)
+				if qty_abs <= 0:
+					self._log("no_protection_qty_zero", {"symbol": symbol})
 					return
-				except Exception as ex:
-					self._log("no_protection_error", {"symbol": symbol, "error": str(ex)})
+
+				# a re-armed trailing shows up in open orders / stream a moment later, don't place a second one meanwhile
+				if time.monotonic() - self._rearmed_at.get(symbol, float("-inf")) < self.rearm_guard_sec:
 					return
+
+				# If trailing is missing, try to re-arm it using config and distance to STOP
+				if not trailing_present and stop_order and entry_price_pos > 0:
+					try:
+						stop_price_val = float(stop_order.get("stopPrice")) if stop_order.get("stopPrice") else 0.0
+						if stop_price_val > 0 and entry_price_pos > 0:
+							stop_dist_perc = abs(entry_price_pos - stop_price_val) / entry_price_pos * 100.0
+							act_part = float(self.deal_cfg.get('trailing_activation_of_stop_price', 0))
+							cb_part = float(self.deal_cfg.get('trailing_callback_percent_of_stop_price', 0))
+							if qty_signed > 0:
+								activation = entry_price_pos * (1 + act_part * stop_dist_perc / 100.0)
+								side = "SELL"
+							else:
+								activation = entry_price_pos * (1 - act_part * stop_dist_perc / 100.0)
+								side = "BUY"
+							callback = round(cb_part * stop_dist_perc, 1)
+							self._log("rearm_trailing_attempt", {"symbol": symbol, "entry": entry_price_pos, "stop": stop_price_val, "activation": activation, "callback": callback, "qty": qty_abs, "side": side})
+							self._rearmed_at[symbol] = time.monotonic()
+							ok_tr = self.bnc.place_trailing_reduce_only(
+								symbol=symbol,
+								side=side,
+								activation_price=activation,
+								callback_percent=callback,
+								quantity=qty_abs,
+								position_side="BOTH",
+								reduce_only=True,
+								verbose=True,
+							)
+							if not ok_tr:
+								self._rearmed_at.pop(symbol, None)
+							self._log("rearm_trailing_result", {"symbol": symbol, "success": ok_tr})
+					except Exception as ex:
+						self._log("rearm_trailing_error", {"symbol": symbol, "error": str(ex)})
+				return
+			except Exception as ex:
+				self._log("no_protection_error", {"symbol": symbol, "error": str(ex)})
+				return
+
+	def _order_time_ms(self, order: Dict[str, Any]) -> int:
+		return int(order.get("time") or order.get("updateTime") or order.get("workingTime") or 0)
+
+	# -------- Event-driven mode: local mirror fed by the user-data stream --------
+	def attach_stream(self, stream: Any) -> None:
+		"""
+		Switches to event-driven maintenance: stream events update the local mirror of open orders and positions,
+		the rules run on the mirror right after an event; REST is used only for reconciliation
+		(on every (re)connect and every reconcile_interval_sec). Starts the worker thread.
+		"""
+		self.stream = stream
+		stream.subscribe(self.handle_event)
+		stream.on_reconnect(self.request_reconcile)
+		if self._worker is None or not self._worker.is_alive():
+			self._stopped.clear()
+			self._worker = threading.Thread(target=self._run, name="order_manager", daemon=True)
+			self._worker.start()
+
+	@property
+	def stream_driven(self) -> bool:
+		return self.stream is not None and self._worker is not None and self._worker.is_alive()
+
+	def stop(self) -> None:
+		"""Stops the worker thread and the placement pool; trades still queued or waiting for a retry end as not placed"""
+		self._stopped.set()
+		self._wakeup.set()
+		self._executor.shutdown(wait=False, cancel_futures=True)
+		with self._queue_lock:
+			pending = [future for queue in self._symbol_queues.values() for _, future in queue]
+			self._symbol_queues.clear()
+		for future in pending:
+			if not future.cancel():
+				self._resolve(future, {"success": False, "message": "order manager stopped"})
+
+	def request_reconcile(self) -> None:
+		self._reconcile_requested = True
+		self._wakeup.set()
+
+	def _order_from_event(self, o: Dict[str, Any]) -> Dict[str, Any]:
+		# same keys as REST openOrders, so the rules don't care where the order came from
+		return {
+			"symbol": o.get("s"),
+			"orderId": o.get("i"),
+			"clientOrderId": o.get("c"),
+			"type": o.get("ot") or o.get("o"),
+			"side": o.get("S"),
+			"status": o.get("X"),
+			"price": o.get("p"),
+			"stopPrice": o.get("sp"),
+			"origQty": o.get("q"),
+			"reduceOnly": o.get("R"),
+			"positionSide": o.get("ps"),
+			"activatePrice": o.get("AP"),
+			"priceRate": o.get("cr"),
+			"time": o.get("T"),
+		}
+
+	def handle_event(self, event: Dict[str, Any]) -> None:
+		"""User-data stream event -> mirror update; the affected symbols are checked by the worker right away"""
+		event_type = event.get("e")
+		symbols = set()
+		if event_type == "ORDER_TRADE_UPDATE":
+			order = self._order_from_event(event.get("o", {}) or {})
+			symbol = order["symbol"]
+			with self._mirror_lock:
+				self._apply_order(order)
+			if order["type"] == "TRAILING_STOP_MARKET" and order["status"] == "NEW":
+				self._rearmed_at.pop(symbol, None)
+			symbols.add(symbol)
+		elif event_type == "ACCOUNT_UPDATE":
+			with self._mirror_lock:
+				for p in (event.get("a", {}) or {}).get("P", []) or []:
+					self._apply_position({"symbol": p.get("s"), "positionAmt": p.get("pa"), "entryPrice": p.get("ep")})
+					symbols.add(p.get("s"))
+		elif event_type == "ACCOUNT_CONFIG_UPDATE":
+			symbol = (event.get("ac", {}) or {}).get("s")
+			if symbol:
+				self.bnc.invalidate_account_settings(symbol)
+		# balance reacts to fills and account updates on its own
+		balance = getattr(self.bnc, "balance", None)
+		if balance is not None:
+			balance.handle_user_event(event)
+		if symbols:
+			now_ms = int(self.clock() * 1000)
+			with self._mirror_lock:
+				self._dirty.update(symbols)
+				for symbol in symbols:
+					self._last_event_ms[symbol] = now_ms
+			self._wakeup.set()
+
+	def _apply_order(self, order: Dict[str, Any]) -> None:
+		# under _mirror_lock
+		if self._snapshot_changes is not None:
+			self._snapshot_changes.append(("order", order))
+		orders = self._orders.setdefault(order["symbol"], {})
+		if order["status"] in OPEN_ORDER_STATUSES:
+			# keep the creation time of the order for TTL / grace
+			order["time"] = orders.get(order["orderId"], order).get("time")
+			orders[order["orderId"]] = order
+		else:
+			orders.pop(order["orderId"], None)
+
+	def _apply_position(self, position: Dict[str, Any]) -> None:
+		# under _mirror_lock
+		if self._snapshot_changes is not None:
+			self._snapshot_changes.append(("position", position))
+		self._positions[position["symbol"]] = position
+
+	def _forget_orders(self, symbol: str) -> None:
+		with self._mirror_lock:
+			self._orders.pop(symbol, None)
+
+	def _snapshot(self) -> Tuple[Dict[str, Dict[Any, Dict[str, Any]]], Dict[str, Dict[str, Any]]]:
+		"""All open orders and all positions in two REST requests, grouped by symbol: ({symbol: {orderId: order}}, {symbol: position})"""
+		orders: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+		for o in self.bnc.get_all_open_orders():
+			orders.setdefault(o.get("symbol"), {})[o.get("orderId")] = o
+		positions: Dict[str, Dict[str, Any]] = {}
+		for p in self.bnc.get_all_positions():
+			# one-way mode has one entry per symbol; otherwise prefer the side that is open
+			if float(p.get("positionAmt", 0) or 0) != 0 or p.get("symbol") not in positions:
+				positions[p.get("symbol")] = p
+		return orders, positions
+
+	def _active_symbols(self, orders: Dict[str, Dict[Any, Dict[str, Any]]], positions: Dict[str, Dict[str, Any]]) -> set:
+		return {s for s, symbol_orders in orders.items() if symbol_orders} | {s for s, p in positions.items() if float(p.get("positionAmt", 0) or 0) != 0}
+
+	def sweep(self, *, verbose: bool = False) -> int:
+		"""
+		Polling-mode cleanup of the whole account: one snapshot (get_all_open_orders + get_all_positions),
+		then the watch_and_cleanup rules for every symbol with open orders or a position.
+		O(1) requests per sweep instead of two per symbol. Returns the number of symbols checked.
+		"""
+		orders, positions = self._snapshot()
+		symbols = self._active_symbols(orders, positions)
+		for symbol in symbols:
+			lock = self._lock_for_symbol(symbol)
+			if not lock.acquire(blocking=False):
+				continue		# a placement is running, its orders are checked by the next sweep
+			try:
+				self._apply_rules(symbol, list(orders.get(symbol, {}).values()), positions.get(symbol), verbose=verbose)
+			except Exception as e:
+				self._log("watch_and_cleanup_error", {"symbol": symbol, "error": str(e)})
+			finally:
+				lock.release()
+		self._log("sweep", {"symbols": len(symbols), "open_orders": sum(len(o) for o in orders.values())})
+		return len(symbols)
+
+	def reconcile(self) -> None:
+		"""
+		Rebuilds the mirror from the account snapshot (two REST requests) and checks every active symbol.
+		Stream events applied while the snapshot is read may be newer than it: they are replayed on top, in arrival order.
+		"""
+		with self._mirror_lock:
+			self._snapshot_changes = []
+		try:
+			orders, positions = self._snapshot()
+		except Exception:
+			with self._mirror_lock:
+				self._snapshot_changes = None
+			raise
+		with self._mirror_lock:
+			changes, self._snapshot_changes = self._snapshot_changes, None
+			self._orders = orders
+			self._positions = positions
+			for kind, item in changes:
+				if kind == "order":
+					self._apply_order(item)
+				else:
+					self._apply_position(item)
+			self._dirty.update(self._active_symbols(self._orders, self._positions))
+		self._log("reconcile", {"open_orders": sum(len(o) for o in orders.values()), "symbols": len(orders)})
+
+	def _check_symbol(self, symbol: str) -> bool:
+		"""Rules for one symbol on the mirror; False if a placement for the symbol is in progress (checked again later)"""
+		lock = self._lock_for_symbol(symbol)
+		if not lock.acquire(blocking=False):
+			return False
+		try:
+			with self._mirror_lock:
+				open_orders = list(self._orders.get(symbol, {}).values())
+				pos = self._positions.get(symbol)
+			self._apply_rules(symbol, open_orders, pos)
 		except Exception as e:
 			self._log("watch_and_cleanup_error", {"symbol": symbol, "error": str(e)})
-			return
+		finally:
+			lock.release()
+		return True
 
+	def _run(self) -> None:
+		last_reconcile = float("-inf")
+		while not self._stopped.is_set():
+			self._wakeup.wait(self.tick_sec)
+			self._wakeup.clear()
+			if self._stopped.is_set():
+				break
+			if self._reconcile_requested or time.monotonic() - last_reconcile >= self.reconcile_interval_sec:
+				self._reconcile_requested = False
+				last_reconcile = time.monotonic()
+				try:
+					self.reconcile()
+				except Exception as e:
+					self._log("reconcile_error", {"error": str(e)})
+			with self._mirror_lock:
+				# symbols with orders are re-checked every tick: TTL and the grace of fresh protections run on the local clock
+				symbols = self._dirty | {s for s, orders in self._orders.items() if orders}
+				self._dirty = set()
+			for symbol in symbols:
+				if not self._check_symbol(symbol):
+					with self._mirror_lock:
+						self._dirty.add(symbol)
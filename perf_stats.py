@@ -0,0 +1,277 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+MAX_GRID_POINTS = 100_000
+
+
+@dataclass
+class StatsVariant():
+    """One money-management variant to evaluate over finished deals.
+
+    trailing_mode:
+    - None: deals count as they finished
+    - 'fixed': a lost deal whose best_price_perc went above stop_dist_perc * threshold is counted as a win
+      with profit (threshold - trailing_stop_perc), as in DB_handler.show_perfomance_stats_adj
+    - 'best': same, but the profit is (best_price_perc - trailing_stop_perc), as in show_perfomance_stats_adj2
+    """
+    risk: float
+    threshold: float = None
+    trailing_stop_perc: float = None
+    trailing_mode: str = None
+
+
+def finish_times(deals: dict) -> np.ndarray:
+    """finish_ms as int64. Finished deals without a finish time (old rows) come first in finish_ms order,
+    they get the first known finish time"""
+    finish_ms = deals['finish_ms']
+    missing = np.isnan(finish_ms)
+    if missing.any():
+        finish_ms = np.where(missing, np.nanmin(finish_ms) if not missing.all() else 0, finish_ms)
+    return finish_ms.astype(np.int64)
+
+
+def unit_returns(deals: dict, variants: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-deal result in units of risk for every variant plus win and loss masks, all shaped (variants, deals).
+    Win = +profit_loss, loss = -1, any other finished status = 0"""
+    status = deals['status']
+    is_win = status == 'win'
+    is_loss = status == 'loss'
+    profit_loss = deals['profit_loss']
+    stop_dist_perc = deals['stop_dist_perc']
+    best_price_perc = deals['best_price_perc']
+
+    base = np.where(is_win, profit_loss, np.where(is_loss, -1.0, 0.0))
+    shape = (len(variants), status.shape[0])
+    units = np.empty(shape)
+    wins = np.empty(shape, dtype=bool)
+    losses = np.empty(shape, dtype=bool)
+
+    for index, variant in enumerate(variants):
+        if variant.trailing_mode is None:
+            units[index] = base
+            wins[index] = is_win
+            losses[index] = is_loss
+            continue
+        rescued = is_loss & (best_price_perc > stop_dist_perc * variant.threshold)
+        if variant.trailing_mode == 'fixed':
+            rescued_profit = variant.threshold - variant.trailing_stop_perc
+        else:
+            rescued_profit = best_price_perc - variant.trailing_stop_perc
+        units[index] = np.where(rescued, rescued_profit, base)
+        wins[index] = is_win | rescued
+        losses[index] = is_loss & ~rescued
+
+    return units, wins, losses
+
+
+def compute_stats(deals: dict, variants: list, initial_bank: float = 100, with_curves: bool = False) -> list[dict]:
+    """Compounded bank, win/loss counts and average profit for all variants in one NumPy pass"""
+    deals_quantity = deals['status'].shape[0]
+    if deals_quantity == 0 or not variants:
+        return [{'variant': variant, 'initial_bank': initial_bank, 'deals': 0} for variant in variants]
+
+    units, win_mask, loss_mask = unit_returns(deals, variants)
+    risks = np.array([variant.risk for variant in variants], dtype=float)[:, None]
+    returns = risks * units                               # (variants, deals) relative bank change per deal
+
+    # cumprod compounds in deal order, like the per-deal loop it replaced
+    curves = initial_bank * np.cumprod(1 + returns, axis=1)
+    final_bank = curves[:, -1]
+
+    # the starting bank is the first peak
+    peaks = np.maximum(np.maximum.accumulate(curves, axis=1), initial_bank)
+    max_drawdown = (1 - curves / peaks).max(axis=1)
+
+    wins = win_mask.sum(axis=1)
+    losses = loss_mask.sum(axis=1)
+    win_perc = np.where(win_mask, returns, 0).sum(axis=1)
+    loss_perc = np.where(loss_mask, returns, 0).sum(axis=1)
+
+    reports = []
+    for index, variant in enumerate(variants):
+        report = {
+            'variant': variant,
+            'initial_bank': initial_bank,
+            'final_bank': float(final_bank[index]),
+            'deals': deals_quantity,
+            'wins': int(wins[index]),
+            'losses': int(losses[index]),
+            'average_profit_abs': round(float((final_bank[index] - initial_bank) / deals_quantity), 2),
+            'average_profit_perc': round(float((win_perc[index] + loss_perc[index]) / deals_quantity * 100), 2),
+            'max_drawdown': round(float(max_drawdown[index] * 100), 2),
+        }
+        if with_curves:
+            report['bank_curve'] = curves[index]
+        reports.append(report)
+
+    return reports
+
+
+def format_report(report: dict) -> str:
+    variant = report['variant']
+
+    if report['deals'] == 0:
+        return '\nНет завершённых сделок'
+
+    if variant.trailing_mode == 'fixed':
+        header = f'С трейлинг-стопом {variant.threshold} / {variant.trailing_stop_perc} от точки трейлинг-стопа        \n\n'
+    elif variant.trailing_mode == 'best':
+        header = f'С трейлинг-стопом {variant.threshold} / {variant.trailing_stop_perc} от лучшей цены        \n\n'
+    else:
+        header = ''
+
+    return f"""\n
+{header}Стартовый банк: {report['initial_bank']}
+Конечный банк: {round(report['final_bank'], 2)}
+Риск на сделку: {variant.risk}
+Сделок: {report['deals']}
+Прибыльных/убыточных сделок: {report['wins']}/{report['losses']}
+Средняя прибыль на сделку абсолютная: {report['average_profit_abs']}
+Средняя прибыль на сделку %: {report['average_profit_perc']}
+        """
+
+
+def perfomance_reports(db: object, variants: list, initial_bank: float = 100, conditions: list = None) -> list[str]:
+    """Loads finished deals once and returns report texts for all variants in the given order"""
+    deals = db.get_finished_deals_arrays(conditions)
+    if not isinstance(deals, dict):
+        return [f'SQLite error: {deals}']
+    return [format_report(report) for report in compute_stats(deals, variants, initial_bank)]
+
+
+def parse_range(text: str) -> np.ndarray:
+    """'start:stop:step' (stop included), 'a,b,c' or a single value. ValueError on step <= 0 or stop < start"""
+    if ':' in text:
+        start, stop, step = (float(value) for value in text.split(':'))
+        if step <= 0 or stop < start:
+            raise ValueError(f'bad range {text}: step must be positive and stop not below start')
+        return np.round(np.arange(start, stop + step / 2, step), 10)
+    return np.array([float(value) for value in text.split(',')])
+
+
+def grid_search(deals: dict, thresholds, trailing_stops, risks, trailing_mode: str = 'fixed',
+                top_n: int = 10, initial_bank: float = 100, chunk_elements: int = 4_000_000) -> list[dict]:
+    """Evaluates every (threshold, trailing_stop_perc, risk) point of the grid over finished deals
+    and returns top_n points by final bank with win rate and max drawdown.
+    Deals × grid points are broadcast in chunks of about chunk_elements values to bound memory"""
+    status = deals['status']
+    deals_quantity = status.shape[0]
+    if deals_quantity == 0:
+        return []
+
+    is_win = status == 'win'
+    is_loss = status == 'loss'
+    profit_loss = deals['profit_loss']
+    stop_dist_perc = deals['stop_dist_perc']
+    best_price_perc = deals['best_price_perc']
+    base = np.where(is_win, profit_loss, np.where(is_loss, -1.0, 0.0))
+
+    grid_thresholds, grid_stops, grid_risks = (axis.ravel() for axis in np.meshgrid(
+        np.asarray(thresholds, dtype=float), np.asarray(trailing_stops, dtype=float), np.asarray(risks, dtype=float),
+        indexing='ij'))
+    grid_size = grid_thresholds.shape[0]
+
+    final_bank = np.empty(grid_size)
+    max_drawdown = np.empty(grid_size)
+    wins = np.empty(grid_size, dtype=int)
+    losses = np.empty(grid_size, dtype=int)
+
+    chunk = max(1, chunk_elements // deals_quantity)
+    for start in range(0, grid_size, chunk):
+        stop = min(start + chunk, grid_size)
+        threshold = grid_thresholds[start:stop, None]
+        trailing_stop = grid_stops[start:stop, None]
+        risk = grid_risks[start:stop, None]
+
+        rescued = is_loss & (best_price_perc > stop_dist_perc * threshold)
+        if trailing_mode == 'fixed':
+            rescued_profit = threshold - trailing_stop
+        else:
+            rescued_profit = best_price_perc - trailing_stop
+        units = np.where(rescued, rescued_profit, base)
+
+        curve = np.cumprod(1 + risk * units, axis=1)
+        # the starting bank is the first peak
+        peak = np.maximum(np.maximum.accumulate(curve, axis=1), 1)
+
+        final_bank[start:stop] = initial_bank * curve[:, -1]
+        max_drawdown[start:stop] = (1 - curve / peak).max(axis=1)
+        wins[start:stop] = (is_win | rescued).sum(axis=1)
+        losses[start:stop] = (is_loss & ~rescued).sum(axis=1)
+
+    order = np.argsort(-final_bank, kind='stable')[:top_n]
+    results = []
+    for index in order:
+        finished = wins[index] + losses[index]
+        results.append({
+            'variant': StatsVariant(float(grid_risks[index]), float(grid_thresholds[index]), float(grid_stops[index]), trailing_mode),
+            'initial_bank': initial_bank,
+            'final_bank': float(final_bank[index]),
+            'deals': deals_quantity,
+            'wins': int(wins[index]),
+            'losses': int(losses[index]),
+            'win_rate': round(float(wins[index] / finished * 100), 2) if finished else 0.0,
+            'max_drawdown': round(float(max_drawdown[index] * 100), 2),
+        })
+
+    return results
+
+
+def format_grid_results(results: list, grid_size: int = None) -> str:
+    if not results:
+        return 'Нет завершённых сделок'
+
+    mode = results[0]['variant'].trailing_mode
+    mode_text = 'от точки трейлинг-стопа' if mode == 'fixed' else 'от лучшей цены'
+    header = f'Лучшие настройки трейлинг-стопа ({mode_text})'
+    if grid_size:
+        header += f', перебрано вариантов: {grid_size}'
+
+    lines = [header, f"Сделок: {results[0]['deals']}, стартовый банк: {results[0]['initial_bank']}", '']
+    for place, result in enumerate(results, start=1):
+        variant = result['variant']
+        lines.append(f"{place}. {variant.threshold} / {variant.trailing_stop_perc}, риск {variant.risk}: "
+                     f"банк {round(result['final_bank'], 2)}, "
+                     f"прибыльных {result['win_rate']}% ({result['wins']}/{result['losses']}), "
+                     f"просадка {result['max_drawdown']}%")
+    return '\n'.join(lines)
+
+
+def grid_report(db: object, thresholds: str, trailing_stops: str, risks: str, trailing_mode: str = 'fixed',
+                top_n: int = 10, initial_bank: float = 100, conditions: list = None) -> str:
+    """Grid search over finished deals of db, ranges as accepted by parse_range, at most MAX_GRID_POINTS points"""
+    deals = db.get_finished_deals_arrays(conditions)
+    if not isinstance(deals, dict):
+        return f'SQLite error: {deals}'
+
+    thresholds, trailing_stops, risks = parse_range(thresholds), parse_range(trailing_stops), parse_range(risks)
+    grid_size = thresholds.size * trailing_stops.size * risks.size
+    if grid_size > MAX_GRID_POINTS:
+        raise ValueError(f'grid of {grid_size} points is larger than {MAX_GRID_POINTS}')
+    results = grid_search(deals, thresholds, trailing_stops, risks, trailing_mode, top_n, initial_bank)
+    return format_grid_results(results, grid_size)
+
+
+def main():
+    import argparse
+
+    from db_funcs import DB_handler
+
+    parser = argparse.ArgumentParser(description='Trailing stop what-if grid search over finished deals')
+    parser.add_argument('dbname', help='deals database, e.g. deals_5m_rm.sqlite')
+    parser.add_argument('--thresholds', default='0.5:1.5:0.1', help="best_price_perc threshold range 'start:stop:step' or 'a,b,c'")
+    parser.add_argument('--trailing', default='0.1:0.5:0.05', help='trailing_stop_perc range')
+    parser.add_argument('--risks', default='0.03', help='risk per deal range')
+    parser.add_argument('--mode', default='fixed', choices=['fixed', 'best'])
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--bank', type=float, default=100)
+    args = parser.parse_args()
+
+    db = DB_handler(args.dbname)
+    print(grid_report(db, args.thresholds, args.trailing, args.risks, args.mode, args.top, args.bank))
+
+
+if __name__ == '__main__':
+    main()
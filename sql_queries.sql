@@ -1,3 +1,14 @@
+-- MATERIALIZED STATS (daily_stats / pair_stats are updated by triggers on deals, DB_handler.rebuild_stats() recomputes them)
+-- SELECT date, deals, wins, losses, deals - wins - losses AS active_deals,
+--   ROUND(2 * (win_units - losses), 3) AS direct_day_result_2p, ROUND(2 * (reverse_units - wins), 3) AS reverse_day_result_2p
+-- FROM daily_stats
+-- ORDER BY date;
+
+-- SELECT pair, deals, wins, losses, ROUND(CAST(losses AS REAL) / wins, 2) AS lose_win_ratio,
+--   ROUND(loss_stop_dist_perc / losses, 2) AS ave_loss_perc
+-- FROM pair_stats
+-- ORDER BY ave_loss_perc DESC;
+
 -- CREATE TABLE IF NOT EXISTS deals_new (
 --             deal_id INTEGER PRIMARY KEY AUTOINCREMENT,
 --             datetime TEXT NOT NULL,
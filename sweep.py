@@ -0,0 +1,155 @@
+import copy
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as dt
+
+import pandas as pd
+
+import backtest as bt
+import bot_funcs as bf
+import perf_stats as ps
+from db_funcs import to_epoch_ms
+
+# Sweep spec (JSON):
+# {
+#     "config": "config_5m_rm.json",
+#     "start": "2026-06-01", "end": "2026-09-01",
+#     "pairs": ["BTCUSDT", "ETHUSDT"],                                  optional, default trading_pairs of the config
+#     "grid": {"deal_config.profit_loss_ratio_min": [1, 1.5, 2],       every combination
+#              "levels.broken_density_factor": [0.5, 1]},
+#     "random": {"deal_config.stop_offset_modes.dist_percentage": [-50, -10],   [low, high] - uniform, list of other
+#                "deal_config.considering_level_density": [1, 2, 4]},          length / strings - choice
+#     "samples": 50, "seed": 1                                           random search size, combined with the grid
+# }
+# Parameters of the "general" section are not swept: all backtests of a group run in lockstep over the same windows.
+
+
+def set_param(config: dict, path: str, value):
+    keys = path.split('.')
+    section = config
+    for key in keys[:-1]:
+        section = section[key]
+    if keys[-1] not in section:
+        raise KeyError(f'Unknown config parameter {path}')
+    section[keys[-1]] = value
+
+
+def expand_spec(spec: dict) -> list[dict]:
+    """List of {parameter path: value} combinations of the spec"""
+    grid = spec.get('grid', {})
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())] or [{}]
+
+    random_params = spec.get('random', {})
+    if random_params:
+        rng = random.Random(spec.get('seed'))
+        sampled = []
+        for _ in range(spec.get('samples', 20)):
+            sample = {}
+            for path, choices in random_params.items():
+                if len(choices) == 2 and all(isinstance(value, (int, float)) for value in choices):
+                    low, high = choices
+                    sample[path] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) else round(rng.uniform(low, high), 4)
+                else:
+                    sample[path] = rng.choice(choices)
+            sampled.append(sample)
+        combos = [{**combo, **sample} for combo in combos for sample in sampled]
+
+    for combo in combos:
+        if any(path.startswith('general.') for path in combo):
+            raise ValueError('general parameters can not be swept')
+    return combos
+
+
+def _run_group(task: dict) -> list[dict]:
+    """Process pool worker: backtests of a group of combinations in lockstep over memory-mapped klines"""
+    store = bt.KlineStore(task['klines'], mmap=True)
+    backtesters = []
+    for index, combo in task['combos']:
+        config = copy.deepcopy(task['config'])
+        for path, value in combo.items():
+            set_param(config, path, value)
+        db_file_name = os.path.join(task['out'], f'run_{index:04d}.sqlite')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file_name + suffix):
+                os.remove(db_file_name + suffix)
+        backtesters.append(bt.Backtester(config, db_file_name, store, task['pairs']))
+
+    first = backtesters[0]
+    data = bt.load_pair_data(store, task['pairs'], first.checked_timeframes, first.trading_timeframe)
+    run_stats = bt.run_backtests(backtesters, data, task['start_ms'], task['end_ms'])
+
+    rows = []
+    for (index, combo), backtester, stats in zip(task['combos'], backtesters, run_stats):
+        risk = backtester.deal_config['deal_risk_perc_of_bank'] / 100
+        report = ps.compute_stats(backtester.db.get_finished_deals_arrays(), [ps.StatsVariant(risk)], task['initial_bank'])[0]
+        finished = report.get('wins', 0) + report.get('losses', 0)
+        rows.append({
+            'run': index,
+            **combo,
+            'deals': report['deals'],
+            'wins': report.get('wins', 0),
+            'losses': report.get('losses', 0),
+            'win_rate': round(report['wins'] / finished * 100, 2) if finished else 0.0,
+            'final_bank': round(report.get('final_bank', task['initial_bank']), 2),
+            'max_drawdown': report.get('max_drawdown', 0.0),
+            'average_profit_perc': report.get('average_profit_perc', 0.0),
+            'seconds': stats['seconds'],
+        })
+        backtester.close()
+    return rows
+
+
+def run_sweep(spec: dict, out: str, processes: int = None, group_size: int = 4, klines: str = 'klines') -> pd.DataFrame:
+    """Runs backtests of all spec combinations and writes them ranked by final bank into <out>/results.csv"""
+    config = bf.load_config(spec.get('config', 'config_5m_rm.json'))
+    pairs = spec.get('pairs') or config['general']['trading_pairs']
+    combos = list(enumerate(expand_spec(spec)))
+    os.makedirs(out, exist_ok=True)
+
+    base = {
+        'config': config,
+        'pairs': pairs,
+        'klines': klines,
+        'out': out,
+        'start_ms': to_epoch_ms(dt.strptime(spec['start'], '%Y-%m-%d')),
+        'end_ms': to_epoch_ms(dt.strptime(spec['end'], '%Y-%m-%d')),
+        'initial_bank': config['general']['initial_bank_for_test_stats'],
+    }
+    tasks = [{**base, 'combos': combos[i:i + group_size]} for i in range(0, len(combos), group_size)]
+    print(f'{bf.timestamp()} - Sweep: {len(combos)} combinations in {len(tasks)} groups')
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for group_rows in executor.map(_run_group, tasks):
+            rows += group_rows
+            print(f'{bf.timestamp()} - Done {len(rows)}/{len(combos)}')
+
+    results = pd.DataFrame(rows).sort_values(['final_bank', 'max_drawdown'], ascending=[False, True])
+    results.to_csv(os.path.join(out, 'results.csv'), index=False)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parameter sweep of backtests over deal_config / levels config')
+    parser.add_argument('spec', help='sweep spec JSON, see the top of sweep.py')
+    parser.add_argument('--out', help='results directory, default: sweeps/<spec name>')
+    parser.add_argument('--processes', type=int, help='default: CPU count')
+    parser.add_argument('--group-size', type=int, default=4, help='combinations run in lockstep by one process')
+    parser.add_argument('--klines', default='klines', help='klines store directory')
+    args = parser.parse_args()
+
+    with open(args.spec) as spec_file:
+        spec = json.load(spec_file)
+    out = args.out or os.path.join('sweeps', os.path.splitext(os.path.basename(args.spec))[0])
+
+    results = run_sweep(spec, out, args.processes, args.group_size, args.klines)
+    print(results.head(10).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
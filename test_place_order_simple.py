@@ -20,6 +20,8 @@ CONFIG = {
 	"api_key": sub1_api_key or "",            # or put your key string here
 	"api_secret": sub1_api_secret or "",      # or put your secret string here
 	"testnet": False,                           # set False for production
+	"mock_exchange": False,                     # place against a local mock_exchange.MockFuturesExchange, no keys needed
+	"api_mode": "classic",                     # classic (/fapi) or pm (/papi)
 	"log_to_file": True,                       # write JSONL logs to logs/binance_connector.log
 	"log_file_path": None,                     # or custom path, e.g. "logs/my_orders.log"
 	"skip_account_setup": False,                # do not change margin type/leverage inside connector
@@ -51,7 +53,15 @@ CONFIG = {
 def main() -> int:
 	api_key = (CONFIG["api_key"] or "").strip()
 	api_secret = (CONFIG["api_secret"] or "").strip()
-	if not api_key or not api_secret:
+	base_url: Optional[str] = None
+	if CONFIG.get("mock_exchange"):
+		from mock_exchange import MockFuturesExchange
+
+		api_key, api_secret = "mock-key", "mock-secret"
+		mock = MockFuturesExchange(api_key=api_key, api_secret=api_secret).start()
+		mock.set_price(CONFIG["symbol"], float(CONFIG["entry_price"]))
+		base_url = mock.url
+	elif not api_key or not api_secret:
 		print("API key/secret are missing. Fill CONFIG['api_key'] and CONFIG['api_secret'] or user_data.credentials.")
 		return 2
 
@@ -62,6 +72,9 @@ def main() -> int:
 		recv_window_ms=60000,
 		log_to_file=bool(CONFIG.get("log_to_file", False)),
 		log_file_path=CONFIG.get("log_file_path"),
+		api_mode=str(CONFIG.get("api_mode", "classic")),
+		base_url=base_url,
+		pm_base_url=base_url,
 	)
 
 	result = conn.place_futures_order_with_protection(
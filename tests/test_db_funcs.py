@@ -0,0 +1,137 @@
+"""Deals schema migration, the write-behind DB_writer path and ActiveDealBook on a temporary SQLite file"""
+import sqlite3
+import time
+
+import pytest
+
+import levels as lv
+from db_funcs import SCHEMA_VERSION, DB_handler, to_epoch_ms
+from deal_book import ActiveDealBook
+
+# deals table as it was before the epoch-millisecond columns (user_version 0)
+BASELINE_DEALS_TABLE = """CREATE TABLE deals (
+    deal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    profit_loss REAL NOT NULL,
+    entry_price REAL NOT NULL,
+    take_price REAL NOT NULL,
+    stop_price REAL NOT NULL,
+    take_dist_perc REAL NOT NULL,
+    stop_dist_perc REAL NOT NULL,
+    best_price REAL,
+    worst_price REAL,
+    best_price_perc REAL,
+    worst_price_perc REAL,
+    current_price REAL,
+    current_price_perc REAL,
+    status TEXT,
+    finish_time TEXT,
+    indicators TEXT);
+"""
+
+BASELINE_DEALS = [
+    # deal_id, datetime, pair, direction, profit_loss, status, finish_time
+    (1, '2024-03-01 02:30:00', 'BTCUSDT', 'long', 2.0, 'loss', '2024-03-01 04:00:00'),
+    (2, '2024-03-01 23:50:00', 'ETHUSDT', 'short', 3.0, 'win', '2024-03-02 01:10:00'),
+    (3, '2024-03-02 10:00:00', 'BTCUSDT', 'long', 2.5, 'active', ''),
+]
+
+
+@pytest.fixture(autouse=True)
+def local_timezone(monkeypatch):
+    # UTC+5: local and UTC days differ for the early morning deals
+    if not hasattr(time, 'tzset'):
+        pytest.skip('time.tzset is not available on this platform')
+    monkeypatch.setenv('TZ', 'Asia/Yekaterinburg')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def make_deal(pair: str = 'BTCUSDT', direction: str = 'long') -> lv.Deal:
+    return lv.Deal(timeframe='5m', entry_price=100.123456, take_price=102.0, stop_price=99.0, timestamp='',
+                   profit_loss_ratio=2.0, leverage=10, direction=direction, take_dist_perc=1.9, stop_dist_perc=1.1,
+                   status='active', best_price=100.0, worst_price=100.0, pair=pair)
+
+
+def baseline_db(path) -> str:
+    connection = sqlite3.connect(path)
+    connection.execute(BASELINE_DEALS_TABLE)
+    for deal_id, created, pair, direction, profit_loss, status, finish_time in BASELINE_DEALS:
+        connection.execute("""INSERT INTO deals (deal_id, datetime, pair, timeframe, direction, profit_loss, entry_price,
+            take_price, stop_price, take_dist_perc, stop_dist_perc, status, finish_time)
+            VALUES (?, ?, ?, '5m', ?, ?, 100, 102, 99, 2, 1, ?, ?)""",
+            (deal_id, created, pair, direction, profit_loss, status, finish_time))
+    connection.commit()
+    connection.close()
+    return str(path)
+
+
+def test_baseline_db_is_migrated_once(tmp_path):
+    db = DB_handler(baseline_db(tmp_path / 'deals.sqlite'))
+    assert db.setup() is None
+
+    assert db.cursor.execute('PRAGMA user_version;').fetchone()[0] == SCHEMA_VERSION == 3
+    rows = db.cursor.execute('SELECT deal_id, datetime, finish_time, created_ms, finish_ms FROM deals ORDER BY deal_id').fetchall()
+    for (deal_id, created, finish_time, created_ms, finish_ms), baseline in zip(rows, BASELINE_DEALS):
+        # the local text stays as it was, the epoch columns are the same moments
+        assert created == baseline[1]
+        assert created_ms == to_epoch_ms(baseline[1])
+        assert finish_time == (baseline[6] or None)
+        assert finish_ms == (to_epoch_ms(baseline[6]) if baseline[6] else None)
+    assert db.read_deal(1).timestamp == '2024-03-01 02:30:00'
+
+    # local days, like strftime('%Y-%m-%d', datetime) in sql_queries_2.sql
+    assert db.read_daily_stats() == [
+        ('2024-03-02', 1, 0, 0, 0.0, 0.0, 0.0),
+        ('2024-03-01', 2, 1, 1, 3.0, 0.5, 1.0),
+    ]
+    assert db.get_finished_deals_state([]) == (2, to_epoch_ms('2024-03-02 01:10:00'), 2)
+
+    # a second start finds nothing to do
+    again = DB_handler(db.dbname)
+    assert again.setup() is None
+    assert again.cursor.execute('SELECT COUNT(*) FROM deals').fetchone()[0] == 3
+
+
+def test_writer_keeps_text_and_epoch_times_together(tmp_path):
+    db = DB_handler(str(tmp_path / 'deals.sqlite'))
+    assert db.setup() is None
+    db.start_writer(batch_interval=0.05)
+    try:
+        stored = db.add_deal(make_deal(), created_ms=to_epoch_ms('2024-03-01 02:30:00'))
+        assert stored.deal_id == 1
+        assert stored.timestamp == '2024-03-01 02:30:00'
+        assert stored.entry_price == 100.123
+
+        db.update_deals_bulk([(stored.deal_id, {'status': 'win', 'finish_time': '2024-03-01 03:00:00'})])
+        assert db.flush(5)
+    finally:
+        db.stop_writer()
+
+    row = db.cursor.execute('SELECT status, datetime, finish_time, finish_ms FROM deals WHERE deal_id = 1').fetchone()
+    assert row == ('win', '2024-03-01 02:30:00', '2024-03-01 03:00:00', to_epoch_ms('2024-03-01 03:00:00'))
+    assert db.read_daily_stats() == [('2024-03-01', 1, 1, 0, 2.0, 0.0, 0.0)]
+
+
+def test_active_deal_book_mirrors_the_db(tmp_path):
+    db = DB_handler(str(tmp_path / 'deals.sqlite'))
+    assert db.setup() is None
+    book = ActiveDealBook(db)
+
+    long_deal = book.add_deal(make_deal('BTCUSDT', 'long'))
+    short_deal = book.add_deal(make_deal('ETHUSDT', 'short'))
+    assert isinstance(long_deal, lv.Deal) and long_deal.entry_price == 100.123
+    assert book.read_active_deals('BTCUSDT') == [long_deal]
+    assert (book.total_active_deals_quantity(), book.active_longs_quantity(), book.active_shorts_quantity()) == (2, 1, 1)
+
+    assert book.update_deals_bulk([(long_deal.deal_id, {'status': 'loss', 'finish_time': '2024-03-01 03:00:00'})]) is None
+    assert book.get_active_deals_list() == ['ETHUSDT']
+    assert (book.total_active_deals_quantity(), book.active_longs_quantity()) == (1, 0)
+
+    # a fresh book loads the same active deals from the database
+    assert [deal.deal_id for deal in ActiveDealBook(db).read_active_deals()] == [short_deal.deal_id]
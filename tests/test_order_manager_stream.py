@@ -0,0 +1,223 @@
+"""
+OrderManager in event-driven mode (attach_stream) against MockFuturesExchange: the mock pushes
+ORDER_TRADE_UPDATE / ACCOUNT_UPDATE of its account into a LocalUserDataStream, the rules run on the mirror.
+Grace windows run on a fake clock, the rules are checked right away with _check_symbol (retried while the worker holds the symbol) instead of waiting for a tick.
+"""
+import time
+
+import pytest
+
+pytest.importorskip("binance.um_futures", reason="binance-futures-connector from requirements.txt is not installed")
+
+from binance_connect import Binance_connect
+from exchange_info import ExchangeInfoCache, _fetch_public_exchange_info
+from mock_exchange import MockFuturesExchange
+from order_manager import OrderManager
+from user_stream import LocalUserDataStream, UserDataStream, account_update_event, order_update_event
+
+SYMBOL = "ETHUSDT"
+GRACE_SEC = 2.0
+TRADE = dict(symbol=SYMBOL, side="BUY", entry_price=3000.0, deviation_percent=0.1, stop_loss_price=2950.0,
+	trailing_activation_price=3060.0, trailing_callback_percent=0.5, leverage=10, quantity=0.1,
+	risk_percent_of_bank=None, verbose=False)
+
+
+class FakeClock:
+	"""Epoch seconds that move only on advance(); starts at the real time, the mock exchange stamps orders with"""
+
+	def __init__(self) -> None:
+		self.now = time.time()
+
+	def __call__(self) -> float:
+		return self.now
+
+	def advance(self, seconds: float) -> None:
+		self.now += seconds
+
+
+def wait_until(condition, timeout: float = 10.0) -> bool:
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if condition():
+			return True
+		time.sleep(0.02)
+	return condition()
+
+
+def open_types(exchange: MockFuturesExchange) -> list:
+	return sorted(o["type"] for o in exchange.open_orders(SYMBOL))
+
+
+@pytest.fixture(autouse=True)
+def _logs_in_tmp(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def exchange():
+	with MockFuturesExchange(api_key="mock-key", api_secret="mock-secret") as ex:
+		ex.set_price(SYMBOL, 3000.0)
+		yield ex
+
+
+@pytest.fixture
+def clock():
+	return FakeClock()
+
+
+def make_manager(exchange: MockFuturesExchange, clock: FakeClock, *, stream_driven: bool = True) -> tuple:
+	bnc = Binance_connect("mock-key", "mock-secret", log_to_file=False, api_mode="pm", base_url=exchange.url,
+		pm_base_url=exchange.url, exchange_info=ExchangeInfoCache(lambda: _fetch_public_exchange_info(exchange.url)))
+	config = {
+		"order_manager": {"tick_sec": 0.05, "reconcile_interval_sec": 300, "backoff_sec": [0.1],
+			"stray_grace_sec": GRACE_SEC, "rearm_guard_sec": 30},
+		"deal_config": {"trailing_activation_of_stop_price": 0.85, "trailing_callback_percent_of_stop_price": 0.3},
+	}
+	manager = OrderManager(bnc, config, clock=clock)
+	manager.log_to_file = False
+	if not stream_driven:
+		return manager, None
+	stream = LocalUserDataStream()
+	exchange.attach_stream(stream)
+	manager.attach_stream(stream)
+	stream.start()
+	return manager, stream
+
+
+def test_fill_rearm_stop_and_cleanup(exchange, clock):
+	manager, _ = make_manager(exchange, clock)
+	try:
+		result = manager.submit_managed_trade(**TRADE).result(timeout=10)
+		assert result["success"], result
+		assert open_types(exchange) == ["LIMIT", "STOP_MARKET", "TRAILING_STOP_MARKET"]
+
+		# entry fills: the protections stay
+		exchange.set_price(SYMBOL, 2995.0)
+		assert exchange.position_amount(SYMBOL) == pytest.approx(0.1)
+		clock.advance(GRACE_SEC * 10)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		assert open_types(exchange) == ["STOP_MARKET", "TRAILING_STOP_MARKET"]
+
+		# the trailing disappears: re-armed once from the STOP distance, the guard keeps it from doubling
+		trailing = next(o for o in exchange.open_orders(SYMBOL) if o["type"] == "TRAILING_STOP_MARKET")
+		assert manager.bnc.cancel_order(SYMBOL, order_id=trailing["orderId"])
+		assert wait_until(lambda: open_types(exchange) == ["STOP_MARKET", "TRAILING_STOP_MARKET"])
+		assert wait_until(lambda: SYMBOL not in manager._rearmed_at)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		rearmed = [o for o in exchange.open_orders(SYMBOL) if o["type"] == "TRAILING_STOP_MARKET"]
+		assert len(rearmed) == 1 and rearmed[0]["orderId"] != trailing["orderId"]
+
+		# the stop closes the position: the trailing left behind goes once the grace window is over
+		exchange.set_price(SYMBOL, 2940.0)
+		assert exchange.position_amount(SYMBOL) == 0
+		assert open_types(exchange) == ["TRAILING_STOP_MARKET"]
+		clock.advance(GRACE_SEC * 10)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		assert not exchange.open_orders(SYMBOL)
+	finally:
+		manager.stop()
+
+
+def test_unfilled_bracket_is_kept(exchange, clock):
+	manager, stream = make_manager(exchange, clock)
+	try:
+		result = manager.submit_managed_trade(**TRADE).result(timeout=10)
+		assert result["success"], result
+		bracket = open_types(exchange)
+
+		# the entry LIMIT is still waiting: its protections are never stray, however long it waits
+		clock.advance(GRACE_SEC * 10)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		assert open_types(exchange) == bracket
+
+		# the entry fill reported before the position: protections without entry and position wait out the grace window
+		entry = next(o for o in exchange.open_orders(SYMBOL) if o["type"] == "LIMIT")
+		stream.push(order_update_event(SYMBOL, entry["orderId"], "LIMIT", "FILLED", price=float(entry["price"]), quantity=0.1,
+			time_ms=int(clock() * 1000)))
+		clock.advance(GRACE_SEC / 2)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		assert "STOP_MARKET" in open_types(exchange)
+
+		# no position ever shows up: after the grace window the protections go
+		clock.advance(GRACE_SEC)
+		assert wait_until(lambda: manager._check_symbol(SYMBOL))
+		assert "STOP_MARKET" not in open_types(exchange)
+	finally:
+		manager.stop()
+
+
+def test_sweep_keeps_pending_bracket_and_removes_strays(exchange, clock):
+	manager, _ = make_manager(exchange, clock, stream_driven=False)
+	try:
+		result = manager.place_managed_trade(**TRADE)
+		assert result["success"], result
+		clock.advance(GRACE_SEC * 10)
+		assert manager.sweep() == 1
+		assert open_types(exchange) == ["LIMIT", "STOP_MARKET", "TRAILING_STOP_MARKET"]
+
+		exchange.set_price(SYMBOL, 2995.0)
+		exchange.set_price(SYMBOL, 2940.0)
+		assert exchange.position_amount(SYMBOL) == 0
+		assert open_types(exchange) == ["TRAILING_STOP_MARKET"]
+		manager.sweep()
+		assert not exchange.open_orders(SYMBOL)
+	finally:
+		manager.stop()
+
+
+def test_reconcile_keeps_events_that_arrive_during_the_snapshot(clock):
+	class SnapshotBnc:
+		"""REST snapshot taken just before a NEW order and a position update arrive over the stream"""
+
+		def get_all_open_orders(self):
+			manager.handle_event(order_update_event(SYMBOL, 7, "STOP_MARKET", "NEW", side="SELL", stop_price=2950.0, quantity=0.1))
+			return []
+
+		def get_all_positions(self):
+			manager.handle_event(account_update_event(SYMBOL, 0.1, 3000.0))
+			return [{"symbol": SYMBOL, "positionAmt": "0", "entryPrice": "0"}]
+
+	manager = OrderManager(SnapshotBnc(), {}, clock=clock)
+	manager.log_to_file = False
+	manager.reconcile()
+	assert list(manager._orders[SYMBOL]) == [7]
+	assert manager._positions[SYMBOL]["positionAmt"] == "0.1"
+	assert SYMBOL in manager._dirty
+	manager.stop()
+
+
+def test_reconnect_closes_the_previous_listen_key(monkeypatch):
+	import websocket
+
+	class KeyBnc:
+		def __init__(self) -> None:
+			self.created = []
+			self.closed = []
+
+		def new_listen_key(self):
+			self.created.append(f"key-{len(self.created)}")
+			return self.created[-1]
+
+		def close_listen_key(self, listen_key):
+			self.closed.append(listen_key)
+
+		def user_stream_url(self, listen_key):
+			return f"wss://stream.test/ws/{listen_key}"
+
+	class DroppedConnection:
+		"""Every connection is closed by the server right away, the stream keeps reconnecting"""
+
+		def recv(self):
+			return ""
+
+		def close(self):
+			pass
+
+	monkeypatch.setattr(websocket, "create_connection", lambda url, timeout: DroppedConnection())
+	bnc = KeyBnc()
+	stream = UserDataStream(bnc, reconnect_delay_sec=0)
+	stream.start()
+	assert wait_until(lambda: len(bnc.created) >= 3)
+	stream.stop()
+	stream._thread.join(timeout=5)
+	assert bnc.closed == bnc.created
@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import quote
+
+import requests
+
+
+def fetch_server_time_ms(base_url: str = "https://fapi.binance.com") -> int:
+	resp = requests.get(f"{base_url}/fapi/v1/time", timeout=5)
+	resp.raise_for_status()
+	return int(resp.json()["serverTime"])
+
+
+class ServerTimeSync:
+	"""
+	Offset between the Binance server clock and the local one, so signed requests can use a tight recvWindow.
+	- sync() takes `samples` /time readings and keeps the one with the shortest round trip
+	  (offset = server time - middle of the round trip, error <= rtt / 2)
+	- now_ms() is the local clock corrected by the offset, re-synced in the calling thread once older than interval_sec
+	- start() re-syncs in the background instead
+	"""
+
+	def __init__(self, fetch: Optional[Callable[[], int]] = None, *, interval_sec: float = 300.0, samples: int = 3) -> None:
+		self.fetch = fetch or fetch_server_time_ms
+		self.interval_sec = interval_sec
+		self.samples = samples
+		self.offset_ms = 0
+		self.rtt_ms: Optional[float] = None
+		self._synced_at: Optional[float] = None
+		self._lock = threading.Lock()
+		self._stopped = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def sync(self) -> bool:
+		"""Measures the offset now; keeps the previous one (False) if the server can't be reached"""
+		best = None
+		for _ in range(self.samples):
+			try:
+				sent = time.time() * 1000
+				server_ms = self.fetch()
+				received = time.time() * 1000
+			except Exception as ex:
+				print(f"ServerTimeSync: /time failed: {ex}")
+				continue
+			rtt = received - sent
+			if best is None or rtt < best[0]:
+				best = (rtt, server_ms - (sent + received) / 2)
+		if best is None:
+			return False
+		with self._lock:
+			self.rtt_ms, offset = best
+			self.offset_ms = int(round(offset))
+			self._synced_at = time.monotonic()
+		return True
+
+	@property
+	def synced(self) -> bool:
+		return self._synced_at is not None and time.monotonic() - self._synced_at < 2 * self.interval_sec
+
+	def now_ms(self) -> int:
+		if self._thread is None and (self._synced_at is None or time.monotonic() - self._synced_at >= self.interval_sec):
+			self.sync()
+		return int(time.time() * 1000) + self.offset_ms
+
+	def _run(self) -> None:
+		while not self._stopped.is_set():
+			self.sync()
+			self._stopped.wait(self.interval_sec)
+
+	def start(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self._run, name="server_time_sync", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stopped.set()
+
+
+class SignedRequestBuilder:
+	"""
+	Query strings for signed Binance requests (HMAC SHA256):
+	- the HMAC key schedule is computed once, every signature copies the keyed object
+	- per-endpoint static params (e.g. recvWindow) are url-encoded once and appended as a cached suffix
+	- values that need no escaping (numbers, symbols, plain decimals) skip quote()
+	"""
+
+	_SAFE = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_.~")
+
+	def __init__(self, api_secret: str) -> None:
+		self._hmac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+		self._static: Dict[Any, str] = {}
+
+	def _encode_value(self, value: Any) -> str:
+		if isinstance(value, bool):
+			return "true" if value else "false"
+		text = value if isinstance(value, str) else str(value)
+		if self._SAFE.issuperset(text):
+			return text
+		return quote(text, safe="")
+
+	def encode(self, params: Dict[str, Any]) -> str:
+		return "&".join(f"{k}={self._encode_value(v)}" for k, v in params.items() if v is not None)
+
+	def static_suffix(self, path: str, static_params: Dict[str, Any]) -> str:
+		key = (path, tuple(static_params.items()))
+		suffix = self._static.get(key)
+		if suffix is None:
+			suffix = self._static[key] = self.encode(static_params)
+		return suffix
+
+	def sign(self, query_str: str) -> str:
+		h = self._hmac.copy()
+		h.update(query_str.encode())
+		return h.hexdigest()
+
+	def build(self, path: str, params: Dict[str, Any], static_params: Dict[str, Any], timestamp_ms: int) -> str:
+		"""Signed query string: params, cached static params, timestamp and signature"""
+		parts = [self.encode(params), self.static_suffix(path, static_params), f"timestamp={timestamp_ms}"]
+		query_str = "&".join(p for p in parts if p)
+		return f"{query_str}&signature={self.sign(query_str)}"
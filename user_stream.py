@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class UserDataStream:
+	"""
+	Futures user-data stream (ORDER_TRADE_UPDATE, ACCOUNT_UPDATE, ...) of a Binance_connect account.
+	- the listenKey is created through the connector (classic /fapi or PM /papi) and kept alive every keepalive_sec
+	- events are parsed and passed to every subscribe() callback in the stream thread
+	- on_reconnect() callbacks run after each (re)connection: events missed while disconnected must be reconciled over REST
+	Needs websocket-client (imported when the stream starts).
+	"""
+
+	def __init__(self, bnc: Any, *, keepalive_sec: float = 1800.0, reconnect_delay_sec: float = 5.0, recv_timeout_sec: float = 30.0) -> None:
+		self.bnc = bnc
+		self.keepalive_sec = keepalive_sec
+		self.reconnect_delay_sec = reconnect_delay_sec
+		self.recv_timeout_sec = recv_timeout_sec
+		self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+		self._reconnect_callbacks: List[Callable[[], None]] = []
+		self._stopped = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._ws = None
+
+	def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+		self._subscribers.append(callback)
+
+	def on_reconnect(self, callback: Callable[[], None]) -> None:
+		self._reconnect_callbacks.append(callback)
+
+	def _dispatch(self, event: Dict[str, Any]) -> None:
+		for callback in self._subscribers:
+			try:
+				callback(event)
+			except Exception as ex:
+				print(f"UserDataStream: subscriber failed on {event.get('e')}: {ex}")
+
+	def _connected(self) -> None:
+		for callback in self._reconnect_callbacks:
+			try:
+				callback()
+			except Exception as ex:
+				print(f"UserDataStream: reconnect callback failed: {ex}")
+
+	def _run(self) -> None:
+		import websocket
+
+		while not self._stopped.is_set():
+			listen_key = None
+			try:
+				listen_key = self.bnc.new_listen_key()
+				self._ws = websocket.create_connection(self.bnc.user_stream_url(listen_key), timeout=self.recv_timeout_sec)
+				self._connected()
+				keepalive_at = time.monotonic() + self.keepalive_sec
+				while not self._stopped.is_set():
+					if time.monotonic() >= keepalive_at:
+						self.bnc.keepalive_listen_key(listen_key)
+						keepalive_at = time.monotonic() + self.keepalive_sec
+					try:
+						message = self._ws.recv()
+					except websocket.WebSocketTimeoutException:
+						continue
+					if not message:
+						raise ConnectionError("user data stream closed")
+					event = json.loads(message)
+					if event.get("e") == "listenKeyExpired":
+						raise ConnectionError("listenKey expired")
+					self._dispatch(event)
+			except Exception as ex:
+				if self._stopped.is_set():
+					break
+				print(f"UserDataStream: {ex}, reconnecting in {self.reconnect_delay_sec} s")
+				self._stopped.wait(self.reconnect_delay_sec)
+			finally:
+				if self._ws is not None:
+					try:
+						self._ws.close()
+					except Exception:
+						pass
+					self._ws = None
+				if listen_key:
+					# a reconnect creates a new listenKey: release this one so it doesn't linger until it expires
+					self.bnc.close_listen_key(listen_key)
+
+	def start(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self._run, name="user_data_stream", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stopped.set()
+		if self._ws is not None:
+			try:
+				self._ws.close()
+			except Exception:
+				pass
+
+
+class LocalUserDataStream:
+	"""
+	Stand-in for UserDataStream in tests and offline runs: same subscribe / on_reconnect / start / stop,
+	push() delivers an event synchronously in the caller's thread, reconnect() simulates a new connection.
+	"""
+
+	def __init__(self) -> None:
+		self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+		self._reconnect_callbacks: List[Callable[[], None]] = []
+		self.events: List[Dict[str, Any]] = []
+
+	def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+		self._subscribers.append(callback)
+
+	def on_reconnect(self, callback: Callable[[], None]) -> None:
+		self._reconnect_callbacks.append(callback)
+
+	def start(self) -> None:
+		self.reconnect()
+
+	def stop(self) -> None:
+		pass
+
+	def reconnect(self) -> None:
+		for callback in self._reconnect_callbacks:
+			callback()
+
+	def push(self, event: Dict[str, Any]) -> None:
+		self.events.append(event)
+		for callback in self._subscribers:
+			callback(event)
+
+
+def order_update_event(symbol: str, order_id: int, order_type: str, status: str, *, side: str = "BUY", price: float = 0.0,
+		stop_price: float = 0.0, quantity: float = 0.0, execution_type: Optional[str] = None, reduce_only: bool = False,
+		time_ms: Optional[int] = None) -> Dict[str, Any]:
+	"""ORDER_TRADE_UPDATE in the Binance futures format (fields used by OrderManager)"""
+	time_ms = time_ms if time_ms is not None else int(time.time() * 1000)
+	return {
+		"e": "ORDER_TRADE_UPDATE",
+		"E": time_ms,
+		"T": time_ms,
+		"o": {
+			"s": symbol,
+			"i": order_id,
+			"c": f"local_{order_id}",
+			"S": side,
+			"o": order_type,
+			"ot": order_type,
+			"q": str(quantity),
+			"p": str(price),
+			"sp": str(stop_price),
+			"x": execution_type or ("TRADE" if status in ("FILLED", "PARTIALLY_FILLED") else status),
+			"X": status,
+			"R": reduce_only,
+			"ps": "BOTH",
+			"T": time_ms,
+		},
+	}
+
+
+def account_update_event(symbol: str, position_amount: float, entry_price: float, *, wallet_balance: Optional[float] = None,
+		reason: str = "ORDER", time_ms: Optional[int] = None) -> Dict[str, Any]:
+	"""ACCOUNT_UPDATE with one position (and optionally the USDT balance) in the Binance futures format"""
+	time_ms = time_ms if time_ms is not None else int(time.time() * 1000)
+	balances = [] if wallet_balance is None else [{"a": "USDT", "wb": str(wallet_balance), "cw": str(wallet_balance)}]
+	return {
+		"e": "ACCOUNT_UPDATE",
+		"E": time_ms,
+		"T": time_ms,
+		"a": {
+			"m": reason,
+			"B": balances,
+			"P": [{"s": symbol, "pa": str(position_amount), "ep": str(entry_price), "ps": "BOTH"}],
+		},
+	}